@@ -0,0 +1,159 @@
+"""
+VirusTotal analysis tracker.
+
+This module persists VirusTotal analyses that were submitted but had no verdict
+yet, together with the Discord messages that contained the URL, so that a
+background poller can finish them later (also across restarts) and enforce the
+verdict retroactively instead of blocking the moderation task while the
+analysis runs.
+"""
+import os
+import time
+import sqlite3
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisTracker:
+    """SQLite store of pending VirusTotal analyses and the messages waiting on them."""
+
+    def __init__(self, db_path: str = "data/url_analyses.db", poll_interval: float = 15,
+                 max_poll_interval: float = 600):
+        """
+        Initialize the tracker.
+
+        Args:
+            db_path: Path to the SQLite database file
+            poll_interval: Seconds until an analysis is polled for the first time
+            max_poll_interval: Upper bound of the exponential polling backoff
+        """
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.conn = sqlite3.connect(db_path)
+        self.create_tables()
+
+    def create_tables(self) -> None:
+        """Create the tables if they don't exist."""
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS analyses (
+            analysis_id TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            submitted_at REAL NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_poll_at REAL NOT NULL
+        )
+        ''')
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS watchers (
+            analysis_id TEXT NOT NULL,
+            guild_id INTEGER,
+            channel_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            author_id INTEGER,
+            PRIMARY KEY (analysis_id, message_id)
+        )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_analyses_next_poll ON analyses (next_poll_at)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_analyses_url ON analyses (url)')
+        self.conn.commit()
+
+    def track(self, analysis_id: str, url: str) -> None:
+        """
+        Start tracking a submitted analysis.
+
+        Args:
+            analysis_id: VirusTotal analysis ID
+            url: The URL that was submitted
+        """
+        now = time.time()
+        self.conn.execute(
+            'INSERT OR IGNORE INTO analyses (analysis_id, url, submitted_at, attempts, next_poll_at) '
+            'VALUES (?, ?, ?, 0, ?)',
+            (analysis_id, url, now, now + self.poll_interval)
+        )
+        self.conn.commit()
+        logger.info(f"Tracking VirusTotal analysis {analysis_id} for {url}")
+
+    def find(self, url: str) -> Optional[str]:
+        """
+        Return the ID of a tracked analysis of the URL, if any.
+
+        Lets later messages with the same URL wait on the running analysis
+        instead of submitting the URL again.
+        """
+        row = self.conn.execute('SELECT analysis_id FROM analyses WHERE url = ? LIMIT 1', (url,)).fetchone()
+        return row[0] if row else None
+
+    def watch(self, analysis_id: str, guild_id: int, channel_id: int, message_id: int, author_id: int) -> None:
+        """
+        Record a message that contains the URL of a tracked analysis.
+
+        Args:
+            analysis_id: VirusTotal analysis ID
+            guild_id: Guild of the message
+            channel_id: Channel of the message
+            message_id: The message
+            author_id: Author of the message
+        """
+        self.conn.execute(
+            'INSERT OR IGNORE INTO watchers (analysis_id, guild_id, channel_id, message_id, author_id) '
+            'SELECT ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM analyses WHERE analysis_id = ?)',
+            (analysis_id, guild_id, channel_id, message_id, author_id, analysis_id)
+        )
+        self.conn.commit()
+
+    def due(self, limit: int) -> List[Tuple[str, str, int, float]]:
+        """
+        Return analyses whose next poll time has passed, the most overdue first.
+
+        Returns:
+            (analysis_id, url, attempts, submitted_at) tuples
+        """
+        return self.conn.execute(
+            'SELECT analysis_id, url, attempts, submitted_at FROM analyses '
+            'WHERE next_poll_at <= ? ORDER BY next_poll_at LIMIT ?',
+            (time.time(), limit)
+        ).fetchall()
+
+    def reschedule(self, analysis_id: str, attempts: int) -> None:
+        """Schedule the next poll of an unfinished analysis with exponential backoff."""
+        delay = min(self.poll_interval * (2 ** attempts), self.max_poll_interval)
+        self.conn.execute(
+            'UPDATE analyses SET attempts = ?, next_poll_at = ? WHERE analysis_id = ?',
+            (attempts, time.time() + delay, analysis_id)
+        )
+        self.conn.commit()
+
+    def complete(self, analysis_id: str) -> List[Dict]:
+        """
+        Stop tracking an analysis.
+
+        Returns:
+            The messages that were waiting on it
+        """
+        watchers = [
+            {'guild_id': guild_id, 'channel_id': channel_id, 'message_id': message_id, 'author_id': author_id}
+            for guild_id, channel_id, message_id, author_id in self.conn.execute(
+                'SELECT guild_id, channel_id, message_id, author_id FROM watchers WHERE analysis_id = ?',
+                (analysis_id,)
+            )
+        ]
+        self.conn.execute('DELETE FROM watchers WHERE analysis_id = ?', (analysis_id,))
+        self.conn.execute('DELETE FROM analyses WHERE analysis_id = ?', (analysis_id,))
+        self.conn.commit()
+        return watchers
+
+    def count(self) -> int:
+        """Return the number of tracked analyses."""
+        return self.conn.execute('SELECT COUNT(*) FROM analyses').fetchone()[0]
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self.conn.close()
@@ -0,0 +1,259 @@
+"""
+Local benign pre-classifier.
+
+Most messages are short chat ("笑死", "ok", an emoji) that the moderation API
+never flags. This module scores a text locally, with no network call and no
+model to load, so that confidently benign texts can skip the API:
+
+1. The text must contain at least one known harmless phrase (a word such as
+   "ok" or one of a few emoji such as 👍), and consist of harmless phrases,
+   punctuation and whitespace only. Any other word, emoji or symbol, including
+   digits, misspellings, obfuscations such as "sh1t" or "k y s" and custom
+   emoji, scores 0; so do mentions or punctuation on their own. Latin phrases
+   only count as whole words, so "gg" does not match inside another word.
+2. If the normalised text contains any risk term (insults, sexual, violent or
+   self-harm words, in Chinese and English), the score is 0. Only risk terms
+   inside a known harmless phrase are ignored, such as the exaggerations
+   "笑死" and "累死".
+3. Otherwise the score falls with the number of letters, so short chat
+   scores close to 1. Texts with links score 0.
+
+Texts at or above the threshold are treated as benign. A small share of them
+is still sent to the API (shadow checks) to measure how often the API agrees.
+``python -m app.ai.service.benign_classifier`` replays a JSONL file of texts
+and API verdicts to report the skip rate and agreement rate per threshold.
+"""
+import re
+import sys
+import json
+import asyncio
+import argparse
+import unicodedata
+from typing import Dict, Iterable, List, Optional
+
+from app.ai.service.moderation_cache import normalize_text
+
+# Harmless phrases and emoji; only texts made of these and punctuation are skipped.
+# Risk terms inside them (the "死" in "笑死") are ignored.
+BENIGN_PHRASES = (
+    '笑死我了', '笑死我', '笑死', '累死了', '累死', '熱死了', '熱死', '餓死了', '餓死', '冷死了', '冷死',
+    '哈哈', '哈', '呵呵', '呵', '嘿嘿', '嘻嘻', '謝謝', '感謝', '辛苦了', '恭喜', '加油', '早安', '午安', '晚安',
+    '收到', '了解', '好喔', '好的', '好', '沒問題', '真的', '太強了', '好強', '厲害', '讚啦', '讚',
+    'lmao', 'lol', 'haha', 'xd', 'okay', 'ok', 'thanks', 'thank you', 'thx', 'ty', 'gg', 'nice',
+    'good night', '+1',
+    '👍', '👌', '👏', '🙏', '🎉', '😂', '🤣', '😆', '😄', '😃', '😀', '😁', '🙂', '😊', '😅', '🥲', '😭',
+    '🥰', '😍', '❤', '💯', '✅', '🆗'
+)
+
+# Words the moderation API may flag; any of them sends the text to the API
+RISK_TERMS = (
+    # Insults and harassment
+    '幹', '操', '靠北', '靠杯', '機掰', '雞掰', '三小', '北七', '白痴', '白癡', '智障', '低能', '腦殘',
+    '廢物', '垃圾', '賤', '婊', '畜生', '人渣', '滾', '閉嘴', '媽的', '你媽', '去你', '屁', '屎', '爛',
+    '蠢', '笨', '醜', '噁心', '支那', '黑鬼',
+    'fuck', 'fck', 'shit', 'bitch', 'cunt', 'dick', 'idiot', 'stupid', 'retard', 'moron', 'dumb',
+    'nigg', 'fag', 'whore', 'slut', 'loser', 'stfu', 'kys', 'wtf', 'ass',
+    # Violence and self-harm
+    '死', '殺', '砍', '揍', '打你', '炸', '槍', '血', '割腕', '跳樓', '自殘', '上吊', '毒',
+    'kill', 'die', 'dead', 'murder', 'shoot', 'bomb', 'gun', 'blood', 'suicide', 'cut myself', 'hang',
+    # Sexual content
+    '色', '性', '裸', '奶', '胸', '屌', '雞雞', '約炮', '做愛', '射', '淫', '騷', '肏',
+    'sex', 'porn', 'nude', 'naked', 'cock', 'pussy', 'boob', 'tits', 'horny', 'nsfw', 'cum',
+    # Drugs and scams
+    '大麻', '海洛因', '冰毒', '搖頭丸', 'drug', 'weed', 'cocaine', 'nitro', 'free', '免費'
+)
+
+# Discord custom emoji (server-uploaded images, always left to the API) and mentions
+CUSTOM_EMOJI_PATTERN = re.compile(r'<a?:(\w+):\d+>')
+MENTION_PATTERN = re.compile(r'<[@#][!&]?\d+>')
+
+# Characters that only modify the emoji before them: variation selectors and skin tones
+EMOJI_MODIFIERS = frozenset('\ufe0e\ufe0f\U0001f3fb\U0001f3fc\U0001f3fd\U0001f3fe\U0001f3ff')
+
+
+class BenignClassifier:
+    """Local scorer deciding which texts are benign enough to skip the moderation API."""
+
+    def __init__(self, threshold: float = 0.8, max_length: int = 40, extra_risk_terms: Iterable[str] = ()):
+        """
+        Initialize the classifier.
+
+        Args:
+            threshold: Minimum score (0-1) for a text to be treated as benign
+            max_length: Letters after which a text without risk terms scores 0
+            extra_risk_terms: Additional words that always send a text to the API
+        """
+        self.threshold = threshold
+        self.max_length = max(1, max_length)
+        phrases = {normalize_text(phrase) for phrase in BENIGN_PHRASES}
+        self.benign_pattern = re.compile('|'.join(
+            self._phrase_pattern(phrase) for phrase in sorted(phrases, key=len, reverse=True)
+        ))
+        risk_terms = {normalize_text(term) for term in (*RISK_TERMS, *extra_risk_terms) if term.strip()}
+        # A lookahead finds every position a risk term starts at, so a term
+        # overlapping a harmless phrase does not hide another one
+        self.risk_pattern = re.compile('(?=(' + '|'.join(
+            re.escape(term) for term in sorted(risk_terms, key=len, reverse=True)
+        ) + '))')
+
+        # Accounting
+        self.checked = 0
+        self.skipped = 0
+        self.shadow_checks = 0
+        self.shadow_agreements = 0
+
+    def score(self, text: str) -> float:
+        """
+        Score how confidently a text is benign.
+
+        Args:
+            text: Message text
+
+        Returns:
+            0 (send to the API) to 1 (certainly benign)
+        """
+        # Links and custom emoji are always left to the API
+        if '://' in text or CUSTOM_EMOJI_PATTERN.search(text):
+            return 0.0
+
+        text = normalize_text(MENTION_PATTERN.sub(' ', text))
+        remainder, phrases = self.benign_pattern.subn(' ', text)
+        # Mentions and punctuation on their own say nothing harmless
+        if not phrases or not all(self._is_filler(char) for char in remainder):
+            return 0.0
+
+        # Risk terms are searched in the whole text, so a harmless phrase can
+        # only excuse the risk terms inside it
+        if self._has_risk_term(text):
+            return 0.0
+
+        letters = sum(1 for char in text if self._is_word_char(char))
+        return max(0.0, 1.0 - letters / self.max_length)
+
+    def _has_risk_term(self, text: str) -> bool:
+        """Return whether a normalised text contains a risk term outside the harmless phrases."""
+        harmless = [match.span() for match in self.benign_pattern.finditer(text)]
+        for match in self.risk_pattern.finditer(text):
+            start, end = match.span(1)
+            if not any(first <= start and end <= last for first, last in harmless):
+                return True
+        return False
+
+    @staticmethod
+    def _phrase_pattern(phrase: str) -> str:
+        """Match Latin phrases as whole words only; Chinese has no word separators."""
+        if phrase.isascii():
+            return rf'(?<![a-z0-9]){re.escape(phrase)}(?![a-z0-9])'
+        return re.escape(phrase)
+
+    @staticmethod
+    def _is_word_char(char: str) -> bool:
+        """Return whether a character is part of a word (a letter, mark or digit)."""
+        return unicodedata.category(char)[0] in 'LMN' and char not in EMOJI_MODIFIERS
+
+    @staticmethod
+    def _is_filler(char: str) -> bool:
+        """Return whether a character may surround harmless phrases: punctuation, whitespace or an emoji modifier."""
+        return unicodedata.category(char)[0] in 'PZ' or char.isspace() or char in EMOJI_MODIFIERS
+
+    def is_benign(self, text: str) -> bool:
+        """Return whether a text can skip the moderation API, and count the decision."""
+        self.checked += 1
+        benign = self.score(text) >= self.threshold
+        if benign:
+            self.skipped += 1
+        return benign
+
+    def record_shadow_check(self, api_flagged: bool) -> None:
+        """Record the API verdict of a text the classifier considered benign."""
+        self.shadow_checks += 1
+        if not api_flagged:
+            self.shadow_agreements += 1
+
+    def stats(self) -> Dict:
+        """Return the skip rate and the agreement rate measured by shadow checks."""
+        return {
+            'checked': self.checked,
+            'skipped': self.skipped,
+            'skip_rate': round(self.skipped / self.checked, 4) if self.checked else 0.0,
+            'shadow_checks': self.shadow_checks,
+            'agreement_rate': round(self.shadow_agreements / self.shadow_checks, 4) if self.shadow_checks else None
+        }
+
+
+def replay(records: List[Dict], thresholds: Iterable[float], max_length: int,
+           extra_risk_terms: Iterable[str] = ()) -> List[Dict]:
+    """
+    Evaluate thresholds against recorded API verdicts.
+
+    Args:
+        records: Dicts with ``text`` and the API's ``flagged`` verdict
+        thresholds: Thresholds to evaluate
+        max_length: Classifier ``max_length``
+        extra_risk_terms: Classifier ``extra_risk_terms``
+
+    Returns:
+        One dict per threshold with the skip rate, the agreement rate (skipped
+        texts the API did not flag) and the number of flagged texts skipped
+    """
+    classifier = BenignClassifier(max_length=max_length, extra_risk_terms=extra_risk_terms)
+    scores = [(classifier.score(record['text']), bool(record['flagged'])) for record in records]
+
+    report = []
+    for threshold in thresholds:
+        skipped = [flagged for score, flagged in scores if score >= threshold]
+        missed = sum(skipped)
+        report.append({
+            'threshold': threshold,
+            'messages': len(scores),
+            'skipped': len(skipped),
+            'skip_rate': round(len(skipped) / len(scores), 4) if scores else 0.0,
+            'agreement_rate': round(1 - missed / len(skipped), 4) if skipped else None,
+            'missed_flagged': missed
+        })
+    return report
+
+
+async def _label_with_api(records: List[Dict]) -> None:
+    """Fill in missing ``flagged`` verdicts with the moderation API."""
+    from app.ai.service.moderation import ContentModerator
+
+    moderator = ContentModerator()
+    for record in records:
+        if 'flagged' not in record:
+            record['flagged'], _ = await moderator.moderate_text(record['text'])
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command line entry point."""
+    from app.config import (
+        CONTENT_MODERATION_PRECLASSIFIER_THRESHOLD,
+        CONTENT_MODERATION_PRECLASSIFIER_MAX_LENGTH,
+        CONTENT_MODERATION_PRECLASSIFIER_EXTRA_TERMS
+    )
+
+    parser = argparse.ArgumentParser(description="Replay messages through the benign pre-classifier")
+    parser.add_argument('replay', help='JSONL file with one {"text": ..., "flagged": ...} object per line')
+    parser.add_argument('--thresholds', default=str(CONTENT_MODERATION_PRECLASSIFIER_THRESHOLD),
+                        help="Comma-separated thresholds to evaluate (default: the configured one)")
+    parser.add_argument('--max-length', type=int, default=CONTENT_MODERATION_PRECLASSIFIER_MAX_LENGTH,
+                        help="Classifier max_length (default: the configured one)")
+    parser.add_argument('--label', action='store_true',
+                        help="Ask the moderation API for records without a flagged verdict")
+    args = parser.parse_args(argv)
+
+    with open(args.replay, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if args.label:
+        asyncio.run(_label_with_api(records))
+    unlabeled = sum(1 for record in records if 'flagged' not in record)
+    if unlabeled:
+        sys.exit(f"{unlabeled} records have no flagged verdict; add them or run with --label")
+
+    thresholds = [float(value) for value in args.thresholds.split(',')]
+    for row in replay(records, thresholds, args.max_length, CONTENT_MODERATION_PRECLASSIFIER_EXTRA_TERMS):
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
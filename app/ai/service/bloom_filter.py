@@ -0,0 +1,100 @@
+"""
+Bloom filter.
+
+This module provides a compact probabilistic set used in front of the URL
+blacklist storage. A negative answer is always correct, so most lookups for
+URLs that are not blacklisted never touch the storage backend; a positive
+answer only means the storage has to be consulted.
+"""
+import math
+import logging
+from hashlib import blake2b
+from typing import Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    Bit-array Bloom filter with double hashing.
+
+    The bit array size and the number of hash functions are derived from the
+    expected capacity and target false-positive rate. An optional memory budget
+    caps the bit array; the resulting (higher) false-positive rate is logged.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001, max_bytes: Optional[int] = None):
+        """
+        Initialize the Bloom filter.
+
+        Args:
+            capacity: Expected number of items
+            error_rate: Target false-positive rate at full capacity
+            max_bytes: Optional upper bound for the bit array size in bytes
+        """
+        if capacity <= 0:
+            raise ValueError("Bloom filter capacity must be positive")
+        if not 0 < error_rate < 1:
+            raise ValueError("Bloom filter error rate must be between 0 and 1")
+
+        self.capacity = capacity
+        num_bits = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        if max_bytes and num_bits > max_bytes * 8:
+            num_bits = max_bytes * 8
+            logger.warning(
+                f"Bloom filter capped at {max_bytes} bytes; expected false-positive rate at "
+                f"{capacity} items rises to {self._estimate_error_rate(num_bits, capacity):.4%}"
+            )
+
+        self.num_bits = max(num_bits, 8)
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._hash_range = range(self.num_hashes)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    @staticmethod
+    def _estimate_error_rate(num_bits: int, items: int) -> float:
+        """Estimate the false-positive rate for a bit array size and item count."""
+        num_hashes = max(1, round(num_bits / max(items, 1) * math.log(2)))
+        return (1 - math.exp(-num_hashes * items / num_bits)) ** num_hashes
+
+    def _positions(self, item: str) -> List[int]:
+        """Return the bit positions for an item."""
+        digest = blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in self._hash_range]
+
+    def add(self, item: str) -> None:
+        """Add an item to the filter."""
+        bits = self.bits
+        for position in self._positions(item):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def update(self, items: Iterable[str]) -> None:
+        """Add many items to the filter."""
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @property
+    def size_bytes(self) -> int:
+        """Size of the bit array in bytes."""
+        return len(self.bits)
+
+    @property
+    def error_rate(self) -> float:
+        """Expected false-positive rate for the current number of items."""
+        return self._estimate_error_rate(self.num_bits, self.count)
+
+    def is_saturated(self) -> bool:
+        """Return True once more items were added than the filter was sized for."""
+        return self.count > self.capacity
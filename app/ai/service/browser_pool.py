@@ -0,0 +1,246 @@
+"""
+Headless browser pool.
+
+This module runs Selenium off the event loop. A fixed number of worker threads
+each own a reusable headless Chrome session and take navigation jobs from a
+bounded queue; callers await the result with a timeout, so a slow page never
+blocks the bot and at most ``workers`` pages are loaded at the same time.
+"""
+import time
+import queue
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Check if Selenium is available
+try:
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import TimeoutException
+    SELENIUM_AVAILABLE = True
+except ImportError:
+    SELENIUM_AVAILABLE = False
+    logger.warning("Selenium not available. Headless browser URL unshortening will be disabled.")
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+
+class BrowserPoolFull(Exception):
+    """Raised when the job queue is full."""
+
+
+class BrowserPool:
+    """
+    Worker threads with reusable headless browser sessions behind a job queue.
+
+    Workers and their browsers are started on the first job. A browser that
+    raised an error is discarded and replaced on the worker's next job. If no
+    browser can be started at all, ``available`` turns False.
+    """
+
+    def __init__(self, workers: int = 2, queue_size: int = 20, page_timeout: float = 5.0,
+                 job_timeout: float = 20.0, settle_time: float = 1.0):
+        """
+        Initialize the pool.
+
+        Args:
+            workers: Number of worker threads, i.e. concurrent browser sessions
+            queue_size: Maximum jobs waiting for a worker
+            page_timeout: Seconds a page may take to load
+            job_timeout: Seconds a caller waits for a job, including time in the queue
+            settle_time: Seconds to wait after loading for JavaScript redirects
+        """
+        self.workers = max(1, workers)
+        self.page_timeout = page_timeout
+        self.job_timeout = job_timeout
+        self.settle_time = settle_time
+        self.available = SELENIUM_AVAILABLE
+        self._jobs: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        self._threads: List[threading.Thread] = []
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+        # Accounting
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.rejected = 0
+
+    def _start(self) -> None:
+        """Start the worker threads on first use."""
+        with self._start_lock:
+            if self._threads or self._closed:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"browser-pool-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Started headless browser pool with {self.workers} workers")
+
+    def _create_driver(self):
+        """Create a headless Chrome session."""
+        chrome_options = Options()
+        chrome_options.add_argument("--headless")
+        chrome_options.add_argument("--disable-gpu")
+        chrome_options.add_argument("--window-size=1920,1080")
+        chrome_options.add_argument("--disable-extensions")
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        chrome_options.add_argument("--disable-notifications")
+        chrome_options.add_argument("--disable-popup-blocking")
+        chrome_options.add_argument("--log-level=3")
+        chrome_options.add_argument(f"--user-agent={USER_AGENT}")
+
+        driver = webdriver.Chrome(options=chrome_options)
+        driver.set_page_load_timeout(self.page_timeout)
+        return driver
+
+    @staticmethod
+    def _quit(driver) -> None:
+        """Quit a browser session, ignoring errors."""
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def _navigate(self, driver, url: str) -> List[str]:
+        """Load a URL and return the URLs it went through (runs on a worker thread)."""
+        redirect_history = [url]
+        try:
+            driver.get(url)
+
+            # Wait for the page to load
+            WebDriverWait(driver, self.page_timeout).until(
+                EC.presence_of_element_located((By.TAG_NAME, "body"))
+            )
+        except TimeoutException:
+            raise TimeoutError("Page load timeout")
+
+        # Get current URL after potential redirects
+        current_url = driver.current_url
+        if current_url != url:
+            redirect_history.append(current_url)
+
+        # Wait a bit more for any JavaScript redirects
+        time.sleep(self.settle_time)
+
+        # Check if URL changed again due to JS redirects
+        final_url = driver.current_url
+        if final_url != current_url and final_url not in redirect_history:
+            redirect_history.append(final_url)
+        return redirect_history
+
+    def _worker(self) -> None:
+        """Run jobs with this thread's browser until a stop sentinel arrives."""
+        driver = None
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            url, future = job
+
+            # Skip jobs whose caller already gave up
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                if driver is None:
+                    try:
+                        driver = self._create_driver()
+                    except Exception as e:
+                        logger.error(f"Failed to initialize Selenium WebDriver: {str(e)}")
+                        self.available = False
+                        raise
+                future.set_result(self._navigate(driver, url))
+            except TimeoutError as e:
+                # Stop the slow page so the session is ready for the next job
+                try:
+                    driver.execute_script("window.stop();")
+                except Exception:
+                    self._quit(driver)
+                    driver = None
+                future.set_exception(e)
+            except Exception as e:
+                # The session may be broken; start a fresh one for the next job
+                if driver is not None:
+                    self._quit(driver)
+                    driver = None
+                future.set_exception(e)
+
+        if driver is not None:
+            self._quit(driver)
+
+    async def navigate(self, url: str) -> List[str]:
+        """
+        Load a URL in a pooled browser.
+
+        Args:
+            url: The URL to load
+
+        Returns:
+            The URLs the page went through, starting with ``url``
+
+        Raises:
+            BrowserPoolFull: The job queue is full
+            TimeoutError: The page or the job took too long
+            Exception: Browser errors
+        """
+        if self._closed:
+            raise RuntimeError("Browser pool is closed")
+        self._start()
+
+        future = concurrent.futures.Future()
+        try:
+            self._jobs.put_nowait((url, future))
+        except queue.Full:
+            self.rejected += 1
+            raise BrowserPoolFull("Headless browser queue is full")
+
+        try:
+            # On timeout wait_for cancels the job; a worker skips it if it has not started yet
+            redirect_history = await asyncio.wait_for(asyncio.wrap_future(future), self.job_timeout)
+        except (TimeoutError, asyncio.TimeoutError):
+            self.timed_out += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        self.completed += 1
+        return redirect_history
+
+    def stats(self) -> dict:
+        """Return queue length and job counters."""
+        return {
+            'workers': self.workers,
+            'queued': self._jobs.qsize(),
+            'completed': self.completed,
+            'failed': self.failed,
+            'timed_out': self.timed_out,
+            'rejected': self.rejected
+        }
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        """Stop the workers and quit their browsers."""
+        self._closed = True
+        # Cancel queued jobs so callers are released
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                job[1].cancel()
+        for _ in self._threads:
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        if self._threads:
+            logger.info(f"Headless browser pool closed: {self.stats()}")
+        self._threads = []
@@ -0,0 +1,115 @@
+"""
+Domain suffix index.
+
+This module provides a hashed suffix set over blacklisted domains, so that any
+host can be resolved to its most specific blacklisted ancestor domain
+(``login.evil.com`` -> ``evil.com``) with at most one set lookup per label.
+"""
+from typing import Iterable, Optional
+from urllib.parse import urlparse
+
+
+def extract_host(url: str) -> str:
+    """
+    Extract the normalised host of a URL.
+
+    The host is lower-cased, and the port, user info and trailing dot are removed,
+    so ``https://user@WWW.Evil.com.:443/x`` becomes ``www.evil.com``.
+
+    Args:
+        url: The URL to parse
+
+    Returns:
+        The host, or an empty string if the URL has none
+    """
+    try:
+        host = urlparse(url).hostname or ''
+    except ValueError:
+        return ''
+    return host.rstrip('.')
+
+
+class DomainSuffixIndex:
+    """
+    Set of domains supporting longest-suffix (most specific ancestor) lookups.
+
+    Besides the domains themselves, the index keeps the set of their parent
+    suffixes (``evil.com`` contributes ``com``). Lookups walk a host from the
+    top-level label down and stop at the first suffix that is neither indexed
+    nor a parent of an indexed domain, so unrelated hosts are rejected after
+    one or two set lookups regardless of the index size.
+
+    Lookups take no lock. Every change is a single set operation, and parent
+    suffixes are added before the domain itself, so a lookup running on
+    another thread never sees a domain without its parents.
+    """
+
+    def __init__(self, domains: Iterable[str] = ()):
+        """
+        Initialize the index.
+
+        Args:
+            domains: Initial domains to index
+        """
+        self.domains = set()
+        self.parents = set()
+        for domain in domains:
+            self.add(domain)
+
+    @staticmethod
+    def normalize(domain: str) -> str:
+        """Normalise a domain key the same way hosts are normalised."""
+        return domain.strip().lower().rstrip('.')
+
+    def add(self, domain: str) -> None:
+        """Add a domain to the index."""
+        domain = self.normalize(domain)
+        if not domain:
+            return
+
+        index = domain.find('.')
+        while index != -1:
+            self.parents.add(domain[index + 1:])
+            index = domain.find('.', index + 1)
+        self.domains.add(domain)
+
+    def discard(self, domain: str) -> None:
+        """
+        Remove a domain from the index if present.
+
+        Parent suffixes are kept; a stale parent only costs an extra set lookup.
+        """
+        self.domains.discard(self.normalize(domain))
+
+    def find(self, host: str) -> Optional[str]:
+        """
+        Find the most specific indexed domain that is the host or one of its parents.
+
+        Args:
+            host: A normalised host (see ``extract_host``)
+
+        Returns:
+            The matching indexed domain, or None
+        """
+        domains = self.domains
+        if not domains or not host:
+            return None
+
+        parents = self.parents
+        match = None
+        suffix = None
+
+        # Walk suffixes from least to most specific: c -> b.c -> a.b.c
+        for label in reversed(host.split('.')):
+            suffix = label if suffix is None else f"{label}.{suffix}"
+            if suffix in domains:
+                match = suffix
+            if suffix not in parents:
+                break
+        return match
+
+    def __contains__(self, domain: str) -> bool:
+        return self.normalize(domain) in self.domains
+
+    def __len__(self) -> int:
+        return len(self.domains)
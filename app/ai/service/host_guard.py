@@ -0,0 +1,155 @@
+"""
+Per-host request guard.
+
+This module bounds how many requests go to one host at the same time and
+stops sending requests to hosts that keep timing out. A host's circuit opens
+after ``failure_threshold`` consecutive timeouts or connection failures; while
+open, requests to it fail immediately. After ``reset_timeout`` seconds one
+probe request is let through (half-open): success closes the circuit, another
+failure opens it again.
+"""
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class HostUnavailable(Exception):
+    """Raised when a host's circuit is open."""
+
+
+class _HostState:
+    """Circuit and concurrency state of one host."""
+
+    __slots__ = ('state', 'failures', 'opened_at', 'probe_at', 'semaphore', 'users')
+
+    def __init__(self, limit: int):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_at = 0.0
+        self.semaphore = asyncio.Semaphore(limit)
+        self.users = 0
+
+
+class HostGuard:
+    """Per-host concurrency limits and circuit breakers."""
+
+    def __init__(self, per_host_limit: int = 4, failure_threshold: int = 3, reset_timeout: float = 60):
+        """
+        Initialize the guard.
+
+        Args:
+            per_host_limit: Maximum concurrent requests to one host
+            failure_threshold: Consecutive failures that open a host's circuit
+            reset_timeout: Seconds before an open circuit lets a probe through
+        """
+        self.per_host_limit = max(1, per_host_limit)
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._hosts: Dict[str, _HostState] = {}
+
+        # Accounting
+        self.rejected = 0
+        self.opened = 0
+
+    def _state(self, host: str) -> _HostState:
+        """Return the state of a host, creating it on first use."""
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(self.per_host_limit)
+        return state
+
+    def allow(self, host: str) -> bool:
+        """
+        Check whether a request to the host may be sent now.
+
+        Moves an open circuit to half-open once ``reset_timeout`` has passed and
+        lets one probe through; further requests wait for the probe's outcome
+        (a probe that never reports back is replaced after ``reset_timeout``).
+        """
+        state = self._hosts.get(host)
+        if state is None or state.state == CLOSED:
+            return True
+
+        now = time.monotonic()
+        if state.state == OPEN:
+            if now - state.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            state.state = HALF_OPEN
+            state.probe_at = now
+            logger.info(f"Circuit for host {host} half-open, sending a probe request")
+            return True
+
+        # Half-open: only one probe at a time
+        if now - state.probe_at < self.reset_timeout:
+            self.rejected += 1
+            return False
+        state.probe_at = now
+        return True
+
+    def record_success(self, host: str) -> None:
+        """Record a response from the host and close its circuit."""
+        state = self._hosts.get(host)
+        if state is None:
+            return
+        if state.state != CLOSED:
+            logger.info(f"Circuit for host {host} closed")
+        state.state = CLOSED
+        state.failures = 0
+
+    def record_failure(self, host: str) -> None:
+        """Record a timeout or connection failure and open the circuit when needed."""
+        state = self._state(host)
+        state.failures += 1
+        if state.state == HALF_OPEN or (state.state == CLOSED and state.failures >= self.failure_threshold):
+            state.state = OPEN
+            state.opened_at = time.monotonic()
+            self.opened += 1
+            logger.warning(
+                f"Circuit for host {host} opened after {state.failures} failures, "
+                f"skipping it for {self.reset_timeout:.0f}s"
+            )
+
+    @asynccontextmanager
+    async def request(self, host: str):
+        """
+        Guard one request to a host.
+
+        Raises ``HostUnavailable`` if the host's circuit is open, waits for a
+        free slot of the host's concurrency limit, and records timeouts and
+        connection failures raised inside the block.
+        """
+        if not self.allow(host):
+            raise HostUnavailable(host)
+
+        state = self._state(host)
+        state.users += 1
+        try:
+            async with state.semaphore:
+                try:
+                    yield
+                except (asyncio.TimeoutError, ConnectionError, OSError):
+                    self.record_failure(host)
+                    raise
+        finally:
+            state.users -= 1
+            # Forget idle hosts whose circuit is closed, so the table stays small
+            if state.users == 0 and state.state == CLOSED and state.failures == 0:
+                self._hosts.pop(host, None)
+
+    def stats(self) -> Dict:
+        """Return open circuits and counters."""
+        return {
+            'open_circuits': sum(1 for state in self._hosts.values() if state.state != CLOSED),
+            'opened': self.opened,
+            'rejected': self.rejected
+        }
@@ -0,0 +1,436 @@
+"""
+Image moderation cache.
+
+This module remembers moderation verdicts of images by a perceptual hash, so a
+meme or scam screenshot reposted across channels is decided without another
+moderation API call, and keeps a blocklist of hashes of known-bad images that
+are rejected at once, like the URL blacklist.
+
+Hashes are 64-bit difference hashes (dHash) of a 9x8 grayscale thumbnail.
+Re-encoded, resized or slightly edited copies of an image differ in only a few
+bits, so any stored hash within ``max_distance`` bits counts as the same image.
+Flat images and plain gradients hash to (nearly) all zeros or all ones whatever
+they show, so such low-entropy hashes only match exactly.
+Hashing decodes the image, so it runs in a thread pool off the event loop.
+Without Pillow, images are keyed by their SHA-256 and only identical files
+match.
+"""
+import io
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.ai.service.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Check if Pillow is available
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+    logger.warning("Pillow not available. The image moderation cache will only match identical images.")
+
+HASH_BITS = 64
+
+# Key prefixes: perceptual hashes match near-duplicates, exact hashes only themselves
+PERCEPTUAL_PREFIX = 'd'
+EXACT_PREFIX = 's'
+
+# Perceptual hashes with fewer set (or unset) bits than this only match exactly
+MIN_HASH_BITS = 8
+
+
+def dhash(data: bytes, size: int = 8) -> str:
+    """
+    Compute the difference hash of an image.
+
+    Args:
+        data: Encoded image (PNG, JPEG, GIF, WebP...)
+        size: Hash width; the hash has ``size * size`` bits
+
+    Returns:
+        ``'d'`` followed by the hash in hex
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        # Let the JPEG decoder downscale while decoding instead of decoding full size
+        image.draft('L', (size * 8, size * 8))
+        thumbnail = image.convert('L').resize((size + 1, size), Image.Resampling.BILINEAR)
+        pixels = list(thumbnail.getdata())
+
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{PERCEPTUAL_PREFIX}{value:0{size * size // 4}x}"
+
+
+def is_low_entropy(key: str) -> bool:
+    """Return whether a perceptual hash has too few set or unset bits to match near-duplicates."""
+    if not key.startswith(PERCEPTUAL_PREFIX):
+        return False
+    ones = bin(int(key[1:], 16)).count('1')
+    return min(ones, HASH_BITS - ones) < MIN_HASH_BITS
+
+
+def image_key(data: bytes) -> str:
+    """Return the cache key of an image: its dHash, or its SHA-256 if it cannot be decoded."""
+    if PIL_AVAILABLE:
+        try:
+            return dhash(data)
+        except Exception:
+            # Not an image Pillow can decode; fall back to an exact match
+            pass
+    return EXACT_PREFIX + hashlib.sha256(data).hexdigest()
+
+
+class HashIndex:
+    """
+    Set of image keys that finds the stored keys within a Hamming distance.
+
+    Perceptual hashes are split into ``max_distance + 1`` bands. Two hashes that
+    differ in at most ``max_distance`` bits agree on at least one band, so only
+    the hashes sharing a band with the query are compared. Low-entropy hashes
+    (see ``is_low_entropy``) are not banded and only match themselves.
+    """
+
+    def __init__(self, max_distance: int = 4):
+        """
+        Initialize the index.
+
+        Args:
+            max_distance: Maximum differing bits for two perceptual hashes to match
+        """
+        self.max_distance = max(0, min(max_distance, HASH_BITS - 1))
+        bands = self.max_distance + 1
+        width = -(-HASH_BITS // bands)
+        self._bands = [(shift, (1 << width) - 1) for shift in range(0, HASH_BITS, width)]
+        self._buckets: List[Dict[int, set]] = [{} for _ in self._bands]
+        self._keys = set()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _band_values(self, value: int):
+        for band, (shift, mask) in enumerate(self._bands):
+            yield band, (value >> shift) & mask
+
+    def add(self, key: str) -> None:
+        """Add a key."""
+        if key in self._keys:
+            return
+        self._keys.add(key)
+        if key.startswith(PERCEPTUAL_PREFIX) and not is_low_entropy(key):
+            for band, band_value in self._band_values(int(key[1:], 16)):
+                self._buckets[band].setdefault(band_value, set()).add(key)
+
+    def discard(self, key: str) -> None:
+        """Remove a key if present."""
+        if key not in self._keys:
+            return
+        self._keys.discard(key)
+        if key.startswith(PERCEPTUAL_PREFIX) and not is_low_entropy(key):
+            for band, band_value in self._band_values(int(key[1:], 16)):
+                bucket = self._buckets[band].get(band_value)
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._buckets[band][band_value]
+
+    def find(self, key: str) -> List[str]:
+        """
+        Return the stored keys matching a key, the closest first.
+
+        Exact keys and low-entropy hashes only match themselves; other
+        perceptual hashes match every stored hash within ``max_distance`` bits.
+        """
+        if not key.startswith(PERCEPTUAL_PREFIX) or is_low_entropy(key):
+            return [key] if key in self._keys else []
+
+        value = int(key[1:], 16)
+        candidates = set()
+        for band, band_value in self._band_values(value):
+            candidates.update(self._buckets[band].get(band_value, ()))
+
+        matches = []
+        for candidate in candidates:
+            distance = bin(value ^ int(candidate[1:], 16)).count('1')
+            if distance <= self.max_distance:
+                matches.append((distance, candidate))
+        return [candidate for _, candidate in sorted(matches)]
+
+    def keys(self) -> List[str]:
+        """Return every stored key."""
+        return list(self._keys)
+
+
+class ImageVerdictCache:
+    """
+    Perceptual-hash cache of image moderation verdicts with a persistent blocklist.
+
+    Verdicts live in memory with a TTL and a size cap. Blocked hashes are kept
+    in SQLite and loaded on start-up, and expire after ``block_ttl``. The
+    moderation API's verdict alone never blocks an image: with ``auto_block``,
+    an image is blocked once ``block_after`` messages with it were confirmed
+    as violations (see ``record_violation``).
+    """
+
+    def __init__(self, db_path: str = "data/image_blocklist.db", max_entries: int = 10000,
+                 ttl: float = 86400, max_distance: int = 4, workers: int = 2, auto_block: bool = True,
+                 block_after: int = 2, block_ttl: Optional[float] = 30 * 86400):
+        """
+        Initialize the cache and load the blocklist.
+
+        Args:
+            db_path: Path to the SQLite database of blocked hashes
+            max_entries: Maximum number of cached verdicts
+            ttl: Seconds a verdict is reused
+            max_distance: Maximum differing hash bits for two images to count as the same
+            workers: Threads hashing images
+            auto_block: Block images that keep being posted in confirmed violations
+            block_after: Confirmed violations with an image before it is blocked
+            block_ttl: Seconds a blocked hash stays blocked (None = forever)
+        """
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.db_path = db_path
+        self.auto_block = auto_block
+        self.block_after = max(1, block_after)
+        self.block_ttl = block_ttl or None
+        self.verdicts = TTLCache(max_entries, ttl)
+        # Confirmed violations per image, until it is blocked
+        self.violations = TTLCache(max_entries, ttl)
+        self._verdict_index = HashIndex(max_distance)
+        self.blocked: Dict[str, Dict] = {}
+        self._blocked_index = HashIndex(max_distance)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='image-hash')
+        self.conn = sqlite3.connect(db_path)
+        self.create_tables()
+        self._load()
+
+        # Accounting
+        self.hits = 0
+        self.near_duplicate_hits = 0
+        self.blocked_hits = 0
+        self.misses = 0
+
+    def create_tables(self) -> None:
+        """Create the table if it doesn't exist."""
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS image_blocklist (
+            image_hash TEXT PRIMARY KEY,
+            categories TEXT NOT NULL,
+            reason TEXT,
+            added_at REAL NOT NULL,
+            expires_at REAL
+        )
+        ''')
+        # Databases created before expiry support lack the column
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(image_blocklist)')}
+        if 'expires_at' not in columns:
+            self.conn.execute('ALTER TABLE image_blocklist ADD COLUMN expires_at REAL')
+            if self.block_ttl:
+                # Hashes blocked on the moderation API's verdict alone expire like new ones
+                self.conn.execute(
+                    "UPDATE image_blocklist SET expires_at = added_at + ? WHERE reason = 'moderation'",
+                    (self.block_ttl,)
+                )
+        self.conn.commit()
+
+    def _load(self) -> None:
+        """Delete the expired blocked hashes and load the others."""
+        try:
+            self.conn.execute('DELETE FROM image_blocklist WHERE expires_at <= ?', (time.time(),))
+            self.conn.commit()
+            rows = self.conn.execute(
+                'SELECT image_hash, categories, reason, added_at, expires_at FROM image_blocklist'
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error loading image blocklist: {str(e)}")
+            return
+
+        for image_hash, categories, reason, added_at, expires_at in rows:
+            self.blocked[image_hash] = {
+                'categories': json.loads(categories), 'reason': reason,
+                'added_at': added_at, 'expires_at': expires_at
+            }
+            self._blocked_index.add(image_hash)
+        logger.info(f"Loaded {len(rows)} blocked image hashes from {self.db_path}")
+
+    async def hash_image(self, data: bytes) -> str:
+        """Compute the key of an image in the thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, image_key, data)
+
+    def lookup(self, key: str) -> Optional[Tuple[bool, Dict]]:
+        """
+        Return the verdict of an image or of a near-duplicate of it.
+
+        Args:
+            key: Image key from ``hash_image``
+
+        Returns:
+            A (flagged, details) tuple like ``ContentModerator.moderate_image``
+            returns, or None if the image has to be moderated. Blocked images
+            are flagged with ``blocked: True`` and their recorded categories.
+        """
+        for match in self._blocked_index.find(key):
+            entry = self.blocked[match]
+            if entry['expires_at'] is not None and entry['expires_at'] <= time.time():
+                self.unblock(match)
+                continue
+            self.blocked_hits += 1
+            return True, {
+                "categories": {category: True for category in entry['categories']},
+                "category_scores": {},
+                "flagged": True,
+                "blocked": True,
+                "reason": entry['reason']
+            }
+
+        for match in self._verdict_index.find(key):
+            outcome = self.verdicts.get(match)
+            if outcome is None:
+                # Expired or evicted
+                self._verdict_index.discard(match)
+                continue
+            self.hits += 1
+            if match != key:
+                self.near_duplicate_hits += 1
+            flagged, details = outcome
+            return flagged, {**details, "from_cache": True}
+
+        self.misses += 1
+        return None
+
+    def store(self, key: str, outcome: Tuple[bool, Dict], attributable: bool = True) -> bool:
+        """
+        Cache the moderation verdict of an image.
+
+        Args:
+            key: Image key from ``hash_image``
+            outcome: (flagged, details) from the moderation API
+            attributable: Whether the verdict belongs to this image alone. A
+                flagged verdict shared by several images of one request is not
+                cached, since it may have been caused by another image.
+
+        Returns:
+            True if the verdict was cached
+        """
+        flagged, details = outcome
+        if "error" in details or (flagged and not attributable):
+            return False
+
+        self.verdicts.set(key, outcome)
+        self._verdict_index.add(key)
+        # Drop index entries of verdicts the cache evicted once they pile up
+        if len(self._verdict_index) > 2 * self.verdicts.max_entries:
+            live = set(self.verdicts.keys())
+            for stale in self._verdict_index.keys():
+                if stale not in live:
+                    self._verdict_index.discard(stale)
+
+        return True
+
+    def record_violation(self, key: str, categories: Iterable[str] = ()) -> bool:
+        """
+        Record that a message with an image was confirmed as a violation.
+
+        Call this only once the violation is enforced, i.e. after a review did
+        not overturn it, and only for images whose verdict was attributable to
+        them alone. With ``auto_block``, the image is blocked on its
+        ``block_after``-th confirmed violation; near-duplicates of a cached
+        image count as the same image.
+
+        Args:
+            key: Image key from ``hash_image``
+            categories: Violation categories recorded for the image
+
+        Returns:
+            True if the image was blocked
+        """
+        if not self.auto_block or key in self.blocked:
+            return False
+
+        matches = self._verdict_index.find(key)
+        image = matches[0] if matches else key
+        count = (self.violations.get(image) or 0) + 1
+        if count < self.block_after:
+            self.violations.set(image, count)
+            return False
+
+        self.violations.delete(image)
+        self.block(key, categories, reason=f"{count} confirmed violations")
+        return True
+
+    def block(self, key: str, categories: Iterable[str] = (), reason: Optional[str] = None,
+              ttl: Optional[float] = None) -> None:
+        """
+        Add an image hash to the blocklist.
+
+        Args:
+            key: Image key from ``hash_image``
+            categories: Violation categories recorded for the image
+            reason: Why the image was blocked
+            ttl: Seconds until the hash is unblocked (default: ``block_ttl``)
+        """
+        categories = list(categories)
+        added_at = time.time()
+        ttl = ttl or self.block_ttl
+        expires_at = added_at + ttl if ttl else None
+        try:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO image_blocklist (image_hash, categories, reason, added_at, expires_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, json.dumps(categories), reason, added_at, expires_at)
+            )
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error saving blocked image hash {key}: {str(e)}")
+        self.blocked[key] = {'categories': categories, 'reason': reason, 'added_at': added_at, 'expires_at': expires_at}
+        self._blocked_index.add(key)
+        logger.info(f"Blocked image hash {key} ({', '.join(categories) or 'no categories'})")
+
+    def unblock(self, key: str) -> bool:
+        """Remove an image hash from the blocklist. Returns True if it was blocked."""
+        if key not in self.blocked:
+            return False
+        try:
+            self.conn.execute('DELETE FROM image_blocklist WHERE image_hash = ?', (key,))
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error removing blocked image hash {key}: {str(e)}")
+        del self.blocked[key]
+        self._blocked_index.discard(key)
+        # A cached flagged verdict would otherwise block the image again
+        self.verdicts.delete(key)
+        self._verdict_index.discard(key)
+        return True
+
+    def stats(self) -> Dict:
+        """Return cache size and hit counters."""
+        lookups = self.hits + self.blocked_hits + self.misses
+        return {
+            'size': len(self.verdicts),
+            'blocked': len(self.blocked),
+            'hits': self.hits,
+            'near_duplicate_hits': self.near_duplicate_hits,
+            'blocked_hits': self.blocked_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.blocked_hits) / lookups, 4) if lookups else 0.0
+        }
+
+    def close(self) -> None:
+        """Stop the hashing threads and close the database."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.conn.close()
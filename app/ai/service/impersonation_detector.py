@@ -0,0 +1,350 @@
+"""
+Impersonation domain detector.
+
+This module scores hosts that imitate protected brands (Discord, Steam, ...)
+without any network access. A host is scored on these signals:
+
+1. Known impersonation keywords (``URL_SAFETY_IMPERSONATION_DOMAINS``) anywhere in the host
+2. Homoglyphs: the host's registrable label looks like a brand once confusable
+   characters are folded (``dlscord``, ``disc0rd``, ``steamcomrnunity``, Cyrillic letters)
+3. Typosquats: the registrable label is within a small edit distance of a brand
+   (adjacent transpositions count as one edit)
+4. A brand name used inside another domain (``discord-nitro.ru``), weighted up when
+   a label or hyphen-separated token of the host is a lure word such as ``gift``
+   or ``login``
+
+Only the keyword signal is an explicit block list. The other signals are
+heuristics that also match legitimate look-alike domains, so callers use them to
+send a URL to VirusTotal ahead of the queue rather than to act on their own.
+Known legitimate look-alikes can be allowed outright.
+
+Keywords and brands are matched in one pass with an Aho-Corasick automaton, and
+typosquat candidates are looked up in a precomputed single-deletion index before
+an exact bounded edit distance check, so a check costs tens of microseconds and
+does not grow with the number of brands.
+"""
+import re
+import logging
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.ai.service.domain_index import DomainSuffixIndex, extract_host
+
+logger = logging.getLogger(__name__)
+
+# Single characters commonly substituted for Latin letters in phishing domains
+HOMOGLYPHS = str.maketrans({
+    '0': 'o', '1': 'l', '3': 'e', '4': 'a', '5': 's', '7': 't', '8': 'b', '@': 'a', 'i': 'l', '|': 'l',
+    # Cyrillic
+    'а': 'a', 'в': 'b', 'е': 'e', 'к': 'k', 'м': 'm', 'н': 'h', 'о': 'o', 'р': 'p', 'с': 'c',
+    'т': 't', 'у': 'y', 'х': 'x', 'ѕ': 's', 'і': 'l', 'ј': 'j', 'ԁ': 'd', 'ɡ': 'g', 'һ': 'h', 'ӏ': 'l',
+    # Greek
+    'α': 'a', 'β': 'b', 'ε': 'e', 'ι': 'l', 'κ': 'k', 'ν': 'v', 'ο': 'o', 'ρ': 'p', 'τ': 't', 'υ': 'u', 'χ': 'x',
+    # Latin look-alikes with diacritics
+    'á': 'a', 'à': 'a', 'ä': 'a', 'â': 'a', 'ã': 'a', 'å': 'a', 'é': 'e', 'è': 'e', 'ë': 'e', 'ê': 'e',
+    'í': 'l', 'ì': 'l', 'ï': 'l', 'î': 'l', 'ó': 'o', 'ò': 'o', 'ö': 'o', 'ô': 'o', 'õ': 'o',
+    'ú': 'u', 'ù': 'u', 'ü': 'u', 'û': 'u', 'ç': 'c', 'ñ': 'n', 'ý': 'y', 'ÿ': 'y'
+})
+
+# Letter pairs that render like a single letter
+HOMOGLYPH_PAIRS = (('rn', 'm'), ('vv', 'w'), ('cl', 'd'))
+
+# Second-level labels under which a country TLD registers domains (example.co.uk)
+COMMON_SECOND_LEVELS = frozenset({'co', 'com', 'net', 'org', 'gov', 'edu', 'ac', 'or', 'ne', 'go'})
+
+# Separators between the tokens lure words are matched against
+TOKEN_SEPARATORS = re.compile(r'[.\-_]')
+
+# Scores per signal; the detector reports the highest one
+SCORE_KEYWORD = 1.0
+SCORE_HOMOGLYPH = 0.95
+SCORE_TYPOSQUAT = 0.9
+SCORE_BRAND_WITH_LURE = 0.9
+SCORE_BRAND = 0.6
+
+
+def skeleton(text: str) -> str:
+    """Fold confusable characters so look-alike strings compare equal."""
+    text = text.lower().translate(HOMOGLYPHS)
+    for pair, letter in HOMOGLYPH_PAIRS:
+        if pair in text:
+            text = text.replace(pair, letter)
+    return text
+
+
+def decode_host(host: str) -> str:
+    """Decode IDNA (punycode) labels so homoglyphs can be folded."""
+    if 'xn--' not in host:
+        return host
+    labels = []
+    for label in host.split('.'):
+        if label.startswith('xn--'):
+            try:
+                label = label.encode('ascii').decode('idna')
+            except UnicodeError:
+                pass
+        labels.append(label)
+    return '.'.join(labels)
+
+
+def registrable_label(host: str) -> str:
+    """
+    Return the label a domain owner chose, e.g. ``discord`` for ``www.discord.co.uk``.
+
+    This approximates the public suffix list: a two-letter TLD preceded by a common
+    second-level label (``co.uk``, ``com.tw``) counts as one suffix.
+    """
+    labels = host.split('.')
+    if len(labels) < 2:
+        return host
+    if len(labels) >= 3 and len(labels[-1]) == 2 and labels[-2] in COMMON_SECOND_LEVELS:
+        return labels[-3]
+    return labels[-2]
+
+
+def bounded_edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Edit distance counting adjacent transpositions as one edit (optimal string alignment).
+
+    Returns ``limit + 1`` as soon as the distance is known to exceed ``limit``.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i]
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if before_previous and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, before_previous[j - 2] + 1)
+            current.append(value)
+        if min(current) > limit:
+            return limit + 1
+        before_previous, previous = previous, current
+    return previous[-1]
+
+
+def _deletions(word: str, depth: int) -> Set[str]:
+    """Return every string obtained by deleting up to ``depth`` characters from a word."""
+    results = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        results |= frontier
+    return results
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton for finding many patterns in one pass over a string."""
+
+    def __init__(self, patterns: Iterable[str]):
+        """
+        Build the automaton.
+
+        Args:
+            patterns: Patterns to search for
+        """
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[str]] = [[]]
+
+        for pattern in patterns:
+            if pattern:
+                self._insert(pattern)
+        self._build_failure_links()
+
+    def _insert(self, pattern: str) -> None:
+        """Add a pattern to the trie."""
+        state = 0
+        for char in pattern:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append(pattern)
+
+    def _build_failure_links(self) -> None:
+        """Compute failure links breadth-first and merge outputs along them."""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def search(self, text: str) -> List[Tuple[int, str]]:
+        """
+        Find every pattern occurrence in a string.
+
+        Args:
+            text: The string to search
+
+        Returns:
+            (start index, pattern) pairs
+        """
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        matches = []
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                for pattern in output[state]:
+                    matches.append((index - len(pattern) + 1, pattern))
+        return matches
+
+
+class ImpersonationDetector:
+    """
+    Scores hosts for impersonation of protected brands.
+
+    Hosts of the protected and allowed domains (and their subdomains) are never flagged.
+    """
+
+    def __init__(self, protected_domains: Iterable[str], impersonation_keywords: Iterable[str] = (),
+                 lure_words: Iterable[str] = (), threshold: float = 0.8,
+                 allowed_domains: Iterable[str] = ()):
+        """
+        Initialize the detector.
+
+        Args:
+            protected_domains: Official domains of the protected brands (e.g. discord.com)
+            impersonation_keywords: Host fragments that are always treated as impersonation
+            lure_words: Words that make an embedded brand name more suspicious (gift, login, ...)
+            threshold: Score at or above which a host is reported as impersonation
+            allowed_domains: Legitimate domains that look like a brand (e.g. paypay.ne.jp)
+        """
+        self.threshold = threshold
+        self.official = DomainSuffixIndex(protected_domains)
+        self.allowed = DomainSuffixIndex(allowed_domains)
+
+        # Brand names are the registrable labels of the official domains
+        self.brands = {registrable_label(domain) for domain in self.official.domains}
+        self.brand_skeletons = {skeleton(brand): brand for brand in self.brands}
+        self.keywords = {keyword.strip().lower() for keyword in impersonation_keywords if keyword.strip()}
+        self.lure_words = {word.strip().lower() for word in lure_words if word.strip()}
+
+        # One automaton for keywords and brand names; lure words are matched as whole tokens
+        self.matcher = AhoCorasick(self.keywords | self.brands)
+
+        # Deletion index for typosquat lookups: deletion variant -> brands it came from
+        self.brand_lengths = {len(brand_skeleton) for brand_skeleton in self.brand_skeletons}
+        self.deletion_index: Dict[str, Set[str]] = {}
+        for brand_skeleton in self.brand_skeletons:
+            for variant in _deletions(brand_skeleton, min(1, self._max_distance(brand_skeleton))):
+                self.deletion_index.setdefault(variant, set()).add(brand_skeleton)
+
+        logger.info(
+            f"Impersonation detector ready: {len(self.brands)} brands, {len(self.keywords)} keywords, "
+            f"{len(self.lure_words)} lure words, {len(self.allowed)} allowed domains"
+        )
+
+    @staticmethod
+    def _max_distance(word: str) -> int:
+        """Edit distance tolerated for a brand name of this length."""
+        if len(word) <= 4:
+            return 0
+        if len(word) <= 8:
+            return 1
+        return 2
+
+    def _lookalike_brand(self, label: str) -> Optional[Tuple[str, str]]:
+        """
+        Match a label against the brands by homoglyph folding and edit distance.
+
+        Returns:
+            (brand, 'homoglyph' or 'typosquat'), or None
+        """
+        label_skeleton = skeleton(label)
+        brand = self.brand_skeletons.get(label_skeleton)
+        if brand:
+            # Identical text is the brand itself on another domain, handled as an embedded brand
+            return (brand, 'homoglyph') if label != brand else None
+
+        # Only brands within two characters of the label's length can be two edits away
+        length = len(label_skeleton)
+        if not any(abs(length - brand_length) <= 2 for brand_length in self.brand_lengths):
+            return None
+        # Symmetric single deletions find every brand one edit away, and transpositions
+        # or insert/delete pairs two edits away; candidates are then verified exactly
+        candidates: Set[str] = set()
+        deletion_index = self.deletion_index
+        for i in range(length + 1):
+            found = deletion_index.get(label_skeleton[:i] + label_skeleton[i + 1:] if i < length else label_skeleton)
+            if found:
+                candidates |= found
+        for brand_skeleton in candidates:
+            limit = self._max_distance(brand_skeleton)
+            if bounded_edit_distance(label_skeleton, brand_skeleton, limit) <= limit:
+                return self.brand_skeletons[brand_skeleton], 'typosquat'
+        return None
+
+    def score_host(self, host: str) -> Dict:
+        """
+        Score a host for impersonation.
+
+        Args:
+            host: Normalised host (see ``extract_host``)
+
+        Returns:
+            A dict with ``score``, ``signal``, ``brand`` and ``matched``; score 0 if nothing matched
+        """
+        result = {'score': 0.0, 'signal': None, 'brand': None, 'matched': None}
+        if not host or self.official.find(host) or self.allowed.find(host):
+            return result
+
+        def consider(score: float, signal: str, brand: Optional[str], matched: str) -> None:
+            if score > result['score']:
+                result.update(score=score, signal=signal, brand=brand, matched=matched)
+
+        decoded = decode_host(host)
+        matches = self.matcher.search(decoded)
+        # "accounts" or "supported" are not the lure words "account" and "support"
+        has_lure = not self.lure_words.isdisjoint(TOKEN_SEPARATORS.split(decoded))
+
+        for start, pattern in matches:
+            if pattern in self.keywords:
+                consider(SCORE_KEYWORD, 'keyword', None, pattern)
+            elif pattern in self.brands and (start == 0 or not decoded[start - 1].isalnum()):
+                # Brand name starting a label or hyphen-separated token of a non-official host
+                consider(SCORE_BRAND_WITH_LURE if has_lure else SCORE_BRAND, 'brand_embedded', pattern, pattern)
+
+        # Compare the registrable label and its hyphen-separated tokens with the brands
+        label = registrable_label(decoded)
+        for token in {label, *label.split('-')}:
+            if len(token) < 4:
+                continue
+            lookalike = self._lookalike_brand(token)
+            if lookalike:
+                brand, signal = lookalike
+                consider(SCORE_HOMOGLYPH if signal == 'homoglyph' else SCORE_TYPOSQUAT, signal, brand, token)
+
+        return result
+
+    def check_url(self, url: str) -> Optional[Dict]:
+        """
+        Check a URL's host for impersonation.
+
+        Args:
+            url: The URL to check
+
+        Returns:
+            The score dict (see ``score_host``) with the host if it reaches the threshold, otherwise None
+        """
+        host = extract_host(url)
+        result = self.score_host(host)
+        if result['score'] >= self.threshold:
+            result['host'] = host
+            return result
+        return None
@@ -2,13 +2,44 @@
 Content moderation service using OpenAI's Moderation API.
 """
 import os
+import random
+import asyncio
 import logging
 import base64
-import aiohttp
 import io
 from typing import Dict, List, Union, Tuple, Optional, Any
 from openai import AsyncOpenAI
 
+from app.services.http_client import get_http_session
+from app.ai.service.moderation_batcher import ModerationBatcher
+from app.ai.service.moderation_cache import ModerationVerdictCache
+from app.ai.service.benign_classifier import BenignClassifier
+from app.ai.service.image_hash_cache import ImageVerdictCache
+from app.config import (
+    CONTENT_MODERATION_IMAGES_PER_REQUEST,
+    CONTENT_MODERATION_BATCH_ENABLED,
+    CONTENT_MODERATION_BATCH_MAX_SIZE,
+    CONTENT_MODERATION_BATCH_MAX_WAIT_MS,
+    CONTENT_MODERATION_CACHE_ENABLED,
+    CONTENT_MODERATION_CACHE_MAX_ENTRIES,
+    CONTENT_MODERATION_CACHE_TTL,
+    CONTENT_MODERATION_PRECLASSIFIER_ENABLED,
+    CONTENT_MODERATION_PRECLASSIFIER_THRESHOLD,
+    CONTENT_MODERATION_PRECLASSIFIER_MAX_LENGTH,
+    CONTENT_MODERATION_PRECLASSIFIER_SHADOW_RATE,
+    CONTENT_MODERATION_PRECLASSIFIER_EXTRA_TERMS,
+    IMAGE_MODERATION_CACHE_ENABLED,
+    IMAGE_MODERATION_CACHE_MAX_ENTRIES,
+    IMAGE_MODERATION_CACHE_TTL,
+    IMAGE_MODERATION_HASH_DISTANCE,
+    IMAGE_MODERATION_HASH_WORKERS,
+    IMAGE_MODERATION_MAX_DOWNLOAD_MB,
+    IMAGE_BLOCKLIST_DB,
+    IMAGE_BLOCKLIST_AUTO_ADD,
+    IMAGE_BLOCKLIST_AFTER_VIOLATIONS,
+    IMAGE_BLOCKLIST_TTL_DAYS
+)
+
 logger = logging.getLogger(__name__)
 
 def convert_to_dict(obj: Any) -> Union[Dict, Any]:
@@ -26,6 +57,44 @@ def convert_to_dict(obj: Any) -> Union[Dict, Any]:
         return {key: convert_to_dict(value) for key, value in obj.__dict__.items()}
     return obj
 
+def split_result(result: Any, input_type: str) -> Tuple[bool, Dict]:
+    """
+    Build the result of one input type from a moderation result of mixed inputs.
+    
+    A request with several inputs is answered with one combined result whose
+    ``category_applied_input_types`` tells which input types ("text", "image")
+    triggered each category. Only the categories that apply to ``input_type``
+    are kept flagged; scores are shared by all inputs of the request.
+    
+    Args:
+        result: A moderation result from the API
+        input_type: "text" or "image"
+        
+    Returns:
+        A tuple containing a boolean indicating if this input type violates policies,
+        and a dictionary with detailed results.
+    """
+    categories = convert_to_dict(result.categories)
+    category_scores = convert_to_dict(result.category_scores)
+    
+    applied = getattr(result, "category_applied_input_types", None)
+    if applied is not None:
+        applied = convert_to_dict(applied)
+        categories = {
+            category: bool(is_violated) and input_type in (applied.get(category) or [])
+            for category, is_violated in categories.items()
+        }
+        is_flagged = any(categories.values())
+    else:
+        # Without per-type information every input shares the combined verdict
+        is_flagged = result.flagged
+    
+    return is_flagged, {
+        "categories": categories,
+        "category_scores": category_scores,
+        "flagged": is_flagged
+    }
+
 class ContentModerator:
     """
     A class to moderate content using OpenAI's moderation API.
@@ -33,17 +102,55 @@ class ContentModerator:
     This class provides methods to check both text and images for inappropriate content.
     """
     
-    def __init__(self, openai_client: Optional[AsyncOpenAI] = None):
+    def __init__(self, openai_client: Optional[AsyncOpenAI] = None,
+                 images_per_request: int = CONTENT_MODERATION_IMAGES_PER_REQUEST,
+                 batch_texts: bool = False, cache_verdicts: bool = False,
+                 preclassify: bool = False, cache_images: bool = False):
         """
         Initialize the content moderator with an OpenAI client.
         
         Args:
             openai_client: An optional AsyncOpenAI client. If not provided, a new one will be created.
+            images_per_request: Images sent with each moderation request in moderate_content
+            batch_texts: Moderate texts in moderate_content through a ModerationBatcher shared
+                by all callers of this instance
+            cache_verdicts: Reuse text moderation results in moderate_content through a
+                ModerationVerdictCache (also used by main.py for review decisions)
+            preclassify: Skip the API in moderate_content for texts a local
+                BenignClassifier scores as benign
+            cache_images: Reuse image verdicts in moderate_content by perceptual hash
+                and reject blocked images through an ImageVerdictCache
         """
         # Initialize with provided client or create a new one using standard OpenAI API
         self.client = openai_client or AsyncOpenAI(
             api_key=os.getenv("OPENAI_API_KEY")
         )
+        self.images_per_request = max(1, images_per_request)
+        self.batcher = ModerationBatcher(
+            self.client,
+            max_batch_size=CONTENT_MODERATION_BATCH_MAX_SIZE,
+            max_wait=CONTENT_MODERATION_BATCH_MAX_WAIT_MS / 1000
+        ) if batch_texts else None
+        self.verdict_cache = ModerationVerdictCache(
+            max_entries=CONTENT_MODERATION_CACHE_MAX_ENTRIES,
+            ttl=CONTENT_MODERATION_CACHE_TTL
+        ) if cache_verdicts else None
+        self.preclassifier = BenignClassifier(
+            threshold=CONTENT_MODERATION_PRECLASSIFIER_THRESHOLD,
+            max_length=CONTENT_MODERATION_PRECLASSIFIER_MAX_LENGTH,
+            extra_risk_terms=CONTENT_MODERATION_PRECLASSIFIER_EXTRA_TERMS
+        ) if preclassify else None
+        self.shadow_rate = CONTENT_MODERATION_PRECLASSIFIER_SHADOW_RATE
+        self.image_cache = ImageVerdictCache(
+            db_path=IMAGE_BLOCKLIST_DB,
+            max_entries=IMAGE_MODERATION_CACHE_MAX_ENTRIES,
+            ttl=IMAGE_MODERATION_CACHE_TTL,
+            max_distance=IMAGE_MODERATION_HASH_DISTANCE,
+            workers=IMAGE_MODERATION_HASH_WORKERS,
+            auto_block=IMAGE_BLOCKLIST_AUTO_ADD,
+            block_after=IMAGE_BLOCKLIST_AFTER_VIOLATIONS,
+            block_ttl=IMAGE_BLOCKLIST_TTL_DAYS * 86400
+        ) if cache_images else None
         
     async def moderate_text(self, text: str) -> Tuple[bool, Dict]:
         """
@@ -169,34 +276,100 @@ class ContentModerator:
             # In case of error, return False to prevent false positives
             return False, {"error": str(e)}
     
-    async def download_image(self, image_url: str) -> Tuple[Optional[bytes], Optional[str]]:
+    async def download_image(self, image_url: str, max_bytes: Optional[int] = None) -> Tuple[Optional[bytes], Optional[str]]:
         """
         Download an image from a URL.
         
         Args:
             image_url: The URL of the image to download.
+            max_bytes: Optional size limit; larger images are not downloaded.
             
         Returns:
             A tuple containing the binary image data and its content type, or None if an error occurred.
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(image_url) as response:
-                    if response.status == 200:
-                        content_type = response.headers.get('Content-Type', 'image/jpeg')
+            session = await get_http_session()
+            async with session.get(image_url) as response:
+                if response.status == 200:
+                    content_type = response.headers.get('Content-Type', 'image/jpeg')
+                    if max_bytes is None:
                         image_data = await response.read()
                         return image_data, content_type
-                    else:
-                        logger.error(f"Failed to download image. Status: {response.status}")
+                    
+                    if (response.content_length or 0) > max_bytes:
+                        logger.info(f"Image too large to download ({response.content_length} bytes): {image_url}")
                         return None, None
+                    image_data = bytearray()
+                    async for chunk in response.content.iter_chunked(65536):
+                        image_data.extend(chunk)
+                        if len(image_data) > max_bytes:
+                            logger.info(f"Image too large to download (over {max_bytes} bytes): {image_url}")
+                            return None, None
+                    return bytes(image_data), content_type
+                else:
+                    logger.error(f"Failed to download image. Status: {response.status}")
+                    return None, None
         except Exception as e:
             logger.error(f"Error downloading image: {str(e)}")
             return None, None
     
+    async def _moderate_chunk(self, text: Optional[str], image_urls: List[str]) -> Tuple[Optional[Tuple[bool, Dict]], List[Tuple[bool, Dict]]]:
+        """
+        Moderate text and images with a single request.
+        
+        Args:
+            text: Optional text content to moderate.
+            image_urls: Image URLs to moderate.
+            
+        Returns:
+            The text result (None without text) and one result per image, each a
+            (flagged, details) tuple like moderate_text and moderate_image return.
+        """
+        inputs = []
+        if text:
+            inputs.append({"type": "text", "text": text})
+        inputs.extend({"type": "image_url", "image_url": {"url": url}} for url in image_urls)
+        
+        try:
+            response = await self.client.moderations.create(
+                input=inputs,
+                model="omni-moderation-latest"
+            )
+            
+            if len(response.results) == len(inputs) > 1:
+                # One result per input, in input order
+                results = [
+                    split_result(result, "text" if item["type"] == "text" else "image")
+                    for result, item in zip(response.results, inputs)
+                ]
+                return (results.pop(0) if text else None), results
+            
+            # One combined result: attribute each category to the input types it applies to
+            result = response.results[0]
+            image_result = split_result(result, "image") if image_urls else None
+            return (split_result(result, "text") if text else None), [image_result] * len(image_urls)
+        
+        except Exception as e:
+            logger.error(f"Error moderating content: {str(e)}")
+            # In case of error, return False to prevent false positives
+            error_result = (False, {"error": str(e)})
+            return (error_result if text else None), [error_result] * len(image_urls)
+    
     async def moderate_content(self, text: str = None, image_urls: List[str] = None) -> Tuple[bool, Dict]:
         """
         Moderate both text and images in a single call.
         
+        The text and the images are sent together, ``images_per_request`` images
+        per request; when there are more images the requests run in parallel.
+        With a batcher, the text is instead batched with other messages' texts
+        while the images are moderated. With a verdict cache, a text seen before
+        is not sent at all, and with a pre-classifier neither is a text scored
+        as benign (except for a ``shadow_rate`` share used to measure agreement).
+        With an image cache, images are downloaded and hashed first; blocked
+        images and images seen before are decided without the API. Image
+        results then carry the image's ``image_key`` if their verdict belongs
+        to that image alone, for ``ImageVerdictCache.record_violation``.
+        
         Args:
             text: Optional text content to moderate.
             image_urls: Optional list of image URLs to moderate.
@@ -211,22 +384,122 @@ class ContentModerator:
             "flagged": False
         }
         
-        # Moderate text if provided
-        if text:
-            text_flagged, text_result = await self.moderate_text(text)
-            results["text_result"] = text_result
-            if text_flagged:
+        image_urls = list(image_urls or [])
+        
+        # Trivially benign text is decided locally
+        shadow_check = False
+        if self.preclassifier and text and self.preclassifier.is_benign(text):
+            if random.random() < self.shadow_rate:
+                shadow_check = True
+            else:
+                results["text_result"] = {"categories": {}, "category_scores": {}, "flagged": False, "preclassified": True}
+                text = None
+        
+        # Repeated text is decided from the cache
+        if self.verdict_cache and text:
+            cached_outcome = self.verdict_cache.get_moderation(text)
+            if cached_outcome is not None:
+                results["flagged"], results["text_result"] = cached_outcome
+                text = None
+        
+        # Images seen before (or near-duplicates of them) are decided from the image cache
+        image_outcomes: List[Optional[Tuple[bool, Dict]]] = [None] * len(image_urls)
+        image_keys: List[Optional[str]] = [None] * len(image_urls)
+        attributable = [True] * len(image_urls)
+        if self.image_cache and image_urls:
+            image_keys = await asyncio.gather(*(self._image_key(url) for url in image_urls))
+            for index, key in enumerate(image_keys):
+                if key is not None:
+                    image_outcomes[index] = self.image_cache.lookup(key)
+        pending = [index for index, outcome in enumerate(image_outcomes) if outcome is None]
+        
+        if text or pending:
+            size = self.images_per_request
+            chunks = [pending[i:i + size] for i in range(0, len(pending), size)]
+            
+            if self.batcher and text:
+                text_outcome, *outcomes = await asyncio.gather(
+                    self.batcher.moderate_text(text),
+                    *(self._moderate_chunk(None, [image_urls[index] for index in chunk]) for chunk in chunks)
+                )
+                outcomes.insert(0, (text_outcome, []))
+                chunks.insert(0, [])
+            else:
+                # The text goes with the first chunk of images
+                chunks = chunks or [[]]
+                outcomes = await asyncio.gather(*(
+                    self._moderate_chunk(text if position == 0 else None, [image_urls[index] for index in chunk])
+                    for position, chunk in enumerate(chunks)
+                ))
+            
+            for chunk, (text_outcome, chunk_outcomes) in zip(chunks, outcomes):
+                if text_outcome:
+                    text_flagged, results["text_result"] = text_outcome
+                    if self.verdict_cache:
+                        self.verdict_cache.set_moderation(text, text_outcome)
+                    if shadow_check and "error" not in results["text_result"]:
+                        self.preclassifier.record_shadow_check(text_flagged)
+                        if text_flagged:
+                            logger.warning(f"Moderation API flagged a text the pre-classifier scored benign: {text[:100]}")
+                    if text_flagged:
+                        results["flagged"] = True
+                for index, outcome in zip(chunk, chunk_outcomes):
+                    image_outcomes[index] = outcome
+                    attributable[index] = len(chunk) == 1
+                    if self.image_cache and image_keys[index]:
+                        self.image_cache.store(image_keys[index], outcome, attributable=attributable[index])
+        
+        for url, key, is_attributable, (image_flagged, image_result) in zip(
+                image_urls, image_keys, attributable, image_outcomes):
+            image_entry = {
+                "url": url,
+                "result": image_result
+            }
+            if key and is_attributable:
+                image_entry["image_key"] = key
+            results["image_results"].append(image_entry)
+            if image_flagged:
                 results["flagged"] = True
         
-        # Moderate images if provided
-        if image_urls:
-            for url in image_urls:
-                image_flagged, image_result = await self.moderate_image(url)
-                results["image_results"].append({
-                    "url": url,
-                    "result": image_result
-                })
-                if image_flagged:
-                    results["flagged"] = True
-        
-        return results["flagged"], results 
\ No newline at end of file
+        return results["flagged"], results
+    
+    async def _image_key(self, image_url: str) -> Optional[str]:
+        """Download an image and compute its image cache key, or None if it cannot be downloaded."""
+        image_data, _ = await self.download_image(image_url, max_bytes=int(IMAGE_MODERATION_MAX_DOWNLOAD_MB * 1024 * 1024))
+        if not image_data:
+            return None
+        try:
+            return await self.image_cache.hash_image(image_data)
+        except Exception as e:
+            logger.error(f"Error hashing image: {str(e)}")
+            return None
+    
+    def close(self) -> None:
+        """Release the image cache's threads and database."""
+        if self.image_cache:
+            self.image_cache.close()
+
+
+# Shared moderator, so texts from concurrent messages end up in the same batches
+_shared_moderator: Optional[ContentModerator] = None
+
+
+def get_content_moderator() -> ContentModerator:
+    """Return the process-wide content moderator, creating it on first use."""
+    global _shared_moderator
+    if _shared_moderator is None:
+        _shared_moderator = ContentModerator(
+            batch_texts=CONTENT_MODERATION_BATCH_ENABLED,
+            cache_verdicts=CONTENT_MODERATION_CACHE_ENABLED,
+            preclassify=CONTENT_MODERATION_PRECLASSIFIER_ENABLED,
+            cache_images=IMAGE_MODERATION_CACHE_ENABLED
+        )
+    return _shared_moderator
+
+
+def close_content_moderator() -> None:
+    """Close the process-wide content moderator at shutdown."""
+    global _shared_moderator
+    if _shared_moderator is not None:
+        _shared_moderator.close()
+        _shared_moderator = None
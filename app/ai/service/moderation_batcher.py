@@ -0,0 +1,133 @@
+"""
+Moderation micro-batcher.
+
+This module collects the texts of many messages for a few milliseconds and
+moderates them with one multi-input request. The moderation endpoint answers a
+list of strings with one result per string, so each waiting caller gets exactly
+the result it would have received from its own request, while a busy channel
+costs one API call per batch instead of one per message.
+"""
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ModerationBatcher:
+    """
+    Cross-message batching of text moderation requests.
+
+    While no request is in flight a text is sent right away (together with
+    the texts that arrived in the same event loop iteration), so a quiet
+    channel pays no extra latency. While requests are in flight, texts are
+    collected until ``max_batch_size`` distinct texts are pending, ``max_wait``
+    seconds have passed, or the in-flight requests finished, whichever comes
+    first. Identical texts in the same batch are sent once.
+    """
+
+    def __init__(self, client, max_batch_size: int = 16, max_wait: float = 0.01,
+                 model: str = "omni-moderation-latest"):
+        """
+        Initialize the batcher.
+
+        Args:
+            client: AsyncOpenAI client used for the moderation requests
+            max_batch_size: Maximum distinct texts per request
+            max_wait: Seconds a text waits for others before its batch is sent
+            model: Moderation model
+        """
+        self.client = client
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.model = model
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._sending = set()
+
+        # Accounting
+        self.requests = 0
+        self.texts = 0
+
+    async def moderate_text(self, text: str) -> Tuple[bool, Dict]:
+        """
+        Moderate text content as part of the next batch.
+
+        Args:
+            text: The text content to moderate.
+
+        Returns:
+            A tuple containing a boolean indicating if the content violates policies,
+            and a dictionary with detailed results (same shape as
+            ``ContentModerator.moderate_text``).
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(text, []).append(future)
+        self.texts += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait if self._sending else 0, self._flush)
+
+        # Shielded so one caller giving up does not cancel the result for the others
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        """Send the pending texts as one request."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, {}
+        task = asyncio.create_task(self._send(batch))
+        self._sending.add(task)
+        task.add_done_callback(self._sent)
+
+    def _sent(self, task: asyncio.Task) -> None:
+        """Send the texts collected meanwhile once no request is in flight any more."""
+        self._sending.discard(task)
+        if self._pending and not self._sending:
+            self._flush()
+
+    async def _send(self, batch: Dict[str, List[asyncio.Future]]) -> None:
+        """Moderate a batch and hand each caller its result."""
+        # Imported here to avoid a circular import with the moderation module
+        from app.ai.service.moderation import convert_to_dict
+
+        texts = list(batch)
+        self.requests += 1
+        try:
+            response = await self.client.moderations.create(input=texts, model=self.model)
+            if len(response.results) != len(texts):
+                raise ValueError(f"expected {len(texts)} moderation results, got {len(response.results)}")
+
+            outcomes = [
+                (result.flagged, {
+                    "categories": convert_to_dict(result.categories),
+                    "category_scores": convert_to_dict(result.category_scores),
+                    "flagged": result.flagged
+                })
+                for result in response.results
+            ]
+        except Exception as e:
+            logger.error(f"Error moderating batch of {len(texts)} texts: {str(e)}")
+            # In case of error, return False to prevent false positives
+            outcomes = [(False, {"error": str(e)})] * len(texts)
+
+        for text, outcome in zip(texts, outcomes):
+            for future in batch[text]:
+                if not future.done():
+                    future.set_result(outcome)
+
+    def stats(self) -> Dict:
+        """Return request counters."""
+        return {
+            'requests': self.requests,
+            'texts': self.texts,
+            'pending': sum(len(futures) for futures in self._pending.values()),
+            'texts_per_request': round(self.texts / self.requests, 2) if self.requests else 0
+        }
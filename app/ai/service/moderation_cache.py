@@ -0,0 +1,151 @@
+"""
+Moderation verdict cache.
+
+This module remembers moderation outcomes by a hash of the normalised message
+text, so the copies of a raid or copypasta wave are decided locally instead of
+each paying for a moderation API call and, when flagged, an LLM review. Text
+is normalised before hashing (Unicode compatibility forms, case, zero-width
+characters and whitespace are folded), so trivially altered copies share an
+entry. Entries expire after a TTL and the least recently used are evicted once
+the cache is full; ``invalidate()`` drops everything when the guidelines or the
+review prompt change.
+"""
+import re
+import hashlib
+import logging
+import unicodedata
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from app.ai.service.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Zero-width and invisible formatting characters used to dodge exact matching
+ZERO_WIDTH_PATTERN = re.compile('[\u00ad\u180e\u200b-\u200f\u202a-\u202e\u2060-\u2064\ufeff]')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """
+    Fold the differences that do not change what a message says.
+
+    Args:
+        text: Message text
+
+    Returns:
+        The text in NFKC form, case-folded, without zero-width characters and
+        with runs of whitespace collapsed to one space
+    """
+    text = unicodedata.normalize('NFKC', text)
+    text = ZERO_WIDTH_PATTERN.sub('', text)
+    return WHITESPACE_PATTERN.sub(' ', text).strip().casefold()
+
+
+def text_key(text: str) -> str:
+    """Return the cache key of a text: a hash of its normalised form."""
+    return hashlib.blake2b(normalize_text(text).encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ModerationVerdictCache:
+    """
+    Bounded LRU+TTL cache of moderation results and review decisions.
+
+    Moderation results are keyed by the text alone. Review decisions are keyed
+    by the text and the violation categories the review was asked about, since
+    the same text with different images can be flagged for other reasons.
+    Failed API calls and failed reviews are never cached.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 3600):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Maximum entries of each kind (moderation results, reviews)
+            ttl: Seconds an entry is kept
+        """
+        self.moderations = TTLCache(max_entries, ttl)
+        self.reviews = TTLCache(max_entries, ttl)
+        self.invalidations = 0
+
+    def get_moderation(self, text: str) -> Optional[Tuple[bool, Dict]]:
+        """
+        Return the cached moderation result of a text, or None.
+
+        Returns:
+            A (flagged, details) tuple like ``ContentModerator.moderate_text``
+            returns, with ``from_cache`` set in the details
+        """
+        outcome = self.moderations.get(text_key(text))
+        if outcome is None:
+            return None
+        flagged, details = outcome
+        return flagged, {**details, "from_cache": True}
+
+    def set_moderation(self, text: str, outcome: Tuple[bool, Dict]) -> bool:
+        """
+        Cache the moderation result of a text.
+
+        Returns:
+            True if the result was cached (errors are not)
+        """
+        if "error" in outcome[1]:
+            return False
+        self.moderations.set(text_key(text), outcome)
+        return True
+
+    @staticmethod
+    def _review_key(text: str, violation_categories: Iterable[str]) -> Tuple[str, Tuple[str, ...]]:
+        return text_key(text), tuple(sorted(set(violation_categories)))
+
+    def get_review(self, text: str, violation_categories: Iterable[str]) -> Optional[Dict[str, Any]]:
+        """
+        Return a copy of the cached ``review_flagged_content`` decision, or None.
+
+        Args:
+            text: The flagged text
+            violation_categories: Categories the text was flagged for
+        """
+        review = self.reviews.get(self._review_key(text, violation_categories))
+        if review is None:
+            return None
+        return {**review, "from_cache": True}
+
+    def set_review(self, text: str, violation_categories: Iterable[str], review: Dict[str, Any]) -> bool:
+        """
+        Cache a ``review_flagged_content`` decision.
+
+        Fallback decisions made because the review agents failed or answered
+        nothing are not cached, so the next copy gets a real review.
+
+        Returns:
+            True if the decision was cached
+        """
+        original_response = str(review.get("original_response", ""))
+        if original_response.startswith("ERROR") or original_response == "EMPTY_RESPONSE":
+            return False
+        self.reviews.set(self._review_key(text, violation_categories), dict(review))
+        return True
+
+    def invalidate(self) -> int:
+        """
+        Drop every cached verdict, e.g. after the guidelines or the review prompt changed.
+
+        Returns:
+            The number of entries dropped
+        """
+        dropped = len(self.moderations) + len(self.reviews)
+        self.moderations.clear()
+        self.reviews.clear()
+        self.invalidations += 1
+        logger.info(f"Moderation verdict cache invalidated, dropped {dropped} entries")
+        return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters of both kinds of entries."""
+        return {
+            'moderations': self.moderations.stats(),
+            'reviews': self.reviews.stats(),
+            'invalidations': self.invalidations
+        }
+
@@ -0,0 +1,344 @@
+"""
+Threat feed importer.
+
+This module seeds the URL blacklist from local threat feed files so known-bad
+URLs and domains are blocked before they are ever seen in chat. Supported feed
+formats:
+
+- ``hosts``: hosts-file lines (``0.0.0.0 evil.com``) or bare domains, imported as domains
+- ``urls``: one URL per line (e.g. the OpenPhish community feed)
+- ``csv``: CSV exports with a ``url`` column (e.g. PhishTank ``online-valid.csv``)
+
+Feeds are read line by line and written in chunks, so memory use does not depend
+on the feed size. Every imported entry records its ``source`` and ``source_version``.
+Re-importing a newer version of the same source only writes new or changed entries
+and removes entries of that source that are no longer listed.
+
+Usage (run from the repository root):
+
+    python -m app.ai.service.threat_feed_importer online-valid.csv --source phishtank
+    python -m app.ai.service.threat_feed_importer hosts.txt --source urlhaus-hosts --format hosts
+
+With the SQLite backend the importer can run while the bot is up: the bot
+notices the commits of another process on its next save round (within a
+minute) and rebuilds its domain index and Bloom filter. The JSON backend keeps
+the whole blacklist in the bot's memory and rewrites the file from it, which
+would discard the import, so importing into it requires ``--bot-stopped``.
+"""
+import os
+import csv
+import time
+import sqlite3
+import logging
+import argparse
+import tempfile
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.ai.service.domain_index import DomainSuffixIndex
+from app.ai.service.url_blacklist import URLBlacklist
+from app.ai.service.url_canonicalizer import canonicalize_url
+
+logger = logging.getLogger(__name__)
+
+FEED_FORMATS = ('auto', 'hosts', 'urls', 'csv')
+
+# Hosts-file names that never refer to a threat
+HOSTS_IGNORED_NAMES = frozenset({
+    'localhost', 'localhost.localdomain', 'local', 'broadcasthost',
+    'ip6-localhost', 'ip6-loopback', 'ip6-localnet', 'ip6-mcastprefix',
+    'ip6-allnodes', 'ip6-allrouters', 'ip6-allhosts', '0.0.0.0'
+})
+
+# CSV columns holding the URL, and optional columns copied into the entry metadata
+CSV_URL_COLUMNS = ('url', 'phish_url')
+CSV_METADATA_COLUMNS = {
+    'phish_id': 'feed_id',
+    'target': 'target',
+    'brand': 'target',
+    'submission_time': 'feed_submitted_at'
+}
+
+# Metadata fields owned by the feed; a change in any of them rewrites the entry
+FEED_FIELDS = ('reason', 'threat_types', 'severity', 'target', 'feed_id')
+
+
+def detect_feed_format(path: str) -> str:
+    """
+    Guess the format of a feed file from its name and first data line.
+
+    Args:
+        path: Path to the feed file
+
+    Returns:
+        'hosts', 'urls' or 'csv'
+    """
+    if path.lower().endswith('.csv'):
+        return 'csv'
+
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if '://' in line:
+                return 'urls'
+            return 'hosts'
+    return 'urls'
+
+
+def iter_hosts_feed(path: str) -> Iterator[Tuple[str, str, Dict]]:
+    """Yield ('domains', domain, extra metadata) for every host in a hosts-format feed."""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            fields = line.split()
+            # "0.0.0.0 evil.com www.evil.com" or a bare "evil.com"
+            hosts = fields[1:] if len(fields) > 1 else fields
+            for host in hosts:
+                host = DomainSuffixIndex.normalize(host)
+                if host and host not in HOSTS_IGNORED_NAMES and '.' in host:
+                    yield 'domains', host, {}
+
+
+def iter_urls_feed(path: str) -> Iterator[Tuple[str, str, Dict]]:
+    """Yield ('urls', canonical URL, extra metadata) for every URL in a plain URL list."""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield 'urls', canonicalize_url(line), {}
+
+
+def iter_csv_feed(path: str) -> Iterator[Tuple[str, str, Dict]]:
+    """Yield ('urls', canonical URL, extra metadata) for every row of a CSV feed."""
+    with open(path, 'r', encoding='utf-8', errors='replace', newline='') as f:
+        reader = csv.DictReader(f)
+        columns = {name.strip().lower(): name for name in reader.fieldnames or []}
+        url_column = next((columns[name] for name in CSV_URL_COLUMNS if name in columns), None)
+        if url_column is None:
+            raise ValueError(f"CSV feed {path} has no url column (expected one of {CSV_URL_COLUMNS})")
+
+        for row in reader:
+            url = (row.get(url_column) or '').strip()
+            if not url:
+                continue
+            extra = {}
+            for column, field in CSV_METADATA_COLUMNS.items():
+                value = row.get(columns.get(column, ''))
+                if value:
+                    extra[field] = value.strip()
+            yield 'urls', canonicalize_url(url), extra
+
+
+FEED_READERS = {
+    'hosts': iter_hosts_feed,
+    'urls': iter_urls_feed,
+    'csv': iter_csv_feed
+}
+
+
+class ThreatFeedImporter:
+    """
+    Streams a threat feed file into a URLBlacklist.
+
+    Keys seen during an import are tracked in a temporary SQLite table rather than
+    in memory, which deduplicates the feed itself and lets entries that were dropped
+    from the feed be removed afterwards.
+    """
+
+    def __init__(self, blacklist: URLBlacklist, source: str, version: Optional[str] = None,
+                 chunk_size: int = 5000, severity: int = 8, threat_type: str = 'PHISHING'):
+        """
+        Initialize the importer.
+
+        Args:
+            blacklist: The blacklist to import into
+            source: Feed name recorded on every entry (e.g. 'phishtank')
+            version: Feed version recorded on new or changed entries (defaults to the file's mtime)
+            chunk_size: Number of entries written per storage transaction
+            severity: Severity recorded on imported entries
+            threat_type: Threat type recorded on imported entries
+        """
+        self.blacklist = blacklist
+        self.source = source
+        self.version = version
+        self.chunk_size = chunk_size
+        self.severity = severity
+        self.threat_type = threat_type
+
+    def _entry_metadata(self, extra: Dict, version: str) -> Dict:
+        """Build the metadata stored for an imported entry."""
+        return {
+            'reason': f"Listed in threat feed: {self.source}",
+            'threat_types': [self.threat_type],
+            'severity': self.severity,
+            'unsafe_score': 1.0,
+            **extra,
+            'source': self.source,
+            'source_version': version
+        }
+
+    @staticmethod
+    def _feed_fields_changed(existing: Dict, metadata: Dict) -> bool:
+        """Return True if any feed-owned field differs from the stored entry."""
+        return any(existing.get(field) != metadata.get(field) for field in FEED_FIELDS)
+
+    def _apply_chunk(self, chunk: List[Tuple[str, str, Dict]], version: str, stats: Dict) -> None:
+        """Diff a chunk of feed entries against the blacklist and write the changes."""
+        writes = {'urls': [], 'domains': []}
+        storage = self.blacklist.storage
+
+        for kind, key, extra in chunk:
+            metadata = self._entry_metadata(extra, version)
+            existing = storage.get(kind, key)
+            if existing is None:
+                writes[kind].append((key, metadata))
+                stats['added'] += 1
+            elif existing.get('source') != self.source:
+                # Already blacklisted by a detection or another feed; leave it alone
+                stats['skipped_existing'] += 1
+            elif self._feed_fields_changed(existing, metadata):
+                writes[kind].append((key, metadata))
+                stats['updated'] += 1
+            else:
+                stats['unchanged'] += 1
+
+        if writes['urls']:
+            self.blacklist.add_urls(writes['urls'])
+        if writes['domains']:
+            self.blacklist.add_domains(writes['domains'])
+
+    def _remove_missing(self, seen: sqlite3.Connection, stats: Dict) -> None:
+        """Remove entries of this source that were not listed in the imported feed."""
+        storage = self.blacklist.storage
+        for kind in ('urls', 'domains'):
+            stale = [
+                key for key, value in storage.iter_items(kind)
+                if isinstance(value, dict) and value.get('source') == self.source
+                and seen.execute('SELECT 1 FROM seen WHERE kind = ? AND key = ?', (kind, key)).fetchone() is None
+            ]
+            for key in stale:
+                removed = self.blacklist.remove_url(key) if kind == 'urls' else self.blacklist.remove_domain(key)
+                if removed:
+                    stats['removed'] += 1
+
+    def import_file(self, path: str, feed_format: str = 'auto', remove_missing: bool = True) -> Dict:
+        """
+        Import a feed file into the blacklist.
+
+        Args:
+            path: Path to the feed file
+            feed_format: 'auto', 'hosts', 'urls' or 'csv'
+            remove_missing: Remove entries of this source that are no longer in the feed
+
+        Returns:
+            Import statistics (added, updated, unchanged, skipped_existing, duplicates, removed)
+        """
+        if feed_format == 'auto':
+            feed_format = detect_feed_format(path)
+        if feed_format not in FEED_READERS:
+            raise ValueError(f"Unsupported feed format: {feed_format}")
+
+        version = self.version or time.strftime('%Y%m%d%H%M%S', time.gmtime(os.path.getmtime(path)))
+        stats = {
+            'format': feed_format, 'version': version, 'added': 0, 'updated': 0,
+            'unchanged': 0, 'skipped_existing': 0, 'duplicates': 0, 'removed': 0
+        }
+        started = time.perf_counter()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            seen = sqlite3.connect(os.path.join(temp_dir, 'seen.db'))
+            try:
+                seen.execute('CREATE TABLE seen (kind TEXT, key TEXT, PRIMARY KEY (kind, key)) WITHOUT ROWID')
+                chunk = []
+                for kind, key, extra in FEED_READERS[feed_format](path):
+                    if not key:
+                        continue
+                    # Skip entries listed more than once in the same feed
+                    if seen.execute('INSERT OR IGNORE INTO seen VALUES (?, ?)', (kind, key)).rowcount == 0:
+                        stats['duplicates'] += 1
+                        continue
+                    chunk.append((kind, key, extra))
+                    if len(chunk) >= self.chunk_size:
+                        self._apply_chunk(chunk, version, stats)
+                        seen.commit()
+                        chunk = []
+                if chunk:
+                    self._apply_chunk(chunk, version, stats)
+                seen.commit()
+
+                seen_count = stats['added'] + stats['updated'] + stats['unchanged'] + stats['skipped_existing']
+                if remove_missing and seen_count:
+                    self._remove_missing(seen, stats)
+                elif remove_missing:
+                    logger.warning(f"Feed {path} contained no entries; keeping existing entries of {self.source}")
+            finally:
+                seen.close()
+
+        self.blacklist.flush()
+        stats['seconds'] = round(time.perf_counter() - started, 2)
+        logger.info(f"Imported threat feed {path} ({self.source} {version}): {stats}")
+        return stats
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command line entry point."""
+    from app.config import (
+        URL_BLACKLIST_FILE,
+        URL_BLACKLIST_STORAGE,
+        URL_BLACKLIST_DB_FILE
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Import a threat feed file into the URL blacklist",
+        epilog="With URL_BLACKLIST_STORAGE=sqlite a running bot picks up the import within a minute. "
+               "With the json backend the bot would overwrite the import, so stop the bot first "
+               "and pass --bot-stopped."
+    )
+    parser.add_argument('feed', help="Path to the feed file")
+    parser.add_argument('--source', required=True, help="Feed name recorded on every entry, e.g. phishtank")
+    parser.add_argument('--format', default='auto', choices=FEED_FORMATS, help="Feed format (default: auto)")
+    parser.add_argument('--version', help="Feed version (default: file modification time)")
+    parser.add_argument('--chunk-size', type=int, default=5000, help="Entries written per transaction")
+    parser.add_argument('--severity', type=int, default=8, help="Severity recorded on imported entries")
+    parser.add_argument('--threat-type', default='PHISHING', help="Threat type recorded on imported entries")
+    parser.add_argument('--keep-missing', action='store_true',
+                        help="Do not remove entries of this source that are no longer in the feed")
+    parser.add_argument('--bot-stopped', action='store_true',
+                        help="Confirm the bot is not running; required to import into the json backend")
+    args = parser.parse_args(argv)
+
+    if URL_BLACKLIST_STORAGE == 'json' and not args.bot_stopped:
+        parser.error(
+            "the json blacklist backend is rewritten from the running bot's memory, which would "
+            "discard this import; stop the bot and pass --bot-stopped, or use URL_BLACKLIST_STORAGE=sqlite"
+        )
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    # Per-entry add/remove messages would flood the output of a bulk import
+    logging.getLogger('app.ai.service.url_blacklist').setLevel(logging.WARNING)
+
+    blacklist = URLBlacklist(
+        URL_BLACKLIST_FILE,
+        storage_backend=URL_BLACKLIST_STORAGE,
+        db_file=URL_BLACKLIST_DB_FILE
+    )
+    try:
+        importer = ThreatFeedImporter(
+            blacklist,
+            source=args.source,
+            version=args.version,
+            chunk_size=args.chunk_size,
+            severity=args.severity,
+            threat_type=args.threat_type
+        )
+        stats = importer.import_file(args.feed, args.format, remove_missing=not args.keep_missing)
+        print(stats)
+    finally:
+        blacklist.close()
+
+
+if __name__ == '__main__':
+    main()
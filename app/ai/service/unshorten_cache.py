@@ -0,0 +1,176 @@
+"""
+Unshortening result cache.
+
+This module remembers where shortened URLs lead, so a link posted again is
+resolved without another HEAD/GET redirect chase. Both outcomes are cached:
+expanded URLs with their redirect chain, and URLs that turned out not to
+redirect at all (negative entries, kept for a shorter time). Entries live in an
+in-memory ``TTLCache`` and are written to SQLite in the background, so the
+cache survives restarts without any disk I/O on the lookup path.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Optional
+
+from app.ai.service.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Result fields worth keeping; timings and errors describe one particular attempt
+CACHED_FIELDS = ('original_url', 'final_url', 'success', 'method', 'redirect_count', 'redirect_history')
+
+
+class UnshortenCache:
+    """
+    Bounded TTL cache of unshortening results, persisted to SQLite.
+
+    Lookups and stores only touch memory. Stored entries are queued and written
+    by a background thread every ``save_interval`` seconds (and by ``flush()``
+    and ``close()``); on start-up the entries that have not expired are loaded.
+    """
+
+    def __init__(self, db_path: str = "data/url_unshorten_cache.db", max_entries: int = 50000,
+                 ttl: float = 86400, negative_ttl: float = 21600, save_interval: float = 60):
+        """
+        Initialize the cache and load persisted entries.
+
+        Args:
+            db_path: Path to the SQLite database file
+            max_entries: Maximum number of entries kept (in memory and on disk)
+            ttl: Seconds an expanded URL is cached
+            negative_ttl: Seconds a "does not redirect" outcome is cached
+            save_interval: Seconds between background saves
+        """
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.db_path = db_path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(max_entries, ttl)
+        self._dirty: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.create_tables()
+        self._load()
+
+        self._stop_event = threading.Event()
+        self._save_thread = threading.Thread(target=self._save_loop, args=(save_interval,), daemon=True)
+        self._save_thread.start()
+
+    def create_tables(self) -> None:
+        """Create the table if it doesn't exist."""
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS unshorten_cache (
+            url TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_unshorten_cache_expires ON unshorten_cache (expires_at)')
+        self.conn.commit()
+
+    def _load(self) -> None:
+        """Load the entries that have not expired, the longest-lived last so they survive the size cap."""
+        now = time.time()
+        try:
+            rows = self.conn.execute(
+                'SELECT url, result, expires_at FROM unshorten_cache WHERE expires_at > ? '
+                'ORDER BY expires_at DESC LIMIT ?',
+                (now, self.cache.max_entries)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error loading unshortening cache: {str(e)}")
+            return
+
+        for url, result, expires_at in reversed(rows):
+            try:
+                self.cache.set(url, json.loads(result), ttl=expires_at - now)
+            except ValueError:
+                continue
+        logger.info(f"Loaded {len(rows)} cached unshortening results from {self.db_path}")
+
+    def get(self, url: str) -> Optional[Dict]:
+        """
+        Return a copy of the cached result for a canonical URL, or None.
+
+        Args:
+            url: Canonical URL
+        """
+        result = self.cache.get(url)
+        if result is None:
+            return None
+        return {**result, "redirect_history": list(result.get("redirect_history", [])), "from_cache": True}
+
+    def set(self, url: str, result: Dict) -> bool:
+        """
+        Cache a successful unshortening result.
+
+        Results that expanded the URL use the normal TTL; results where the URL
+        did not redirect use the negative TTL. Failed attempts are not cached.
+
+        Args:
+            url: Canonical URL that was unshortened
+            result: Result from ``URLUnshortener``
+
+        Returns:
+            True if the result was cached
+        """
+        if not result.get("success") or not result.get("final_url"):
+            return False
+
+        entry = {field: result[field] for field in CACHED_FIELDS if field in result}
+        ttl = self.ttl if result["final_url"] != url else self.negative_ttl
+        if ttl <= 0:
+            return False
+
+        self.cache.set(url, entry, ttl=ttl)
+        with self._lock:
+            self._dirty[url] = (json.dumps(entry), time.time() + ttl)
+        return True
+
+    def flush(self) -> None:
+        """Write queued entries and drop expired and surplus rows."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            try:
+                if dirty:
+                    self.conn.executemany(
+                        'INSERT OR REPLACE INTO unshorten_cache (url, result, expires_at) VALUES (?, ?, ?)',
+                        [(url, result, expires_at) for url, (result, expires_at) in dirty.items()]
+                    )
+                self.conn.execute('DELETE FROM unshorten_cache WHERE expires_at <= ?', (time.time(),))
+                # Keep the table within the cache size, dropping the entries that expire first
+                self.conn.execute(
+                    'DELETE FROM unshorten_cache WHERE url IN ('
+                    'SELECT url FROM unshorten_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)',
+                    (self.cache.max_entries,)
+                )
+                self.conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Error saving unshortening cache: {str(e)}")
+                # Retry these entries with the next save unless newer ones replaced them
+                for url, value in dirty.items():
+                    self._dirty.setdefault(url, value)
+
+    def _save_loop(self, interval: float) -> None:
+        """Save periodically until close() is called."""
+        while not self._stop_event.wait(interval):
+            self.flush()
+
+    def stats(self) -> Dict:
+        """Return the in-memory cache counters."""
+        return self.cache.stats()
+
+    def close(self) -> None:
+        """Stop the background thread, save queued entries and close the database."""
+        self._stop_event.set()
+        self._save_thread.join(timeout=5)
+        self.flush()
+        with self._lock:
+            self.conn.close()
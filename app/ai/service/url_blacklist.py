@@ -5,12 +5,21 @@ This module provides functionality to manage a blacklist of URLs that have been
 previously identified as unsafe by the URL safety checker.
 """
 import os
-import json
 import time
 import logging
 import threading
-from typing import Dict, List, Optional, Set
-from urllib.parse import urlparse
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.ai.service.bloom_filter import BloomFilter
+from app.ai.service.domain_index import DomainSuffixIndex, extract_host
+from app.ai.service.url_canonicalizer import canonicalize_url
+from app.ai.service.url_blacklist_storage import (
+    BLACKLIST_KINDS,
+    create_blacklist_storage,
+    import_json_file,
+    export_json_file
+)
 
 # Create a logger for this module
 logger = logging.getLogger(__name__)
@@ -20,81 +29,243 @@ class URLBlacklist:
     Manages a persistent blacklist of unsafe URLs.
     
     This class provides methods to check, add, and remove URLs from the blacklist.
-    The blacklist is stored in a JSON file and periodically saved to disk.
+    Entries are kept in a pluggable storage backend (SQLite by default, or the
+    legacy JSON file), see ``app.ai.service.url_blacklist_storage``. An optional
+    in-memory Bloom filter over the URL keys answers most negative lookups
+    without touching the storage backend.
+    
+    Lookups never take ``self.lock``, which only serialises writers, so the event
+    loop is not stalled by a save, purge or import running on another thread.
+    Readers take one reference to the current domain index and Bloom filter per
+    lookup; rebuilds construct new ones off-lock and swap them in atomically,
+    and single-entry changes are applied as atomic set/bit updates. Lookups do
+    not write either: shortened URL uses are queued in memory and written to
+    the storage in one batch by the save thread.
     """
     
-    def __init__(self, blacklist_file: str = "data/url_blacklist.json"):
+    def __init__(self, blacklist_file: str = "data/url_blacklist.json",
+                 storage_backend: str = "json", db_file: Optional[str] = None,
+                 bloom_enabled: bool = False, bloom_capacity: int = 1000000,
+                 bloom_error_rate: float = 0.001, bloom_max_bytes: Optional[int] = None,
+                 url_ttl: Optional[float] = None, domain_ttl: Optional[float] = None,
+                 reverify_interval: Optional[float] = None, shortened_ttl: Optional[float] = None,
+                 shortened_max_entries: Optional[int] = None):
         """
         Initialize the URL blacklist.
         
         Args:
-            blacklist_file: Path to the JSON file storing the blacklist
+            blacklist_file: Path to the legacy JSON blacklist file
+            storage_backend: 'sqlite' or 'json'
+            db_file: Path to the SQLite database (used by the 'sqlite' backend)
+            bloom_enabled: Whether to keep a Bloom filter in front of URL lookups
+            bloom_capacity: Minimum number of URL keys the Bloom filter is sized for
+            bloom_error_rate: Target false-positive rate of the Bloom filter
+            bloom_max_bytes: Memory budget for the Bloom filter bit array
+            url_ttl: Seconds until a detected URL entry expires (None = never)
+            domain_ttl: Seconds until a detected domain entry expires (None = never)
+            reverify_interval: Seconds until a detected URL entry is due for re-verification (None = never)
+            shortened_ttl: Seconds a shortened URL mapping is kept after it was last used (None = forever)
+            shortened_max_entries: Maximum number of shortened URL mappings, least recently used dropped first
         """
         self.blacklist_file = blacklist_file
-        self.blacklist = {}  # Dict mapping URLs to metadata (detection time, threat types, etc.)
-        self.domains_blacklist = {}  # Dict mapping domains to metadata
-        self.shortened_urls_map = {}  # Dict mapping shortened URLs to their expanded versions
-        self.modified = False
+        self.storage_backend = (storage_backend or 'json').lower()
         self.lock = threading.RLock()  # Reentrant lock for thread safety
+        self._stop_event = threading.Event()
         
-        # Ensure the directory exists
-        os.makedirs(os.path.dirname(self.blacklist_file), exist_ok=True)
+        # Expiry and re-verification schedule for new entries
+        self.url_ttl = url_ttl
+        self.domain_ttl = domain_ttl
+        self.reverify_interval = reverify_interval
+        self.shortened_ttl = shortened_ttl
+        self.shortened_max_entries = shortened_max_entries
+        # (key, time) of shortened URL mappings used by lookups, written by the save thread
+        self._recently_used = deque(maxlen=100000)
         
-        # Load existing blacklist if available
-        self._load_blacklist()
+        # Open the storage backend
+        if self.storage_backend == 'sqlite':
+            self.db_file = db_file or os.path.splitext(blacklist_file)[0] + '.db'
+            self.storage = create_blacklist_storage('sqlite', self.db_file)
+            self._migrate_json()
+        else:
+            self.db_file = None
+            self.storage = create_blacklist_storage('json', self.blacklist_file)
+            
+        # In-memory suffix index so subdomains and host variants match blacklisted domains
+        self.domain_index = DomainSuffixIndex(self.storage.iter_keys('domains'))
+        self._domain_pending = None
+        self._domain_build_lock = threading.Lock()  # One domain index rebuild at a time
+        
+        # Bloom filter over URL and shortened URL keys, so unknown URLs skip the storage
+        self.bloom_enabled = bloom_enabled
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self.bloom_max_bytes = bloom_max_bytes
+        self.bloom = None
+        self._bloom_pending = None
+        if self.bloom_enabled:
+            self._start_bloom_build()
+            
+        logger.info(
+            f"Opened URL blacklist ({self.storage_backend}) with {self.storage.count('urls')} URLs, "
+            f"{self.storage.count('domains')} domains, and {self.storage.count('shortened_urls')} shortened URLs"
+        )
         
         # Start background save thread
         self._start_save_thread()
         
-    def _load_blacklist(self) -> None:
-        """Load the blacklist from the JSON file."""
+    def _migrate_json(self) -> None:
+        """Import the legacy JSON file into an empty SQLite database, once."""
+        if not os.path.exists(self.blacklist_file):
+            return
+        if any(self.storage.count(kind) for kind in BLACKLIST_KINDS):
+            return
+            
         try:
-            if os.path.exists(self.blacklist_file):
-                with open(self.blacklist_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.blacklist = data.get('urls', {})
-                    self.domains_blacklist = data.get('domains', {})
-                    self.shortened_urls_map = data.get('shortened_urls', {})
-                    logger.info(f"Loaded URL blacklist with {len(self.blacklist)} URLs, {len(self.domains_blacklist)} domains, and {len(self.shortened_urls_map)} shortened URLs")
-            else:
-                logger.info(f"No existing URL blacklist found at {self.blacklist_file}")
-                self.blacklist = {}
-                self.domains_blacklist = {}
-                self.shortened_urls_map = {}
+            imported = import_json_file(self.storage, self.blacklist_file)
+            logger.info(f"Migrated {imported} entries from {self.blacklist_file} to {self.db_file}")
         except Exception as e:
-            logger.error(f"Error loading URL blacklist: {str(e)}")
-            self.blacklist = {}
-            self.domains_blacklist = {}
-            self.shortened_urls_map = {}
+            logger.error(f"Error migrating URL blacklist JSON: {str(e)}")
         
-    def _save_blacklist(self) -> None:
-        """Save the blacklist to the JSON file if modified."""
+    def _start_bloom_build(self) -> None:
+        """Build the Bloom filter in a background thread; lookups use the storage until it is ready."""
         with self.lock:
-            if not self.modified:
-                return
+            if self._bloom_pending is not None:
+                return  # A build is already running
+            self._bloom_pending = []
+        threading.Thread(target=self._rebuild_bloom, daemon=True).start()
+        
+    def _rebuild_bloom(self) -> None:
+        """Rebuild the Bloom filter from the storage, sized for the current number of keys."""
+        try:
+            key_count = self.storage.count('urls') + self.storage.count('shortened_urls')
+            # Leave room to grow so the filter is not saturated right after startup
+            capacity = max(self.bloom_capacity, key_count * 2)
+            started = time.perf_counter()
+            bloom = BloomFilter(capacity, self.bloom_error_rate, self.bloom_max_bytes)
+            bloom.update(self.storage.iter_keys('urls'))
+            bloom.update(self.storage.iter_keys('shortened_urls'))
+            
+            with self.lock:
+                # Keys added while the filter was being built
+                bloom.update(self._bloom_pending)
+                self.bloom = bloom
+            logger.info(
+                f"Built URL blacklist Bloom filter: {bloom.count} keys, capacity {capacity}, "
+                f"{bloom.size_bytes / 1024 / 1024:.1f} MB, {bloom.num_hashes} hashes, "
+                f"in {time.perf_counter() - started:.1f}s"
+            )
+        except Exception as e:
+            logger.error(f"Error building URL blacklist Bloom filter: {str(e)}")
+        finally:
+            with self.lock:
+                self._bloom_pending = None
+                
+    def _bloom_add(self, key: str) -> None:
+        """Record a new 'urls' or 'shortened_urls' key in the Bloom filter (caller holds the lock)."""
+        if self._bloom_pending is not None:
+            self._bloom_pending.append(key)
+        if self.bloom is not None:
+            self.bloom.add(key)
             
+    def _rebuild_domain_index(self) -> None:
+        """Rebuild the domain index from the storage and swap it in; lookups keep using the old one meanwhile."""
+        with self._domain_build_lock:
+            with self.lock:
+                self._domain_pending = []
+            index = None
             try:
-                with open(self.blacklist_file, 'w', encoding='utf-8') as f:
-                    json.dump({
-                        'urls': self.blacklist,
-                        'domains': self.domains_blacklist,
-                        'shortened_urls': self.shortened_urls_map,
-                        'last_updated': time.time()
-                    }, f, indent=2)
-                self.modified = False
-                logger.info(f"Saved URL blacklist with {len(self.blacklist)} URLs, {len(self.domains_blacklist)} domains, and {len(self.shortened_urls_map)} shortened URLs")
+                index = DomainSuffixIndex(self.storage.iter_keys('domains'))
             except Exception as e:
-                logger.error(f"Error saving URL blacklist: {str(e)}")
+                logger.error(f"Error rebuilding URL blacklist domain index: {str(e)}")
+            with self.lock:
+                # Domains added or removed while the index was being built
+                pending, self._domain_pending = self._domain_pending, None
+                if index is not None:
+                    for domain, present in pending:
+                        if present:
+                            index.add(domain)
+                        else:
+                            index.discard(domain)
+                    self.domain_index = index
+                    
+    def _index_domain(self, domain: str, present: bool = True) -> None:
+        """Add a domain to or remove it from the domain index (caller holds the lock)."""
+        if self._domain_pending is not None:
+            self._domain_pending.append((domain, present))
+        if present:
+            self.domain_index.add(domain)
+        else:
+            self.domain_index.discard(domain)
+            
+    def _might_contain(self, key: str) -> bool:
+        """Return False only if the key is definitely not stored under 'urls' or 'shortened_urls'."""
+        bloom = self.bloom
+        return bloom is None or key in bloom
+        
+    def _save_recently_used(self) -> None:
+        """Write the last-used times queued by lookups to the storage in one batch."""
+        used = {}
+        while True:
+            try:
+                key, used_at = self._recently_used.popleft()
+            except IndexError:
+                break
+            used[key] = used_at
+        if not used:
+            return
+        try:
+            self.storage.touch_many('shortened_urls', used.items())
+        except Exception as e:
+            logger.error(f"Error saving URL blacklist usage times: {str(e)}")
+            
+    def _save_blacklist(self) -> None:
+        """Persist pending changes through the storage backend."""
+        try:
+            self.storage.flush()
+        except Exception as e:
+            logger.error(f"Error saving URL blacklist: {str(e)}")
                 
     def _start_save_thread(self) -> None:
         """Start a background thread to periodically save the blacklist."""
         def save_loop():
-            while True:
-                time.sleep(60)  # Save every minute if modified
+            # Save every minute if modified, until close() is called
+            while not self._stop_event.wait(60):
+                self._reload_if_changed()
+                # Before the purge, so mappings in use are not trimmed as stale
+                self._save_recently_used()
+                self.purge_expired()
                 self._save_blacklist()
+                if self.bloom is not None and self.bloom.is_saturated():
+                    self._start_bloom_build()
                 
-        save_thread = threading.Thread(target=save_loop, daemon=True)
-        save_thread.start()
+        self._save_thread = threading.Thread(target=save_loop, daemon=True)
+        self._save_thread.start()
+        
+    def reload(self) -> None:
+        """
+        Rebuild the in-memory domain index and Bloom filter from the storage.
+        
+        Needed after entries were written to the storage without going through
+        this instance, e.g. by the threat feed importer run in another process.
+        Until the new Bloom filter is ready, lookups read the storage directly.
+        """
+        self._rebuild_domain_index()
+        if self.bloom_enabled:
+            with self.lock:
+                # The current filter does not know the new keys
+                self.bloom = None
+            self._start_bloom_build()
+            
+    def _reload_if_changed(self) -> None:
+        """Reload the in-memory structures if another process changed the storage."""
+        try:
+            changed = self.storage.changed_externally()
+        except Exception as e:
+            logger.error(f"Error checking URL blacklist storage for changes: {str(e)}")
+            return
+        if changed:
+            logger.info("URL blacklist storage changed by another process, reloading domain index and Bloom filter")
+            self.reload()
         
     def is_blacklisted(self, url: str) -> Dict:
         """
@@ -106,34 +277,94 @@ class URLBlacklist:
         Returns:
             A dict with metadata if the URL is blacklisted, empty dict otherwise
         """
-        # 去除不必要的鎖，因為我們已經在主函數中批量處理
-        # 使用快速路徑檢查
+        # 讀取路徑不取鎖（見類別說明），背景儲存或匯入期間也不會阻塞事件循環
+        keys = self._candidate_keys(url)
+        # Bloom filter 先過濾，確定不在黑名單的 key 不需要查詢儲存後端
+        stored_keys = [key for key in keys if self._might_contain(key)]
         
         # First check exact URL match (最快的路徑)
-        if url in self.blacklist:
-            logger.info(f"URL found in blacklist: {url}")
-            return self.blacklist[url]
+        for key in stored_keys:
+            entry = self.storage.get('urls', key)
+            if entry and not self._is_expired(entry):
+                logger.info(f"URL found in blacklist: {url}")
+                return entry
         
         # Then check if it's a shortened URL we've seen before (第二快的路徑)
-        if url in self.shortened_urls_map:
-            expanded_url = self.shortened_urls_map[url]
-            if expanded_url in self.blacklist:
-                logger.info(f"Shortened URL found in blacklist: {url} -> {expanded_url}")
-                result = self.blacklist[expanded_url].copy()
-                result['original_shortened_url'] = url
-                result['expanded_url'] = expanded_url
-                return result
-        
-        # Then check domain match (if enabled)
-        try:
-            domain = urlparse(url).netloc.lower()
-            if domain and domain in self.domains_blacklist:
-                logger.info(f"Domain found in blacklist: {domain} (URL: {url})")
-                return self.domains_blacklist[domain]
-        except Exception as e:
-            logger.warning(f"Error parsing domain from URL {url}: {str(e)}")
+        for key in stored_keys:
+            expanded_url = self.storage.get('shortened_urls', key)
+            if not expanded_url:
+                continue
+            # Keep mappings that are still being posted at the recent end of the LRU;
+            # deque.append is thread-safe, the storage is updated by the save thread
+            self._recently_used.append((key, time.time()))
+            for expanded_key in self._candidate_keys(expanded_url):
+                if not self._might_contain(expanded_key):
+                    continue
+                entry = self.storage.get('urls', expanded_key)
+                if entry and not self._is_expired(entry):
+                    logger.info(f"Shortened URL found in blacklist: {url} -> {expanded_url}")
+                    result = dict(entry)
+                    result['original_shortened_url'] = url
+                    result['expanded_url'] = expanded_url
+                    return result
+            break
+        
+        # Then check domain match, including subdomains of blacklisted domains
+        return self.find_domain(extract_host(keys[0]), url)
+    
+    @staticmethod
+    def _candidate_keys(url: str) -> List[str]:
+        """
+        Return the storage keys to try for a URL.
+        
+        New entries are stored under the canonical URL; the raw URL is also tried
+        so entries written before canonicalisation was introduced still match.
+        """
+        canonical = canonicalize_url(url)
+        if canonical == url:
+            return [canonical]
+        return [canonical, url]
+    
+    @staticmethod
+    def _is_expired(entry: Dict) -> bool:
+        """Return True if an entry's expiry time has passed (it is purged on the next save)."""
+        expires_at = entry.get('expires_at')
+        return expires_at is not None and expires_at <= time.time()
+    
+    def _schedule(self, ttl: Optional[float], reverify_interval: Optional[float] = None) -> Dict:
+        """Build the expiry and re-verification fields for a new entry."""
+        now = time.time()
+        schedule = {'blacklisted_at': now}
+        if ttl:
+            schedule['expires_at'] = now + ttl
+        if reverify_interval:
+            schedule['reverify_at'] = now + reverify_interval
+        return schedule
+    
+    def find_domain(self, host: str, url: Optional[str] = None) -> Dict:
+        """
+        Resolve a host to its most specific blacklisted ancestor domain.
+        
+        Args:
+            host: Normalised host (see ``extract_host``)
+            url: The URL the host came from (for logging only)
+            
+        Returns:
+            The domain metadata if the host or a parent domain is blacklisted, empty dict otherwise
+        """
+        domain = self.domain_index.find(host)
+        if not domain:
+            return {}
             
-        return {}
+        entry = self.storage.get('domains', domain)
+        if not entry or self._is_expired(entry):
+            return {}
+            
+        logger.info(f"Domain found in blacklist: {domain} (host: {host}, URL: {url or host})")
+        if domain != host:
+            entry = dict(entry)
+            entry['matched_domain'] = domain
+        return entry
     
     def add_url(self, url: str, metadata: Dict) -> None:
         """
@@ -143,14 +374,54 @@ class URLBlacklist:
             url: The URL to blacklist
             metadata: Information about the URL (detection time, threat types, etc.)
         """
+        url = canonicalize_url(url)
         with self.lock:
-            self.blacklist[url] = {
+            self.storage.put('urls', url, {
                 **metadata,
-                'blacklisted_at': time.time()
-            }
-            self.modified = True
+                **self._schedule(self.url_ttl, self.reverify_interval)
+            })
+            self._bloom_add(url)
             logger.info(f"Added URL to blacklist: {url}")
-            
+
+    def add_urls(self, entries: Iterable[Tuple[str, Dict]]) -> int:
+        """
+        Add many URLs to the blacklist in one storage transaction.
+
+        Args:
+            entries: (url, metadata) pairs; URLs must already be canonical (see ``canonicalize_url``)
+
+        Returns:
+            The number of URLs written
+        """
+        now = time.time()
+        entries = [(url, {**metadata, 'blacklisted_at': now}) for url, metadata in entries]
+        with self.lock:
+            written = self.storage.put_many('urls', entries)
+            for url, _ in entries:
+                self._bloom_add(url)
+        return written
+
+    def add_domains(self, entries: Iterable[Tuple[str, Dict]]) -> int:
+        """
+        Add many domains to the blacklist in one storage transaction.
+
+        Args:
+            entries: (domain, metadata) pairs
+
+        Returns:
+            The number of domains written
+        """
+        now = time.time()
+        entries = [
+            (DomainSuffixIndex.normalize(domain), {**metadata, 'blacklisted_at': now})
+            for domain, metadata in entries
+        ]
+        with self.lock:
+            written = self.storage.put_many('domains', entries)
+            for domain, _ in entries:
+                self._index_domain(domain)
+        return written
+
     def add_domain(self, domain: str, metadata: Dict) -> None:
         """
         Add a domain to the blacklist.
@@ -159,12 +430,13 @@ class URLBlacklist:
             domain: The domain to blacklist
             metadata: Information about the domain (detection time, threat types, etc.)
         """
+        domain = DomainSuffixIndex.normalize(domain)
         with self.lock:
-            self.domains_blacklist[domain.lower()] = {
+            self.storage.put('domains', domain, {
                 **metadata,
-                'blacklisted_at': time.time()
-            }
-            self.modified = True
+                **self._schedule(self.domain_ttl)
+            })
+            self._index_domain(domain)
             logger.info(f"Added domain to blacklist: {domain}")
             
     def add_shortened_url(self, shortened_url: str, expanded_url: str) -> None:
@@ -175,10 +447,12 @@ class URLBlacklist:
             shortened_url: The original shortened URL
             expanded_url: The expanded URL that it redirects to
         """
+        shortened_url = canonicalize_url(shortened_url)
+        expanded_url = canonicalize_url(expanded_url)
         if shortened_url != expanded_url:
             with self.lock:
-                self.shortened_urls_map[shortened_url] = expanded_url
-                self.modified = True
+                self.storage.put('shortened_urls', shortened_url, expanded_url)
+                self._bloom_add(shortened_url)
                 logger.info(f"Added shortened URL mapping: {shortened_url} -> {expanded_url}")
     
     def add_unsafe_result(self, url: str, result: Dict, original_url: str = None, blacklist_domain: bool = False) -> None:
@@ -208,7 +482,7 @@ class URLBlacklist:
             # Optionally blacklist the domain for high-severity threats
             if blacklist_domain and result.get('severity', 0) >= 8:
                 try:
-                    domain = urlparse(url).netloc.lower()
+                    domain = extract_host(url)
                     if domain:
                         self.add_domain(domain, {
                             'reason': f"Domain of unsafe URL: {result.get('message', 'Unknown threat')}",
@@ -232,9 +506,8 @@ class URLBlacklist:
             True if the URL was in the blacklist and removed, False otherwise
         """
         with self.lock:
-            if url in self.blacklist:
-                del self.blacklist[url]
-                self.modified = True
+            removed = [self.storage.delete('urls', key) for key in self._candidate_keys(url)]
+            if any(removed):
                 logger.info(f"Removed URL from blacklist: {url}")
                 return True
             return False
@@ -249,11 +522,10 @@ class URLBlacklist:
         Returns:
             True if the domain was in the blacklist and removed, False otherwise
         """
+        domain = DomainSuffixIndex.normalize(domain)
         with self.lock:
-            domain_lower = domain.lower()
-            if domain_lower in self.domains_blacklist:
-                del self.domains_blacklist[domain_lower]
-                self.modified = True
+            self._index_domain(domain, present=False)
+            if self.storage.delete('domains', domain):
                 logger.info(f"Removed domain from blacklist: {domain}")
                 return True
             return False
@@ -269,9 +541,8 @@ class URLBlacklist:
             True if the URL was in the blacklist and removed, False otherwise
         """
         with self.lock:
-            if shortened_url in self.shortened_urls_map:
-                del self.shortened_urls_map[shortened_url]
-                self.modified = True
+            removed = [self.storage.delete('shortened_urls', key) for key in self._candidate_keys(shortened_url)]
+            if any(removed):
                 logger.info(f"Removed shortened URL from blacklist: {shortened_url}")
                 return True
             return False
@@ -279,11 +550,120 @@ class URLBlacklist:
     def clear(self) -> None:
         """Clear the entire blacklist."""
         with self.lock:
-            self.blacklist.clear()
-            self.domains_blacklist.clear()
-            self.modified = True
-            logger.info("Cleared URL blacklist")
+            self.storage.clear('urls')
+            self.storage.clear('domains')
+        self._rebuild_domain_index()
+        if self.bloom_enabled:
+            self._start_bloom_build()
+        logger.info("Cleared URL blacklist")
+            
+    def import_json(self, path: str) -> int:
+        """
+        Import entries from a blacklist JSON file.
+        
+        Entries are written in chunks without holding the blacklist lock, so
+        lookups and single-entry writes continue during a large import.
+        
+        Args:
+            path: Path to the JSON file
+            
+        Returns:
+            The number of entries imported
+        """
+        imported = import_json_file(self.storage, path)
+        self._rebuild_domain_index()
+        if self.bloom_enabled:
+            self._start_bloom_build()
+        return imported
+            
+    def export_json(self, path: str) -> int:
+        """
+        Export all entries to a blacklist JSON file.
+        
+        Args:
+            path: Destination path
+            
+        Returns:
+            The number of entries exported
+        """
+        return export_json_file(self.storage, path)
+            
+    def purge_expired(self) -> int:
+        """
+        Delete expired URL and domain entries and trim the shortened URL mappings.
+        
+        Shortened URL mappings are dropped once unused for ``shortened_ttl`` seconds,
+        and the least recently used ones are dropped beyond ``shortened_max_entries``.
+        
+        Returns:
+            The number of entries deleted
+        """
+        now = time.time()
+        try:
+            # The storage purges in short batches; only the index update needs the lock
+            urls = self.storage.purge('urls', now)
+            domains = self.storage.purge('domains', now)
+            with self.lock:
+                for domain in domains:
+                    # Skip domains blacklisted again since the purge deleted them
+                    if self.storage.get('domains', domain) is None:
+                        self._index_domain(domain, present=False)
+            shortened = self.storage.purge(
+                'shortened_urls', now,
+                max_age=self.shortened_ttl or None,
+                max_entries=self.shortened_max_entries or None
+            )
+        except Exception as e:
+            logger.error(f"Error purging URL blacklist: {str(e)}")
+            return 0
+            
+        purged = len(urls) + len(domains) + len(shortened)
+        if purged:
+            logger.info(
+                f"Purged {len(urls)} expired URLs, {len(domains)} expired domains, "
+                f"and {len(shortened)} shortened URL mappings from blacklist"
+            )
+        return purged
+        
+    def due_for_reverification(self, limit: int) -> List[Tuple[str, Dict]]:
+        """
+        Return blacklisted URLs whose re-verification time has passed.
+        
+        Args:
+            limit: Maximum number of entries to return
+            
+        Returns:
+            (url, metadata) pairs, the most overdue first
+        """
+        return self.storage.due_for_reverify('urls', time.time(), limit)
+        
+    def postpone_reverification(self, url: str, delay: float) -> None:
+        """
+        Push back the re-verification of a URL, e.g. after the check itself failed.
+        
+        Args:
+            url: The blacklisted URL
+            delay: Seconds from now until the next attempt
+        """
+        with self.lock:
+            entry = self.storage.get('urls', url)
+            if entry:
+                self.storage.put('urls', url, {**entry, 'reverify_at': time.time() + delay})
+            
+    def flush(self) -> None:
+        """Persist pending changes to disk immediately."""
+        self._save_recently_used()
+        self._save_blacklist()
             
     def close(self) -> None:
-        """Save the blacklist and clean up resources."""
-        self._save_blacklist() 
\ No newline at end of file
+        """Stop the background save thread and close the storage backend."""
+        self._stop_event.set()
+        # Let a save or purge in progress finish before its connection is closed
+        self._save_thread.join(timeout=5)
+        if self._save_thread.is_alive():
+            logger.warning("URL blacklist save thread still running after 5s; closing storage anyway")
+        self._save_recently_used()
+        try:
+            self.storage.close()
+        except Exception as e:
+            logger.error(f"Error closing URL blacklist storage: {str(e)}")
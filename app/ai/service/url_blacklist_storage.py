@@ -0,0 +1,645 @@
+"""
+URL blacklist storage backends.
+
+This module provides pluggable persistence for the URL blacklist. Every backend
+stores three kinds of entries, matching the sections of the legacy JSON file:
+
+- ``urls``: blacklisted URL -> metadata dict
+- ``domains``: blacklisted domain -> metadata dict
+- ``shortened_urls``: shortened URL -> expanded URL
+
+Metadata dicts may carry ``expires_at`` and ``reverify_at`` timestamps; backends
+index them so expired entries can be purged and entries due for re-verification
+found without scanning every value. Every backend also tracks when each entry was
+last written or used, which bounds the ``shortened_urls`` cache as an LRU.
+
+The SQLite backend (WAL mode) writes each change as a single indexed upsert and
+opens without loading the whole table into memory. The JSON backend keeps the
+original full-file format and is also used for import/export.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Entry kinds shared by all backends (also the top-level keys of the JSON format)
+BLACKLIST_KINDS = ('urls', 'domains', 'shortened_urls')
+
+# Rows deleted per purge transaction and entries written per import transaction,
+# so a large purge or import never holds the writer lock for long
+PURGE_BATCH_SIZE = 1000
+IMPORT_CHUNK_SIZE = 1000
+
+
+def entry_schedule(value: Any) -> Tuple[Optional[float], Optional[float]]:
+    """Return the (expires_at, reverify_at) timestamps of a stored value, if any."""
+    if isinstance(value, dict):
+        return value.get('expires_at'), value.get('reverify_at')
+    return None, None
+
+
+class BlacklistStorage(ABC):
+    """
+    Base interface for URL blacklist storage backends.
+
+    A backend missing one of the abstract methods fails when it is constructed.
+    """
+
+    @abstractmethod
+    def get(self, kind: str, key: str) -> Optional[Any]:
+        """Return the stored value for a key, or None if it is not stored."""
+
+    @abstractmethod
+    def put(self, kind: str, key: str, value: Any) -> None:
+        """Insert or replace a single entry."""
+
+    def put_many(self, kind: str, items: Iterable[Tuple[str, Any]]) -> int:
+        """
+        Insert or replace many entries at once.
+
+        Returns:
+            The number of entries written
+        """
+        count = 0
+        for key, value in items:
+            self.put(kind, key, value)
+            count += 1
+        return count
+
+    @abstractmethod
+    def delete(self, kind: str, key: str) -> bool:
+        """Delete an entry. Returns True if it existed."""
+
+    @abstractmethod
+    def iter_keys(self, kind: str) -> Iterator[str]:
+        """Iterate over all keys of a kind without loading their values."""
+
+    @abstractmethod
+    def iter_items(self, kind: str) -> Iterator[Tuple[str, Any]]:
+        """Iterate over all (key, value) pairs of a kind."""
+
+    @abstractmethod
+    def count(self, kind: str) -> int:
+        """Return the number of entries of a kind."""
+
+    @abstractmethod
+    def clear(self, kind: str) -> None:
+        """Delete every entry of a kind."""
+
+    @abstractmethod
+    def touch_many(self, kind: str, items: Iterable[Tuple[str, float]]) -> None:
+        """
+        Record when entries were last used, so LRU trimming keeps them.
+
+        Args:
+            kind: Entry kind
+            items: (key, last used timestamp) pairs; keys that are not stored are ignored
+        """
+
+    @abstractmethod
+    def purge(self, kind: str, now: float, max_age: Optional[float] = None,
+              max_entries: Optional[int] = None) -> List[str]:
+        """
+        Delete expired, stale and least recently used entries.
+
+        Args:
+            kind: Entry kind
+            now: Current timestamp
+            max_age: Delete entries not written or used within this many seconds
+            max_entries: Delete the least recently used entries beyond this count
+
+        Returns:
+            The deleted keys
+        """
+
+    @abstractmethod
+    def due_for_reverify(self, kind: str, now: float, limit: int) -> List[Tuple[str, Any]]:
+        """Return up to ``limit`` entries whose ``reverify_at`` has passed, oldest first."""
+
+    def changed_externally(self) -> bool:
+        """Return True if another process changed the stored entries since the last call."""
+        return False
+
+    def flush(self) -> None:
+        """Persist pending changes, if the backend buffers writes."""
+
+    def close(self) -> None:
+        """Flush and release resources."""
+        self.flush()
+
+
+class JSONBlacklistStorage(BlacklistStorage):
+    """
+    Legacy storage that keeps everything in memory and rewrites one JSON file.
+
+    Writes only mark the storage as modified; ``flush()`` serialises a snapshot
+    of the data and atomically replaces the file.
+
+    Snapshots are copy-on-write: ``flush()`` and ``purge()`` take references to
+    the current dicts in O(1) and work on them outside the lock, and the next
+    writer of a shared kind copies its dicts before changing them. Readers never
+    take the lock.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize the JSON storage.
+
+        Args:
+            path: Path to the JSON file
+        """
+        self.path = path
+        self.data: Dict[str, Dict[str, Any]] = {kind: {} for kind in BLACKLIST_KINDS}
+        # Last write/use time per entry, persisted alongside the data for LRU trimming
+        self.used_at: Dict[str, Dict[str, float]] = {kind: {} for kind in BLACKLIST_KINDS}
+        self.modified = False
+        self.lock = threading.RLock()
+        # Number of snapshots sharing the current dicts of each kind
+        self._shared: Dict[str, int] = {kind: 0 for kind in BLACKLIST_KINDS}
+        self._load()
+
+    def _load(self) -> None:
+        """Load the JSON file if it exists."""
+        if not os.path.exists(self.path):
+            logger.info(f"No existing URL blacklist JSON found at {self.path}")
+            return
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+            now = time.time()
+            used_at = raw.get('used_at', {})
+            for kind in BLACKLIST_KINDS:
+                self.data[kind] = raw.get(kind, {})
+                known = used_at.get(kind, {})
+                # Entries from files written before usage tracking count as used at load time
+                self.used_at[kind] = {key: known.get(key, now) for key in self.data[kind]}
+        except Exception as e:
+            logger.error(f"Error loading URL blacklist JSON {self.path}: {str(e)}")
+
+    def _share(self, kinds: Iterable[str]) -> Dict[str, Tuple[Dict[str, Any], Dict[str, float]]]:
+        """Return the current dicts of some kinds and mark them copy-on-write (caller holds the lock)."""
+        shared = {}
+        for kind in kinds:
+            self._shared[kind] += 1
+            shared[kind] = (self.data[kind], self.used_at[kind])
+        return shared
+
+    def _release(self, shared: Dict[str, Tuple[Dict[str, Any], Dict[str, float]]]) -> None:
+        """Drop snapshot references taken by ``_share``."""
+        with self.lock:
+            for kind, (entries, _) in shared.items():
+                # A writer that already copied the dicts reset the count for the new ones
+                if self.data[kind] is entries and self._shared[kind]:
+                    self._shared[kind] -= 1
+
+    def _writable(self, kind: str) -> Tuple[Dict[str, Any], Dict[str, float]]:
+        """Return the dicts of a kind for writing, copying them first if a snapshot shares them (caller holds the lock)."""
+        if self._shared[kind]:
+            self.data[kind] = dict(self.data[kind])
+            self.used_at[kind] = dict(self.used_at[kind])
+            self._shared[kind] = 0
+        return self.data[kind], self.used_at[kind]
+
+    def get(self, kind: str, key: str) -> Optional[Any]:
+        return self.data[kind].get(key)
+
+    def put(self, kind: str, key: str, value: Any) -> None:
+        with self.lock:
+            entries, used_at = self._writable(kind)
+            entries[key] = value
+            used_at[key] = time.time()
+            self.modified = True
+
+    def put_many(self, kind: str, items: Iterable[Tuple[str, Any]]) -> int:
+        with self.lock:
+            entries, used_at = self._writable(kind)
+            before = len(entries)
+            now = time.time()
+            count = 0
+            for key, value in items:
+                entries[key] = value
+                used_at[key] = now
+                count += 1
+            if count or len(entries) != before:
+                self.modified = True
+            return count
+
+    def delete(self, kind: str, key: str) -> bool:
+        with self.lock:
+            if key not in self.data[kind]:
+                return False
+            entries, used_at = self._writable(kind)
+            del entries[key]
+            used_at.pop(key, None)
+            self.modified = True
+            return True
+
+    def iter_keys(self, kind: str) -> Iterator[str]:
+        return iter(list(self.data[kind].keys()))
+
+    def iter_items(self, kind: str) -> Iterator[Tuple[str, Any]]:
+        return iter(list(self.data[kind].items()))
+
+    def count(self, kind: str) -> int:
+        return len(self.data[kind])
+
+    def clear(self, kind: str) -> None:
+        with self.lock:
+            self.data[kind] = {}
+            self.used_at[kind] = {}
+            self._shared[kind] = 0
+            self.modified = True
+
+    def touch_many(self, kind: str, items: Iterable[Tuple[str, float]]) -> None:
+        with self.lock:
+            entries, used_at = self._writable(kind)
+            for key, timestamp in items:
+                if key in entries:
+                    # Not worth a file rewrite on its own; saved with the next change
+                    used_at[key] = max(used_at.get(key, 0), timestamp)
+
+    def purge(self, kind: str, now: float, max_age: Optional[float] = None,
+              max_entries: Optional[int] = None) -> List[str]:
+        with self.lock:
+            shared = self._share([kind])
+        try:
+            # Pick the victims from the snapshot without holding the lock
+            entries, used_at = shared[kind]
+            candidates = []
+            for key, value in entries.items():
+                expires_at, _ = entry_schedule(value)
+                if (expires_at is not None and expires_at <= now) or \
+                        (max_age is not None and used_at.get(key, now) < now - max_age):
+                    candidates.append(key)
+            if max_entries is not None and len(entries) - len(candidates) > max_entries:
+                stale = set(candidates)
+                remaining = sorted((k for k in entries if k not in stale), key=lambda k: used_at.get(k, now))
+                candidates.extend(remaining[:len(remaining) - max_entries])
+        finally:
+            self._release(shared)
+        if not candidates:
+            return []
+
+        deleted = []
+        for start in range(0, len(candidates), PURGE_BATCH_SIZE):
+            with self.lock:
+                current, current_used_at = self._writable(kind)
+                for key in candidates[start:start + PURGE_BATCH_SIZE]:
+                    # Keep entries rewritten or used since the snapshot was taken
+                    if key in current and current[key] is entries[key] and \
+                            current_used_at.get(key) == used_at.get(key):
+                        del current[key]
+                        current_used_at.pop(key, None)
+                        deleted.append(key)
+                if deleted:
+                    self.modified = True
+        return deleted
+
+    def due_for_reverify(self, kind: str, now: float, limit: int) -> List[Tuple[str, Any]]:
+        due = []
+        for key, value in list(self.data[kind].items()):
+            _, reverify_at = entry_schedule(value)
+            if reverify_at is not None and reverify_at <= now:
+                due.append((reverify_at, key, value))
+        due.sort(key=lambda item: item[0])
+        return [(key, value) for _, key, value in due[:limit]]
+
+    def flush(self) -> None:
+        """Write the whole file if anything changed since the last flush."""
+        with self.lock:
+            if not self.modified:
+                return
+            shared = self._share(BLACKLIST_KINDS)
+            self.modified = False
+
+        snapshot = {kind: entries for kind, (entries, _) in shared.items()}
+        snapshot['used_at'] = {kind: used_at for kind, (_, used_at) in shared.items()}
+        try:
+            write_json_file(self.path, snapshot)
+            logger.info(
+                f"Saved URL blacklist JSON with {len(snapshot['urls'])} URLs, "
+                f"{len(snapshot['domains'])} domains, and {len(snapshot['shortened_urls'])} shortened URLs"
+            )
+        except Exception as e:
+            with self.lock:
+                self.modified = True
+            logger.error(f"Error saving URL blacklist JSON: {str(e)}")
+        finally:
+            self._release(shared)
+
+
+class SQLiteBlacklistStorage(BlacklistStorage):
+    """
+    SQLite storage in WAL mode with one row per entry.
+
+    Writes are single-row upserts committed immediately, so the cost of a change
+    does not depend on the size of the blacklist. Each thread reads through its
+    own connection, so lookups never wait behind a write transaction. Purges
+    delete in batches of ``PURGE_BATCH_SIZE`` rows, one short transaction each.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize the SQLite storage.
+
+        Args:
+            path: Path to the SQLite database file
+        """
+        self.path = path
+        self.lock = threading.RLock()  # Serialises writers
+        self._local = threading.local()
+        self._write_conn = self._connect()
+        self._create_tables()
+        self._data_version = self._write_conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection configured for concurrent readers."""
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _read_conn(self) -> sqlite3.Connection:
+        """Return the calling thread's read connection."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def _create_tables(self) -> None:
+        """Create the entries table if it doesn't exist."""
+        with self.lock:
+            self._write_conn.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                expires_at REAL,
+                reverify_at REAL,
+                PRIMARY KEY (kind, key)
+            ) WITHOUT ROWID
+            ''')
+            # Databases created before expiry support lack the schedule columns
+            columns = {row[1] for row in self._write_conn.execute('PRAGMA table_info(entries)')}
+            for column in ('expires_at', 'reverify_at'):
+                if column not in columns:
+                    self._write_conn.execute(f'ALTER TABLE entries ADD COLUMN {column} REAL')
+            self._write_conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_entries_updated ON entries (kind, updated_at)'
+            )
+            self._write_conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_entries_expires ON entries (kind, expires_at) '
+                'WHERE expires_at IS NOT NULL'
+            )
+            self._write_conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_entries_reverify ON entries (kind, reverify_at) '
+                'WHERE reverify_at IS NOT NULL'
+            )
+
+    def get(self, kind: str, key: str) -> Optional[Any]:
+        row = self._read_conn().execute(
+            'SELECT value FROM entries WHERE kind = ? AND key = ?', (kind, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    @staticmethod
+    def _row(kind: str, key: str, value: Any, now: float) -> Tuple:
+        """Build the column values for an entry."""
+        expires_at, reverify_at = entry_schedule(value)
+        return (kind, key, json.dumps(value, ensure_ascii=False), now, expires_at, reverify_at)
+
+    def put(self, kind: str, key: str, value: Any) -> None:
+        with self.lock:
+            self._write_conn.execute(
+                'INSERT OR REPLACE INTO entries (kind, key, value, updated_at, expires_at, reverify_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                self._row(kind, key, value, time.time())
+            )
+
+    def put_many(self, kind: str, items: Iterable[Tuple[str, Any]]) -> int:
+        now = time.time()
+        rows = [self._row(kind, key, value, now) for key, value in items]
+        if not rows:
+            return 0
+        with self.lock:
+            conn = self._write_conn
+            conn.execute('BEGIN')
+            try:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO entries (kind, key, value, updated_at, expires_at, reverify_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    rows
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return len(rows)
+
+    def delete(self, kind: str, key: str) -> bool:
+        with self.lock:
+            cursor = self._write_conn.execute(
+                'DELETE FROM entries WHERE kind = ? AND key = ?', (kind, key)
+            )
+            return cursor.rowcount > 0
+
+    def iter_keys(self, kind: str) -> Iterator[str]:
+        cursor = self._read_conn().execute('SELECT key FROM entries WHERE kind = ?', (kind,))
+        for (key,) in cursor:
+            yield key
+
+    def iter_items(self, kind: str) -> Iterator[Tuple[str, Any]]:
+        cursor = self._read_conn().execute('SELECT key, value FROM entries WHERE kind = ?', (kind,))
+        for key, value in cursor:
+            yield key, json.loads(value)
+
+    def count(self, kind: str) -> int:
+        row = self._read_conn().execute(
+            'SELECT COUNT(*) FROM entries WHERE kind = ?', (kind,)
+        ).fetchone()
+        return row[0]
+
+    def clear(self, kind: str) -> None:
+        with self.lock:
+            self._write_conn.execute('DELETE FROM entries WHERE kind = ?', (kind,))
+
+    def touch_many(self, kind: str, items: Iterable[Tuple[str, float]]) -> None:
+        rows = [(timestamp, kind, key) for key, timestamp in items]
+        if not rows:
+            return
+        with self.lock:
+            conn = self._write_conn
+            conn.execute('BEGIN')
+            try:
+                conn.executemany(
+                    'UPDATE entries SET updated_at = MAX(updated_at, ?) WHERE kind = ? AND key = ?', rows
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def _delete_batches(self, kind: str, condition: str, params: Tuple, limit: Optional[int] = None) -> List[str]:
+        """
+        Delete matching entries of a kind in batches, releasing the writer lock between them.
+
+        Args:
+            kind: Entry kind
+            condition: SQL condition on the entry columns, or '' for the least recently used entries
+            params: Parameters of the condition
+            limit: Maximum number of entries to delete (None = all matching)
+
+        Returns:
+            The deleted keys
+        """
+        if condition:
+            select = f'SELECT key FROM entries WHERE kind = ? AND {condition} LIMIT ?'
+        else:
+            select = 'SELECT key FROM entries WHERE kind = ? ORDER BY updated_at LIMIT ?'
+        deleted = []
+        while limit is None or len(deleted) < limit:
+            batch_size = PURGE_BATCH_SIZE if limit is None else min(PURGE_BATCH_SIZE, limit - len(deleted))
+            with self.lock:
+                batch = [key for (key,) in self._write_conn.execute(
+                    f'DELETE FROM entries WHERE kind = ? AND key IN ({select}) RETURNING key',
+                    (kind, kind, *params, batch_size)
+                )]
+            deleted.extend(batch)
+            if len(batch) < batch_size:
+                break
+        return deleted
+
+    def purge(self, kind: str, now: float, max_age: Optional[float] = None,
+              max_entries: Optional[int] = None) -> List[str]:
+        deleted = self._delete_batches(kind, 'expires_at <= ?', (now,))
+        if max_age is not None:
+            deleted.extend(self._delete_batches(kind, 'updated_at < ?', (now - max_age,)))
+        if max_entries is not None:
+            excess = self.count(kind) - max_entries
+            if excess > 0:
+                deleted.extend(self._delete_batches(kind, '', (), limit=excess))
+        return deleted
+
+    def due_for_reverify(self, kind: str, now: float, limit: int) -> List[Tuple[str, Any]]:
+        cursor = self._read_conn().execute(
+            'SELECT key, value FROM entries WHERE kind = ? AND reverify_at <= ? ORDER BY reverify_at LIMIT ?',
+            (kind, now, limit)
+        )
+        return [(key, json.loads(value)) for key, value in cursor]
+
+    def changed_externally(self) -> bool:
+        """
+        Return True if another connection committed since the last call.
+
+        ``PRAGMA data_version`` only changes for commits made through other
+        connections, and this process writes through the writer connection only,
+        so a change means e.g. a threat feed import run from the command line.
+        """
+        with self.lock:
+            version = self._write_conn.execute('PRAGMA data_version').fetchone()[0]
+            changed = version != self._data_version
+            self._data_version = version
+        return changed
+
+    def flush(self) -> None:
+        """Fold the WAL back into the database file."""
+        with self.lock:
+            try:
+                self._write_conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+            except sqlite3.Error as e:
+                logger.warning(f"URL blacklist WAL checkpoint failed: {str(e)}")
+
+    def close(self) -> None:
+        self.flush()
+        with self.lock:
+            self._write_conn.close()
+
+
+def create_blacklist_storage(backend: str, path: str) -> BlacklistStorage:
+    """
+    Create a storage backend by name.
+
+    Args:
+        backend: 'sqlite' or 'json'
+        path: File path for the backend
+
+    Returns:
+        The storage instance
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    backend = (backend or 'sqlite').lower()
+    if backend == 'json':
+        return JSONBlacklistStorage(path)
+    if backend == 'sqlite':
+        return SQLiteBlacklistStorage(path)
+    raise ValueError(f"Unknown URL blacklist storage backend: {backend}")
+
+
+def write_json_file(path: str, data: Dict[str, Dict[str, Any]]) -> None:
+    """Write blacklist data in the JSON format, replacing the file atomically."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({**data, 'last_updated': time.time()}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def import_json_file(storage: BlacklistStorage, path: str) -> int:
+    """
+    Copy every entry from a blacklist JSON file into a storage backend.
+
+    Args:
+        storage: Destination storage
+        path: Path to the JSON file
+
+    Returns:
+        The number of entries imported
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+
+    imported = 0
+    for kind in BLACKLIST_KINDS:
+        items = iter(raw.get(kind, {}).items())
+        # Chunked so writers on other threads are not blocked for the whole import
+        while True:
+            chunk = list(islice(items, IMPORT_CHUNK_SIZE))
+            if not chunk:
+                break
+            imported += storage.put_many(kind, chunk)
+    logger.info(f"Imported {imported} URL blacklist entries from {path}")
+    return imported
+
+
+def export_json_file(storage: BlacklistStorage, path: str) -> int:
+    """
+    Write every entry of a storage backend to a blacklist JSON file.
+
+    Args:
+        storage: Source storage
+        path: Destination JSON file
+
+    Returns:
+        The number of entries exported
+    """
+    data = {kind: dict(storage.iter_items(kind)) for kind in BLACKLIST_KINDS}
+    write_json_file(path, data)
+    exported = sum(len(entries) for entries in data.values())
+    logger.info(f"Exported {exported} URL blacklist entries to {path}")
+    return exported
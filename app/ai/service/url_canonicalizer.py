@@ -0,0 +1,150 @@
+"""
+URL canonicalisation.
+
+This module turns the many spellings of the same URL into one canonical string,
+so the URL blacklist and every URL cache key on the same value. For example
+``HTTPS://Bit.ly:443/abc/?utm_source=x#top`` and ``https://bit.ly/abc``
+both canonicalise to ``https://bit.ly/abc``.
+
+Rules applied:
+1. Scheme and host are lower-cased; a missing scheme defaults to https
+2. Internationalised hosts are converted to their IDNA (punycode) form
+3. User info, default ports (80/443) and the host's trailing dot are removed
+4. Percent-encoding is normalised: unreserved characters are decoded and the
+   remaining escapes use upper-case hex digits
+5. Dot segments are resolved, an empty path becomes ``/`` and a trailing slash
+   on any other path is removed
+6. Tracking query parameters (``utm_*``, ``fbclid``, ...) and the fragment are dropped
+"""
+import re
+import logging
+from typing import List
+from urllib.parse import urlsplit, urlunsplit
+
+from app.config import URL_CANONICAL_STRIP_PARAMS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# RFC 3986 unreserved characters, which never need percent-encoding
+UNRESERVED_CHARS = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~')
+
+PERCENT_ESCAPE_PATTERN = re.compile(r'%([0-9A-Fa-f]{2})')
+
+# Tracking parameters, matched exactly or by prefix when the entry ends with '*'
+_STRIP_EXACT = frozenset(p.lower() for p in URL_CANONICAL_STRIP_PARAMS if not p.endswith('*'))
+_STRIP_PREFIXES = tuple(p[:-1].lower() for p in URL_CANONICAL_STRIP_PARAMS if p.endswith('*'))
+
+
+def _normalize_escape(match: re.Match) -> str:
+    """Decode an unreserved escape, otherwise upper-case its hex digits."""
+    char = chr(int(match.group(1), 16))
+    if char in UNRESERVED_CHARS:
+        return char
+    return '%' + match.group(1).upper()
+
+
+def _normalize_percent_encoding(text: str) -> str:
+    """Normalise percent-encoding in a path or query component."""
+    if '%' not in text:
+        return text
+    return PERCENT_ESCAPE_PATTERN.sub(_normalize_escape, text)
+
+
+def _remove_dot_segments(path: str) -> str:
+    """Resolve '.' and '..' segments as described in RFC 3986 section 5.2.4."""
+    if '.' not in path:
+        return path
+
+    output: List[str] = []
+    for segment in path.split('/'):
+        if segment == '..':
+            if len(output) > 1:
+                output.pop()
+        elif segment != '.':
+            output.append(segment)
+
+    # Keep the trailing slash that '.' or '..' at the end implies
+    if path.endswith(('/.', '/..')):
+        output.append('')
+    return '/'.join(output)
+
+
+def _normalize_host(host: str) -> str:
+    """Lower-case the host and convert internationalised names to IDNA."""
+    host = host.rstrip('.').lower()
+    if host.isascii():
+        return host
+    try:
+        return host.encode('idna').decode('ascii')
+    except UnicodeError:
+        logger.debug(f"Could not IDNA-encode host: {host}")
+        return host
+
+
+def _is_tracking_param(name: str) -> bool:
+    """Return True if a query parameter name is a known tracking parameter."""
+    name = name.lower()
+    return name in _STRIP_EXACT or (bool(_STRIP_PREFIXES) and name.startswith(_STRIP_PREFIXES))
+
+
+def _normalize_query(query: str) -> str:
+    """Drop tracking parameters and normalise escapes, preserving parameter order."""
+    if not query:
+        return ''
+
+    kept = []
+    for pair in query.split('&'):
+        if not pair:
+            continue
+        name = pair.split('=', 1)[0]
+        if _is_tracking_param(name):
+            continue
+        kept.append(_normalize_percent_encoding(pair))
+    return '&'.join(kept)
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Return the canonical form of a URL.
+
+    URLs that cannot be parsed are returned stripped but otherwise unchanged,
+    so callers can always use the result as a cache key.
+
+    Args:
+        url: The URL to canonicalise
+
+    Returns:
+        The canonical URL string
+    """
+    if not url:
+        return url
+
+    url = url.strip()
+    if '://' not in url:
+        url = 'https://' + url
+
+    try:
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        host = _normalize_host(parts.hostname or '')
+        port = parts.port
+    except ValueError:
+        return url
+
+    if not host:
+        return url
+
+    netloc = host
+    if ':' in host:
+        netloc = f"[{host}]"  # IPv6 literal
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+
+    path = _remove_dot_segments(_normalize_percent_encoding(parts.path)) or '/'
+    if len(path) > 1 and path.endswith('/'):
+        path = path.rstrip('/') or '/'
+
+    query = _normalize_query(parts.query)
+    return urlunsplit((scheme, netloc, path, query, ''))
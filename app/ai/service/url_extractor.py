@@ -0,0 +1,70 @@
+"""
+URL extraction.
+
+This module finds the URLs in a message once, with a precompiled pattern, so
+every moderation stage (immediate blacklist check, queued safety check,
+retroactive enforcement) can share the result. Besides bare links it
+understands the Discord ``<url>`` form (links with the embed suppressed) and
+markdown links ``[text](url)``, whose targets may contain characters the bare
+pattern stops at.
+"""
+import re
+from typing import List
+
+# Bare URL pattern (scheme, host, path, query, fragment)
+URL_PATTERN = r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+[/\w\.-]*(?:\?[-\w%&=.]*)?(?:#[-\w]*)?'
+
+# Delimited forms first, so their full URL wins over the bare match inside them
+URL_REGEX = re.compile(
+    r'<(https?://[^\s<>]+)>'
+    r'|\]\(\s*<?(https?://(?:[^\s()<>]|\([^\s()<>]*\))+)>?(?:\s+"[^"]*")?\s*\)'
+    r'|(' + URL_PATTERN + r')',
+    re.IGNORECASE
+)
+
+
+def extract_urls(text: str) -> List[str]:
+    """
+    Extract the unique URLs of a text, in order of appearance.
+
+    Args:
+        text: The text to extract URLs from
+
+    Returns:
+        A list of unique URLs
+    """
+    # Fast reject: every supported form contains a scheme separator
+    if not text or '://' not in text:
+        return []
+
+    seen = set()
+    urls = []
+    for match in URL_REGEX.finditer(text):
+        angle, markdown, bare = match.groups()
+        # A sentence ending right after a bare link is not part of it
+        url = angle or markdown or bare.rstrip('.')
+        if url not in seen:
+            seen.add(url)
+            urls.append(url)
+    return urls
+
+
+class MessageURLAnalysis:
+    """The URLs of one message, extracted once and passed to every moderation stage."""
+
+    __slots__ = ('text', 'urls')
+
+    def __init__(self, text: str):
+        """
+        Analyse a message text.
+
+        Args:
+            text: The message content
+        """
+        self.text = (text or '').strip()
+        self.urls = extract_urls(self.text)
+
+    @property
+    def has_urls(self) -> bool:
+        """Whether the message contains any URL."""
+        return bool(self.urls)
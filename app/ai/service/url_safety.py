@@ -3,7 +3,6 @@ URL safety checking service.
 
 This module provides functionality to check URLs for safety using third-party virus detection APIs.
 """
-import re
 import logging
 import aiohttp
 import asyncio
@@ -11,6 +10,7 @@ from typing import Dict, List, Tuple, Optional
 from datetime import datetime
 import urllib.parse
 import random
+import time
 
 from app.config import (
     URL_SAFETY_CHECK_API,
@@ -20,22 +20,75 @@ from app.config import (
     URL_SAFETY_MAX_RETRIES,
     URL_SAFETY_RETRY_DELAY,
     URL_SAFETY_REQUEST_TIMEOUT,
+    URL_SAFETY_COALESCE_TTL,
+    URL_SAFETY_CONCURRENT_CHECKS,
+    URL_SAFETY_VT_REQUESTS_PER_MINUTE,
+    URL_SAFETY_VT_REQUESTS_PER_DAY,
+    URL_SAFETY_VT_MAX_WAIT,
+    URL_SAFETY_VT_HIGH_PRIORITY_MAX_WAIT,
+    URL_SAFETY_ASYNC_ANALYSIS,
+    URL_SAFETY_ANALYSIS_DB,
+    URL_SAFETY_ANALYSIS_POLL_INTERVAL,
+    URL_SAFETY_ANALYSIS_POLL_BATCH,
+    URL_SAFETY_ANALYSIS_MAX_AGE,
     URL_SAFETY_MAX_URLS,
+    URL_SAFE_CACHE_ENABLED,
+    URL_SAFE_CACHE_TTL,
+    URL_SAFE_CACHE_MAX_ENTRIES,
+    URL_SAFE_DOMAINS,
+    URL_SAFETY_IMPERSONATION_DOMAINS,
+    URL_SAFETY_PROTECTED_DOMAINS,
+    URL_IMPERSONATION_CHECK_ENABLED,
+    URL_IMPERSONATION_THRESHOLD,
+    URL_IMPERSONATION_LURE_WORDS,
+    URL_IMPERSONATION_ALLOWED_DOMAINS,
     URL_UNSHORTEN_ENABLED,
     URL_BLACKLIST_ENABLED,
     URL_BLACKLIST_FILE,
-    URL_BLACKLIST_AUTO_DOMAIN
+    URL_BLACKLIST_STORAGE,
+    URL_BLACKLIST_DB_FILE,
+    URL_BLACKLIST_AUTO_DOMAIN,
+    URL_BLACKLIST_BLOOM_ENABLED,
+    URL_BLACKLIST_BLOOM_CAPACITY,
+    URL_BLACKLIST_BLOOM_ERROR_RATE,
+    URL_BLACKLIST_BLOOM_MAX_MB,
+    URL_BLACKLIST_URL_TTL_DAYS,
+    URL_BLACKLIST_DOMAIN_TTL_DAYS,
+    URL_BLACKLIST_REVERIFY_DAYS,
+    URL_BLACKLIST_REVERIFY_BATCH,
+    URL_BLACKLIST_REVERIFY_INTERVAL,
+    URL_BLACKLIST_SHORTENED_TTL_DAYS,
+    URL_BLACKLIST_SHORTENED_MAX_ENTRIES
 )
 from app.ai.service.url_unshortener import URLUnshortener
 from app.ai.service.url_blacklist import URLBlacklist
+from app.ai.service.url_canonicalizer import canonicalize_url
+from app.ai.service.domain_index import DomainSuffixIndex, extract_host
+from app.ai.service.ttl_cache import TTLCache
+from app.ai.service.impersonation_detector import ImpersonationDetector
+from app.ai.service.analysis_tracker import AnalysisTracker
+from app.ai.service.url_extractor import extract_urls
+from app.ai.service.virustotal_scheduler import (
+    VirusTotalScheduler,
+    PRIORITY_HIGH,
+    PRIORITY_NORMAL,
+    PRIORITY_LOW
+)
+from app.services.http_client import get_http_session
 
 logger = logging.getLogger(__name__)
 
-# URL pattern for detection
-URL_PATTERN = r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+[/\w\.-]*(?:\?[-\w%&=.]*)?(?:#[-\w]*)?'
-
 class URLSafetyChecker:
-    """Check URLs for safety using third-party virus detection tools."""
+    """
+    Check URLs for safety using third-party virus detection tools.
+    
+    A single instance is meant to live for the whole process: it owns the URL
+    blacklist and the URL unshortener, so every caller shares the same state.
+    Outbound API calls go through the process-wide pooled HTTP session (see
+    ``app.services.http_client``). Call ``start()`` once before
+    use, ``flush()`` to persist pending blacklist changes and ``close()`` on
+    shutdown.
+    """
     
     def __init__(self, api_key: Optional[str] = None):
         """
@@ -58,52 +111,325 @@ class URLSafetyChecker:
         # Initialize URL blacklist if enabled
         self.blacklist_enabled = URL_BLACKLIST_ENABLED
         if self.blacklist_enabled:
-            self.blacklist = URLBlacklist(URL_BLACKLIST_FILE)
+            self.blacklist = URLBlacklist(
+                URL_BLACKLIST_FILE,
+                storage_backend=URL_BLACKLIST_STORAGE,
+                db_file=URL_BLACKLIST_DB_FILE,
+                bloom_enabled=URL_BLACKLIST_BLOOM_ENABLED,
+                bloom_capacity=URL_BLACKLIST_BLOOM_CAPACITY,
+                bloom_error_rate=URL_BLACKLIST_BLOOM_ERROR_RATE,
+                bloom_max_bytes=int(URL_BLACKLIST_BLOOM_MAX_MB * 1024 * 1024),
+                url_ttl=URL_BLACKLIST_URL_TTL_DAYS * 86400 or None,
+                domain_ttl=URL_BLACKLIST_DOMAIN_TTL_DAYS * 86400 or None,
+                reverify_interval=URL_BLACKLIST_REVERIFY_DAYS * 86400 or None,
+                shortened_ttl=URL_BLACKLIST_SHORTENED_TTL_DAYS * 86400 or None,
+                shortened_max_entries=URL_BLACKLIST_SHORTENED_MAX_ENTRIES or None
+            )
         else:
             self.blacklist = None
+            
+        # Known-safe verdicts, keyed by canonical URL, and trusted domains
+        self.safe_cache = TTLCache(URL_SAFE_CACHE_MAX_ENTRIES, URL_SAFE_CACHE_TTL) if URL_SAFE_CACHE_ENABLED else None
+        self.safe_domains = DomainSuffixIndex(URL_SAFE_DOMAINS) if URL_SAFE_DOMAINS else None
+        
+        # Quota-aware scheduling of VirusTotal requests; background work only uses idle quota
+        self.vt_scheduler = VirusTotalScheduler(
+            URL_SAFETY_VT_REQUESTS_PER_MINUTE,
+            URL_SAFETY_VT_REQUESTS_PER_DAY,
+            max_wait={
+                PRIORITY_HIGH: URL_SAFETY_VT_HIGH_PRIORITY_MAX_WAIT,
+                PRIORITY_NORMAL: URL_SAFETY_VT_MAX_WAIT,
+                PRIORITY_LOW: 0
+            }
+        )
+        
+        # Newly submitted URLs are finished in the background instead of blocking the caller;
+        # on_retroactive_unsafe(url, result, watchers) is awaited when one turns out unsafe
+        if URL_SAFETY_ASYNC_ANALYSIS and self.api == 'virustotal':
+            self.analysis_tracker = AnalysisTracker(
+                URL_SAFETY_ANALYSIS_DB,
+                poll_interval=URL_SAFETY_ANALYSIS_POLL_INTERVAL
+            )
+        else:
+            self.analysis_tracker = None
+        self.on_retroactive_unsafe = None
+        self._analysis_task: Optional[asyncio.Task] = None
+        
+        # Single-flight: concurrent checks of the same canonical URL share one task, and
+        # finished verdicts are shared for a short while with callers that arrive late
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._inflight_waiters: Dict[str, int] = {}
+        self.recent_verdicts = TTLCache(URL_SAFE_CACHE_MAX_ENTRIES, URL_SAFETY_COALESCE_TTL) if URL_SAFETY_COALESCE_TTL > 0 else None
+        self.coalesced_checks = 0
+        
+        # Local typosquat / impersonation detection (no network access)
+        if URL_IMPERSONATION_CHECK_ENABLED:
+            self.impersonation_detector = ImpersonationDetector(
+                URL_SAFETY_PROTECTED_DOMAINS,
+                impersonation_keywords=URL_SAFETY_IMPERSONATION_DOMAINS,
+                lure_words=URL_IMPERSONATION_LURE_WORDS,
+                threshold=URL_IMPERSONATION_THRESHOLD,
+                allowed_domains=URL_IMPERSONATION_ALLOWED_DOMAINS
+            )
+        else:
+            self.impersonation_detector = None
+        
+        # Per-request timeout for API calls on the shared HTTP session
+        self.http_timeout = aiohttp.ClientTimeout(total=self.request_timeout)
+        self.started = False
+        self._reverify_task: Optional[asyncio.Task] = None
+        
+    async def start(self) -> None:
+        """Open the shared HTTP session and start background tasks."""
+        if self.started:
+            return
+            
+        # Open the pooled session now so the first URL check does not pay for it
+        await get_http_session()
+        
+        # Periodically re-check blacklisted URLs whose verdict may be stale
+        if self.blacklist and URL_BLACKLIST_REVERIFY_DAYS > 0 and self.api == 'virustotal' and self.api_key:
+            self._reverify_task = asyncio.create_task(self._reverify_loop())
+            
+        # Finish submitted analyses, including those left over from before a restart
+        if self.analysis_tracker and self.api_key:
+            self._analysis_task = asyncio.create_task(self._analysis_poll_loop())
+            
+        self.started = True
+        logger.info("URL safety checker started")
+        
+    def flush(self) -> None:
+        """Persist any pending blacklist changes and cached unshortening results immediately."""
+        if self.blacklist:
+            self.blacklist.flush()
+        self.unshortener.flush()
+            
+    async def close(self) -> None:
+        """Flush state and release the browser and blacklist resources."""
+        for task in (self._reverify_task, self._analysis_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._reverify_task = None
+        self._analysis_task = None
+            
+        for task in list(self._inflight.values()):
+            task.cancel()
+        self._inflight.clear()
+        await self.vt_scheduler.close()
+            
+        self.unshortener.close()
+        
+        if self.blacklist:
+            self.blacklist.close()
+            
+        if self.analysis_tracker:
+            logger.info(f"VirusTotal analyses still pending: {self.analysis_tracker.count()}")
+            self.analysis_tracker.close()
+            
+        self.started = False
+        if self.safe_cache is not None:
+            logger.info(f"Safe URL verdict cache: {self.safe_cache.stats()}")
+        logger.info(f"URL checks coalesced with an in-flight check: {self.coalesced_checks}")
+        logger.info(f"VirusTotal scheduler: {self.vt_scheduler.stats()}")
+        if self.recent_verdicts is not None:
+            logger.info(f"Recent URL verdicts shared with late callers: {self.recent_verdicts.stats()}")
+        logger.info("URL safety checker closed")
+        
+    async def reverify_blacklist(self) -> Dict[str, int]:
+        """
+        Re-check blacklisted URLs that are due for re-verification.
+        
+        URLs that are still unsafe are renewed, and URLs with a completed safe
+        verdict are removed. URLs whose check failed or ended without a verdict
+        (errors, queued or failed analyses) are retried after the next interval,
+        so an inconclusive check never lifts a block. Checks run at low priority,
+        so they only use idle API quota.
+        
+        Returns:
+            Counts of renewed, removed and postponed URLs
+        """
+        stats = {'renewed': 0, 'removed': 0, 'postponed': 0}
+        due = self.blacklist.due_for_reverification(URL_BLACKLIST_REVERIFY_BATCH)
+        for url, entry in due:
+            is_unsafe, result = await self.check_url(url, PRIORITY_LOW)
+            if result.get('error') or result.get('pending'):
+                self.blacklist.postpone_reverification(url, URL_BLACKLIST_REVERIFY_INTERVAL)
+                stats['postponed'] += 1
+            elif is_unsafe:
+                self.blacklist.add_unsafe_result(url, result)
+                stats['renewed'] += 1
+            elif self._is_cacheable_safe_result(result):
+                self.blacklist.remove_url(url)
+                stats['removed'] += 1
+            else:
+                logger.info(f"Re-verification of {url} ended without a verdict: {result.get('message')}")
+                self.blacklist.postpone_reverification(url, URL_BLACKLIST_REVERIFY_INTERVAL)
+                stats['postponed'] += 1
+                
+        if due:
+            logger.info(f"Blacklist re-verification: {stats}")
+        return stats
+        
+    async def _reverify_loop(self) -> None:
+        """Run blacklist re-verification rounds until the checker is closed."""
+        while True:
+            await asyncio.sleep(URL_BLACKLIST_REVERIFY_INTERVAL)
+            try:
+                await self.reverify_blacklist()
+            except Exception as e:
+                logger.error(f"Error re-verifying URL blacklist: {str(e)}")
+                
+    def watch_pending(self, results: Dict, guild_id: int, channel_id: int, message_id: int, author_id: int) -> int:
+        """
+        Remember a message whose URLs are still being analysed.
+        
+        When a tracked analysis later turns out unsafe, the message is passed to
+        ``on_retroactive_unsafe`` so it can be enforced after the fact.
+        
+        Args:
+            results: Results from ``check_urls``
+            guild_id: Guild of the message
+            channel_id: Channel of the message
+            message_id: The message
+            author_id: Author of the message
+            
+        Returns:
+            Number of pending analyses the message was attached to
+        """
+        if not self.analysis_tracker:
+            return 0
+            
+        analysis_ids = {
+            result['analysis_id'] for result in results.values()
+            if result.get('pending') and result.get('analysis_id')
+        }
+        for analysis_id in analysis_ids:
+            self.analysis_tracker.watch(analysis_id, guild_id, channel_id, message_id, author_id)
+        return len(analysis_ids)
+        
+    async def poll_analyses(self) -> Dict[str, int]:
+        """
+        Fetch the results of tracked analyses that are due.
+        
+        Unsafe URLs are blacklisted and reported to ``on_retroactive_unsafe`` with
+        the messages that contained them; safe URLs go to the safe verdict cache.
+        Unfinished analyses are polled again later with exponential backoff, and
+        are dropped after ``URL_SAFETY_ANALYSIS_MAX_AGE`` seconds.
+        
+        Returns:
+            Counts of unsafe, safe, unfinished and expired analyses
+        """
+        stats = {'unsafe': 0, 'safe': 0, 'unfinished': 0, 'expired': 0}
+        tracker = self.analysis_tracker
+        now = time.time()
+        
+        for analysis_id, url, attempts, submitted_at in tracker.due(URL_SAFETY_ANALYSIS_POLL_BATCH):
+            if now - submitted_at > URL_SAFETY_ANALYSIS_MAX_AGE:
+                tracker.complete(analysis_id)
+                stats['expired'] += 1
+                logger.warning(f"Gave up on VirusTotal analysis {analysis_id} for {url} after {attempts} polls")
+                continue
+                
+            # Use normal priority so fresh high-priority checks go first
+            if not await self.vt_scheduler.acquire(PRIORITY_NORMAL):
+                break
+                
+            session = await get_http_session()
+            async with session.get(
+                f"https://www.virustotal.com/api/v3/analyses/{analysis_id}",
+                headers={"x-apikey": self.api_key},
+                timeout=self.http_timeout
+            ) as response:
+                if self._rate_limited(response):
+                    break
+                if response.status != 200:
+                    logger.error(f"VirusTotal API error while polling analysis {analysis_id}: {response.status}")
+                    tracker.reschedule(analysis_id, attempts + 1)
+                    stats['unfinished'] += 1
+                    continue
+                data = await response.json()
+                
+            attributes = data.get('data', {}).get('attributes', {})
+            if attributes.get('status') != 'completed':
+                tracker.reschedule(analysis_id, attempts + 1)
+                stats['unfinished'] += 1
+                continue
+                
+            is_unsafe, result = self._verdict_from_stats(
+                url, attributes.get('stats', {}), attributes.get('results', {}), "VirusTotal background analysis"
+            )
+            if is_unsafe:
+                stats['unsafe'] += 1
+                if self.blacklist_enabled and self.blacklist:
+                    self.blacklist.add_unsafe_result(url, result, blacklist_domain=URL_BLACKLIST_AUTO_DOMAIN)
+                watchers = tracker.complete(analysis_id)
+                logger.warning(f"Background analysis found unsafe URL {url}, {len(watchers)} message(s) to enforce")
+                if watchers and self.on_retroactive_unsafe:
+                    try:
+                        await self.on_retroactive_unsafe(url, result, watchers)
+                    except Exception as e:
+                        logger.error(f"Error enforcing retroactive URL verdict for {url}: {str(e)}")
+            else:
+                stats['safe'] += 1
+                tracker.complete(analysis_id)
+                if self.safe_cache is not None and self._is_cacheable_safe_result(result):
+                    self.safe_cache.set(canonicalize_url(url), result)
+                    
+        if any(stats.values()):
+            logger.info(f"VirusTotal background analyses: {stats}")
+        return stats
+        
+    async def _analysis_poll_loop(self) -> None:
+        """Poll tracked analyses until the checker is closed."""
+        while True:
+            await asyncio.sleep(URL_SAFETY_ANALYSIS_POLL_INTERVAL)
+            try:
+                await self.poll_analyses()
+            except Exception as e:
+                logger.error(f"Error polling VirusTotal analyses: {str(e)}")
         
     async def __aenter__(self):
         """Async context manager entry."""
+        await self.start()
         return self
         
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """Async context manager exit with cleanup."""
-        if hasattr(self, 'unshortener'):
-            self.unshortener.close()
-            
-        if hasattr(self, 'blacklist') and self.blacklist:
-            self.blacklist.close()
+        await self.close()
             
     async def extract_urls(self, text: str) -> List[str]:
         """
         Extract all URLs from text content.
         
+        Prefer passing a ``MessageURLAnalysis`` between stages over calling this
+        again for the same message.
+        
         Args:
             text: The text to extract URLs from
             
         Returns:
             A list of unique URLs
         """
-        if not text:
-            return []
-            
-        # Find all URLs in the text
-        urls = re.findall(URL_PATTERN, text)
-        
-        # Remove duplicates while preserving order
-        seen = set()
-        unique_urls = [url for url in urls if not (url in seen or seen.add(url))]
-        
-        logger.info(f"Extracted {len(unique_urls)} unique URLs from text")
+        unique_urls = extract_urls(text)
+        if unique_urls:
+            logger.info(f"Extracted {len(unique_urls)} unique URLs from text")
         return unique_urls
         
-    async def check_urls(self, urls: List[str]) -> Tuple[bool, Dict]:
+    async def check_urls(self, urls: List[str], priority: int = PRIORITY_NORMAL) -> Tuple[bool, Dict]:
         """
         Check multiple URLs for safety.
         When there are more than URL_SAFETY_MAX_URLS URLs, randomly sample that many of them to check.
         
+        URLs are canonicalised first, so variants of the same URL are checked once;
+        the returned results are keyed by the URLs exactly as they were passed in.
+        
         Args:
             urls: List of URLs to check
+            priority: VirusTotal scheduler priority; shortened links are always checked at high priority
             
         Returns:
             Tuple of (is_unsafe, results_dict)
@@ -111,6 +437,37 @@ class URLSafetyChecker:
         if not urls:
             return False, {}
             
+        # Group the raw URLs by canonical form
+        canonical_map: Dict[str, List[str]] = {}
+        for url in urls:
+            canonical_map.setdefault(canonicalize_url(url), []).append(url)
+            
+        is_unsafe, canonical_results = await self._check_canonical_urls(list(canonical_map), priority)
+        
+        # Map results back to the URLs as they appeared in the message
+        results = {}
+        for canonical_url, raw_urls in canonical_map.items():
+            result = canonical_results.get(canonical_url)
+            if result is None:
+                continue
+            for raw_url in raw_urls:
+                if raw_url == canonical_url:
+                    results[raw_url] = result
+                else:
+                    results[raw_url] = {**result, "canonical_url": canonical_url}
+        return is_unsafe, results
+        
+    async def _check_canonical_urls(self, urls: List[str], priority: int = PRIORITY_NORMAL) -> Tuple[bool, Dict]:
+        """
+        Check canonical URLs for safety (see ``check_urls``).
+        
+        Args:
+            urls: List of unique canonical URLs
+            priority: VirusTotal scheduler priority
+            
+        Returns:
+            Tuple of (is_unsafe, results keyed by canonical URL)
+        """
         results = {}
         is_unsafe = False
         blacklisted_urls = []
@@ -149,6 +506,41 @@ class URLSafetyChecker:
             # Blacklist not enabled, check all URLs
             urls_to_check = urls
             
+        # Impersonation domains are scored locally, before any network request. Only
+        # explicit keyword matches are unsafe on their own; look-alike hosts are sent
+        # to VirusTotal ahead of the queue, since legitimate domains look alike too
+        suspicious: Dict[str, Dict] = {}
+        if self.impersonation_detector:
+            impersonation_found = False
+            for url in urls_to_check:
+                impersonation_result = self.check_impersonation(url)
+                if impersonation_result and not impersonation_result['explicit']:
+                    suspicious[url] = impersonation_result['impersonation']
+                elif impersonation_result:
+                    impersonation_found = True
+                    results[url] = {
+                        "url": url,
+                        "is_unsafe": True,
+                        "check_time": datetime.now().isoformat(),
+                        "message": impersonation_result['reason'],
+                        "threat_types": impersonation_result['threat_types'],
+                        "severity": impersonation_result['severity'],
+                        "impersonation": impersonation_result['impersonation']
+                    }
+            if impersonation_found:
+                return True, results
+            
+        # Known-safe URLs skip unshortening and API checks
+        if self.safe_cache is not None or self.safe_domains is not None:
+            remaining_urls = []
+            for url in urls_to_check:
+                safe_result = self._known_safe_result(url)
+                if safe_result:
+                    results[url] = safe_result
+                else:
+                    remaining_urls.append(url)
+            urls_to_check = remaining_urls
+            
         # If all URLs are blacklisted, we can return early
         if not urls_to_check:
             return is_unsafe, results
@@ -160,7 +552,10 @@ class URLSafetyChecker:
         
         if len(urls_to_check) > max_urls_to_check:
             sampling_applied = True
-            urls_to_actual_check = random.sample(urls_to_check, max_urls_to_check)
+            # Look-alike hosts are always among the checked URLs
+            suspicious_urls = [url for url in urls_to_check if url in suspicious][:max_urls_to_check]
+            other_urls = [url for url in urls_to_check if url not in suspicious]
+            urls_to_actual_check = suspicious_urls + random.sample(other_urls, max_urls_to_check - len(suspicious_urls))
             logger.info(f"URL check: Sampling {max_urls_to_check} from {len(urls_to_check)} non-blacklisted URLs")
             
             # Mark the URLs that weren't checked as skipped in the results
@@ -183,7 +578,7 @@ class URLSafetyChecker:
             unshortening_results = await self.unshortener.unshorten_urls(urls_to_actual_check)
             
             # Map original URLs to their unshortened versions
-            for url in urls_to_actual_check:
+            for url in list(urls_to_actual_check):
                 if url in unshortening_results:
                     result = unshortening_results[url]
                     if result["success"] and result["final_url"] != url:
@@ -227,25 +622,39 @@ class URLSafetyChecker:
                 else:
                     unshortened_urls[url] = url
         
-        # Check safety for the remaining URLs
-        for original_url in urls_to_actual_check:
-            # Skip if we already determined this URL is unsafe from the blacklist
-            if original_url in results and results[original_url].get("is_unsafe", False):
-                continue
-                
+        # A URL already matched the blacklist after unshortening; the message will be removed anyway
+        if is_unsafe:
+            for url in urls_to_actual_check:
+                if url not in results:
+                    results[url] = self._cancelled_result(url)
+            return is_unsafe, results
+            
+        # Check the remaining URLs concurrently and stop as soon as one is unsafe
+        semaphore = asyncio.Semaphore(max(1, URL_SAFETY_CONCURRENT_CHECKS))
+        checked: Dict[str, Dict] = {}
+        
+        async def check_one(original_url: str) -> bool:
             # Use unshortened URL for safety check if available
             url_to_check = unshortened_urls.get(original_url, original_url) if URL_UNSHORTEN_ENABLED else original_url
             
+            # Shortened links and look-alike hosts are common ways to hide phishing, so they jump the API queue
+            is_shortened = url_to_check != original_url or self.unshortener.is_shortened_url(original_url)
+            url_priority = PRIORITY_HIGH if is_shortened or original_url in suspicious else priority
+            
             # Check safety
-            url_unsafe, result = await self.check_url(url_to_check)
+            async with semaphore:
+                url_unsafe, result = await self.check_url(url_to_check, url_priority)
             
             # Add unshortening information to the result if applicable
             if URL_UNSHORTEN_ENABLED and original_url in unshortened_urls and unshortened_urls[original_url] != original_url:
                 result["original_shortened_url"] = original_url
                 result["url"] = url_to_check  # Update to unshortened URL
                 
+            if original_url in suspicious:
+                result["impersonation"] = suspicious[original_url]
+                
             # Store result under the original URL
-            results[original_url] = result
+            checked[original_url] = result
             
             # If URL is unsafe, add it to the blacklist
             if url_unsafe and self.blacklist_enabled and self.blacklist:
@@ -257,9 +666,34 @@ class URLSafetyChecker:
                 )
                 logger.info(f"Added unsafe URL to blacklist: {url_to_check}{' (original: '+original_url+')' if original_url != url_to_check else ''}")
             
+            elif self.safe_cache is not None and self._is_cacheable_safe_result(result):
+                self.safe_cache.set(original_url, result)
+            
             if url_unsafe:
-                is_unsafe = True
                 logger.warning(f"URL {original_url} is unsafe")
+            return url_unsafe
+            
+        tasks = {asyncio.create_task(check_one(url)): url for url in urls_to_actual_check}
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if any(task.result() for task in done):
+                    is_unsafe = True
+                    break
+        finally:
+            # Cancel the checks still running (or all of them if the caller was cancelled)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+                
+        # Keep the results in message order
+        for url in urls_to_actual_check:
+            if url in checked:
+                results[url] = checked[url]
+            elif url not in results:
+                results[url] = self._cancelled_result(url)
         
         # If we did sampling and found nothing unsafe, note it in the log
         if sampling_applied and not is_unsafe:
@@ -267,16 +701,152 @@ class URLSafetyChecker:
             
         return is_unsafe, results
     
-    async def check_url(self, url: str) -> Tuple[bool, Dict]:
+    def check_impersonation(self, url: str) -> Dict:
+        """
+        Check a URL's host for brand impersonation without any network access.
+        
+        Args:
+            url: The URL to check
+            
+        Returns:
+            A blacklist-style dict (reason, threat_types, severity, impersonation) if the
+            host impersonates a protected brand, empty dict otherwise. ``explicit`` is
+            True only for configured impersonation keywords; other signals are
+            heuristics that legitimate look-alike domains can trigger, so they must
+            not be enforced without a VirusTotal verdict.
+        """
+        if not self.impersonation_detector:
+            return {}
+        if self.safe_domains is not None and self.safe_domains.find(extract_host(url)):
+            return {}
+            
+        detection = self.impersonation_detector.check_url(url)
+        if not detection:
+            return {}
+            
+        target = detection['brand'] or detection['matched']
+        explicit = detection['signal'] == 'keyword'
+        logger.warning(
+            f"{'Impersonation domain detected' if explicit else 'Possible look-alike domain, needs a VirusTotal verdict'}: "
+            f"{detection['host']} ({detection['signal']}, target: {target}, score: {detection['score']})"
+        )
+        return {
+            "reason": f"Impersonation domain ({detection['signal']}: {target})",
+            "threat_types": ['PHISHING'],
+            "severity": self.severity_levels.get('PHISHING', 9),
+            "impersonation": detection,
+            "explicit": explicit
+        }
+        
+    def _known_safe_result(self, url: str) -> Optional[Dict]:
+        """
+        Return a safe result for a canonical URL from the trusted domain list or the verdict cache.
+        
+        Args:
+            url: Canonical URL
+            
+        Returns:
+            The safe result, or None if the URL still has to be checked
+        """
+        if self.safe_domains is not None:
+            domain = self.safe_domains.find(extract_host(url))
+            if domain:
+                return {
+                    "url": url,
+                    "is_unsafe": False,
+                    "check_time": datetime.now().isoformat(),
+                    "message": "URL domain is on the trusted domain list",
+                    "trusted_domain": domain
+                }
+                
+        if self.safe_cache is not None:
+            cached = self.safe_cache.get(url)
+            if cached:
+                return {**cached, "from_cache": True}
+        return None
+        
+    @staticmethod
+    def _is_cacheable_safe_result(result: Dict) -> bool:
+        """Only cache completed API verdicts, not errors, queued analyses or local-only checks."""
+        return not result.get("is_unsafe") and "unsafe_score" in result and not result.get("error")
+        
+    @staticmethod
+    def _cancelled_result(url: str) -> Dict:
+        """Build the result of a check that was not run because another URL in the message is unsafe."""
+        return {
+            "url": url,
+            "is_unsafe": False,
+            "check_time": datetime.now().isoformat(),
+            "message": "URL check cancelled (another URL in the message is unsafe)",
+            "skipped": True
+        }
+        
+    def cache_stats(self) -> Dict:
+        """Return the safe verdict cache counters."""
+        return self.safe_cache.stats() if self.safe_cache is not None else {}
+        
+    async def check_url(self, url: str, priority: int = PRIORITY_NORMAL) -> Tuple[bool, Dict]:
         """
         Check a single URL for safety using the configured API.
         
+        Concurrent calls for the same canonical URL await one shared check, so a
+        link posted in many messages at once is submitted to the API only once.
+        Callers arriving within ``URL_SAFETY_COALESCE_TTL`` seconds after it
+        finished get the same verdict (errors and pending results are not shared).
+        
         Args:
             url: The URL to check
+            priority: VirusTotal scheduler priority (see ``virustotal_scheduler``)
             
         Returns:
             Tuple of (is_unsafe, result_dict)
         """
+        key = canonicalize_url(url)
+        if self.recent_verdicts is not None:
+            recent = self.recent_verdicts.get(key)
+            if recent is not None:
+                is_unsafe, result = recent
+                return is_unsafe, dict(result)
+                
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._check_url_once(key, url, priority))
+            self._inflight[key] = task
+        else:
+            self.coalesced_checks += 1
+            logger.info(f"Joining in-flight safety check for URL: {url}")
+            
+        # Shielded so a cancelled caller does not cancel the check the others are waiting for;
+        # the check itself is cancelled only when its last caller gives up
+        self._inflight_waiters[key] = self._inflight_waiters.get(key, 0) + 1
+        try:
+            is_unsafe, result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._inflight_waiters[key] == 1 and not task.done():
+                task.cancel()
+                if self._inflight.get(key) is task:
+                    del self._inflight[key]
+            raise
+        finally:
+            waiters = self._inflight_waiters.pop(key) - 1
+            if waiters:
+                self._inflight_waiters[key] = waiters
+        # Every caller gets its own copy, since callers annotate the result
+        return is_unsafe, dict(result)
+        
+    async def _check_url_once(self, key: str, url: str, priority: int) -> Tuple[bool, Dict]:
+        """Run one uncoalesced check and publish its verdict to late callers."""
+        try:
+            is_unsafe, result = await self._check_url_uncoalesced(url, priority)
+            if self.recent_verdicts is not None and not result.get('error') and not result.get('pending'):
+                self.recent_verdicts.set(key, (is_unsafe, result))
+            return is_unsafe, result
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+            
+    async def _check_url_uncoalesced(self, url: str, priority: int = PRIORITY_NORMAL) -> Tuple[bool, Dict]:
+        """Check a single URL with the configured API (see ``check_url``)."""
         logger.info(f"Checking URL safety: {url}")
         
         try:
@@ -289,7 +859,7 @@ class URLSafetyChecker:
             
             # Use the configured API for safety checking
             if self.api == 'virustotal':
-                is_unsafe, api_result = await self._check_url_virustotal(url)
+                is_unsafe, api_result = await self._check_url_virustotal(url, priority)
             else:
                 # Default to local pattern-based checks only
                 is_unsafe = False
@@ -307,6 +877,10 @@ class URLSafetyChecker:
                     "message": "External API threat detection"
                 })
                 return True, api_result
+                
+            # No verdict yet (quota exhausted or analysis still running), keep its message
+            if api_result.get('pending'):
+                return False, api_result
             
             # URL passed all checks
             api_result.update({
@@ -324,12 +898,103 @@ class URLSafetyChecker:
                 "check_time": datetime.now().isoformat()
             }
     
-    async def _check_url_virustotal(self, url: str) -> Tuple[bool, Dict]:
+    def _pending_result(self, url: str, message: str, analysis_id: Optional[str] = None) -> Dict:
+        """Build the result of a check that has no verdict yet (quota exhausted or analysis still running)."""
+        logger.info(f"URL check pending: {url} ({message})")
+        result = {
+            "url": url,
+            "is_unsafe": False,
+            "pending": True,
+            "message": message,
+            "check_time": datetime.now().isoformat()
+        }
+        if analysis_id:
+            result["analysis_id"] = analysis_id
+        return result
+        
+    def _verdict_from_stats(self, url: str, stats: Dict, results: Dict, source: str) -> Tuple[bool, Dict]:
+        """
+        Turn VirusTotal engine statistics into a verdict.
+        
+        Args:
+            url: The checked URL
+            stats: Engine counts per category (malicious, suspicious, harmless, ...)
+            results: Per-engine results
+            source: Label for the log line
+            
+        Returns:
+            Tuple of (is_unsafe, result)
+        """
+        # Calculate safety score
+        malicious = stats.get('malicious', 0)
+        suspicious = stats.get('suspicious', 0)
+        total = sum(stats.values()) if sum(stats.values()) > 0 else 1
+        
+        unsafe_score = (malicious + suspicious) / total
+        is_unsafe = unsafe_score >= self.threshold
+        
+        # Log detailed information for debugging
+        logger.info(f"{source} - URL: {url}, Malicious: {malicious}, Suspicious: {suspicious}, Total: {total}, Score: {unsafe_score}, Threshold: {self.threshold}")
+        
+        # Check for specific threat types
+        threat_types = set()
+        for engine, result in results.items():
+            category = result.get('category')
+            if category in ('malicious', 'suspicious'):
+                threat_type = result.get('result', 'unknown').lower()
+                if 'phish' in threat_type:
+                    threat_types.add('PHISHING')
+                elif 'malware' in threat_type:
+                    threat_types.add('MALWARE')
+                elif 'scam' in threat_type:
+                    threat_types.add('SCAM')
+                else:
+                    threat_types.add('SUSPICIOUS')
+        
+        # Determine severity based on threat types
+        severity = 0
+        for threat_type in threat_types:
+            severity = max(severity, self.severity_levels.get(threat_type, 0))
+        
+        return is_unsafe, {
+            "url": url,
+            "unsafe_score": unsafe_score,
+            "is_unsafe": is_unsafe,
+            "malicious": malicious,
+            "suspicious": suspicious,
+            "total_engines": total,
+            "threat_types": list(threat_types),
+            "severity": severity,
+            "check_time": datetime.now().isoformat()
+        }
+        
+    def _rate_limited(self, response: aiohttp.ClientResponse) -> bool:
+        """Report a 429 response to the scheduler. Returns True if the response was rate limited."""
+        if response.status != 429:
+            return False
+        try:
+            retry_after = float(response.headers.get('Retry-After', 0))
+        except ValueError:
+            retry_after = None
+        self.vt_scheduler.report_rate_limited(retry_after)
+        return True
+    
+    async def _check_url_virustotal(self, url: str, priority: int = PRIORITY_NORMAL) -> Tuple[bool, Dict]:
         """
         Check URL using VirusTotal API.
         
+        Every API request waits for quota from the scheduler. When the quota does
+        not allow a request within the priority's wait budget, or the API rate
+        limits us, a pending result is returned instead of an error.
+        
+        URLs VirusTotal has not seen before are submitted for analysis. With
+        ``URL_SAFETY_ASYNC_ANALYSIS`` the analysis is handed to the tracker and a
+        pending result is returned at once (see ``poll_analyses``); otherwise the
+        result is polled here with exponential backoff.
+        
         Args:
             url: The URL to check
+            priority: Scheduler priority (see ``virustotal_scheduler``)
             
         Returns:
             Tuple of (is_unsafe, result)
@@ -338,6 +1003,12 @@ class URLSafetyChecker:
             logger.warning("No VirusTotal API key provided")
             return False, {"error": "No VirusTotal API key provided"}
             
+        # The URL was submitted recently and its analysis is still running
+        if self.analysis_tracker:
+            analysis_id = self.analysis_tracker.find(url)
+            if analysis_id:
+                return False, self._pending_result(url, "VirusTotal analysis in progress", analysis_id)
+                
         try:
             # First try to get URL ID by calculating the base64 URL identifier
             import base64
@@ -349,192 +1020,139 @@ class URLSafetyChecker:
             # First try directly getting the analysis if it exists
             url_report_endpoint = f"https://www.virustotal.com/api/v3/urls/{url_id}"
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    url_report_endpoint,
-                    headers={"x-apikey": self.api_key}
-                ) as response:
-                    # If the URL has been scanned before, we can get results directly
-                    if response.status == 200:
-                        data = await response.json()
-                        attributes = data.get('data', {}).get('attributes', {})
-                        
-                        # Extract last_analysis_stats 
-                        stats = attributes.get('last_analysis_stats', {})
-                        results = attributes.get('last_analysis_results', {})
-                        
-                        # Calculate safety score
-                        malicious = stats.get('malicious', 0)
-                        suspicious = stats.get('suspicious', 0)
-                        total = sum(stats.values()) if sum(stats.values()) > 0 else 1
-                        
-                        unsafe_score = (malicious + suspicious) / total
-                        is_unsafe = unsafe_score >= self.threshold
-                        
-                        # Log detailed information for debugging
-                        logger.info(f"VirusTotal direct check - URL: {url}, Malicious: {malicious}, Suspicious: {suspicious}, Total: {total}, Score: {unsafe_score}, Threshold: {self.threshold}")
-                        
-                        # Check for specific threat types
-                        threat_types = set()
-                        for engine, result in results.items():
-                            category = result.get('category')
-                            if category in ('malicious', 'suspicious'):
-                                threat_type = result.get('result', 'unknown').lower()
-                                if 'phish' in threat_type:
-                                    threat_types.add('PHISHING')
-                                elif 'malware' in threat_type:
-                                    threat_types.add('MALWARE')
-                                elif 'scam' in threat_type:
-                                    threat_types.add('SCAM')
-                                else:
-                                    threat_types.add('SUSPICIOUS')
-                        
-                        # Determine severity based on threat types
-                        severity = 0
-                        for threat_type in threat_types:
-                            severity = max(severity, self.severity_levels.get(threat_type, 0))
-                        
-                        return is_unsafe, {
-                            "url": url,
-                            "unsafe_score": unsafe_score,
-                            "is_unsafe": is_unsafe,
-                            "malicious": malicious,
-                            "suspicious": suspicious,
-                            "total_engines": total,
-                            "threat_types": list(threat_types),
-                            "severity": severity,
-                            "check_time": datetime.now().isoformat()
-                        }
+            if not await self.vt_scheduler.acquire(priority):
+                return False, self._pending_result(url, "VirusTotal quota exhausted, check deferred")
+            
+            session = await get_http_session()
+            async with session.get(
+                url_report_endpoint,
+                headers={"x-apikey": self.api_key},
+                timeout=self.http_timeout
+            ) as response:
+                if self._rate_limited(response):
+                    return False, self._pending_result(url, "VirusTotal rate limit reached, check deferred")
+                    
+                # If the URL has been scanned before, we can get results directly
+                if response.status == 200:
+                    data = await response.json()
+                    attributes = data.get('data', {}).get('attributes', {})
+                    
+                    return self._verdict_from_stats(
+                        url,
+                        attributes.get('last_analysis_stats', {}),
+                        attributes.get('last_analysis_results', {}),
+                        "VirusTotal direct check"
+                    )
+            
+            # If URL hasn't been analyzed before, submit it for analysis
+            # Submit URL for analysis
+            form_data = aiohttp.FormData()
+            form_data.add_field('url', url)
+            
+            analyze_url_endpoint = "https://www.virustotal.com/api/v3/urls"
+            
+            if not await self.vt_scheduler.acquire(priority):
+                return False, self._pending_result(url, "VirusTotal quota exhausted, check deferred")
+                
+            async with session.post(
+                analyze_url_endpoint,
+                data=form_data,
+                headers={"x-apikey": self.api_key},
+                timeout=self.http_timeout
+            ) as response:
+                if self._rate_limited(response):
+                    return False, self._pending_result(url, "VirusTotal rate limit reached, check deferred")
+                    
+                if response.status != 200:
+                    logger.error(f"VirusTotal API error: {response.status} - {await response.text()}")
+                    return False, {"error": f"VirusTotal API error: {response.status}"}
+                    
+                data = await response.json()
+                analysis_id = data.get('data', {}).get('id')
+                if not analysis_id:
+                    logger.error("No analysis ID received from VirusTotal")
+                    return False, {"error": "No analysis ID received from VirusTotal"}
+                
+                logger.info(f"Submitted URL for analysis: {url}, Analysis ID: {analysis_id}")
                 
-                # If URL hasn't been analyzed before, submit it for analysis
-                # Submit URL for analysis
-                form_data = aiohttp.FormData()
-                form_data.add_field('url', url)
+            # Release the caller now; the background poller enforces the verdict later
+            if self.analysis_tracker:
+                self.analysis_tracker.track(analysis_id, url)
+                return False, self._pending_result(url, "Submitted to VirusTotal, verdict pending", analysis_id)
+            
+            # Step 2: Get analysis results
+            url_report_endpoint = f"https://www.virustotal.com/api/v3/analyses/{analysis_id}"
+            
+            # Try with exponential backoff
+            for attempt in range(1, self.max_retries + 1):
+                logger.info(f"Fetching VirusTotal analysis results (attempt {attempt}/{self.max_retries})")
                 
-                analyze_url_endpoint = "https://www.virustotal.com/api/v3/urls"
+                # Add a delay before checking results
+                delay = self.retry_delay * (2 ** (attempt - 1))
+                await asyncio.sleep(delay)
                 
-                async with session.post(
-                    analyze_url_endpoint,
-                    data=form_data,
-                    headers={"x-apikey": self.api_key}
+                if not await self.vt_scheduler.acquire(priority):
+                    return False, self._pending_result(
+                        url, "VirusTotal quota exhausted, analysis result not fetched yet", analysis_id
+                    )
+                    
+                async with session.get(
+                    url_report_endpoint,
+                    headers={"x-apikey": self.api_key},
+                    timeout=self.http_timeout
                 ) as response:
+                    if self._rate_limited(response):
+                        return False, self._pending_result(
+                            url, "VirusTotal rate limit reached, analysis result not fetched yet", analysis_id
+                        )
+                        
                     if response.status != 200:
-                        logger.error(f"VirusTotal API error: {response.status} - {await response.text()}")
+                        logger.error(f"VirusTotal API error: {response.status}")
+                        if attempt < self.max_retries:
+                            continue
                         return False, {"error": f"VirusTotal API error: {response.status}"}
                         
                     data = await response.json()
-                    analysis_id = data.get('data', {}).get('id')
-                    if not analysis_id:
-                        logger.error("No analysis ID received from VirusTotal")
-                        return False, {"error": "No analysis ID received from VirusTotal"}
+                    attributes = data.get('data', {}).get('attributes', {})
+                    status = attributes.get('status')
                     
-                    logger.info(f"Submitted URL for analysis: {url}, Analysis ID: {analysis_id}")
-                
-                # Step 2: Get analysis results
-                url_report_endpoint = f"https://www.virustotal.com/api/v3/analyses/{analysis_id}"
-                
-                # Try with exponential backoff
-                for attempt in range(1, self.max_retries + 1):
-                    logger.info(f"Fetching VirusTotal analysis results (attempt {attempt}/{self.max_retries})")
+                    if status == 'completed':
+                        return self._verdict_from_stats(
+                            url,
+                            attributes.get('stats', {}),
+                            attributes.get('results', {}),
+                            "VirusTotal scan"
+                        )
                     
-                    # Add a delay before checking results
-                    delay = self.retry_delay * (2 ** (attempt - 1))
-                    await asyncio.sleep(delay)
-                    
-                    async with session.get(
-                        url_report_endpoint,
-                        headers={"x-apikey": self.api_key}
-                    ) as response:
-                        if response.status != 200:
-                            logger.error(f"VirusTotal API error: {response.status}")
-                            if attempt < self.max_retries:
-                                continue
-                            return False, {"error": f"VirusTotal API error: {response.status}"}
-                            
-                        data = await response.json()
-                        attributes = data.get('data', {}).get('attributes', {})
-                        status = attributes.get('status')
-                        
-                        if status == 'completed':
-                            # Process the completed analysis
-                            stats = attributes.get('stats', {})
-                            results = attributes.get('results', {})
-                            
-                            # Calculate safety score
-                            malicious = stats.get('malicious', 0)
-                            suspicious = stats.get('suspicious', 0)
-                            total = sum(stats.values()) if sum(stats.values()) > 0 else 1
-                            
-                            unsafe_score = (malicious + suspicious) / total
-                            is_unsafe = unsafe_score >= self.threshold
-                            
-                            # Log detailed information for debugging
-                            logger.info(f"VirusTotal scan - URL: {url}, Malicious: {malicious}, Suspicious: {suspicious}, Total: {total}, Score: {unsafe_score}, Threshold: {self.threshold}")
-                            
-                            # Check for specific threat types
-                            threat_types = set()
-                            for engine, result in results.items():
-                                category = result.get('category')
-                                if category in ('malicious', 'suspicious'):
-                                    threat_type = result.get('result', 'unknown').lower()
-                                    if 'phish' in threat_type:
-                                        threat_types.add('PHISHING')
-                                    elif 'malware' in threat_type:
-                                        threat_types.add('MALWARE')
-                                    elif 'scam' in threat_type:
-                                        threat_types.add('SCAM')
-                                    else:
-                                        threat_types.add('SUSPICIOUS')
-                            
-                            # Determine severity based on threat types
-                            severity = 0
-                            for threat_type in threat_types:
-                                severity = max(severity, self.severity_levels.get(threat_type, 0))
-                            
-                            return is_unsafe, {
-                                "url": url,
-                                "unsafe_score": unsafe_score,
-                                "is_unsafe": is_unsafe,
-                                "malicious": malicious,
-                                "suspicious": suspicious,
-                                "total_engines": total,
-                                "threat_types": list(threat_types),
-                                "severity": severity,
-                                "check_time": datetime.now().isoformat()
-                            }
-                        
-                        elif status == 'queued':
-                            # If still queued, wait for next attempt
-                            if attempt < self.max_retries:
-                                continue
-                            else:
-                                # Return a conservative result if still queued after all retries
-                                logger.warning(f"URL analysis still queued after maximum retries: {url}")
-                                return False, {
-                                    "url": url,
-                                    "is_unsafe": False,
-                                    "message": "Analysis still queued after maximum retries",
-                                    "check_time": datetime.now().isoformat()
-                                }
+                    elif status == 'queued':
+                        # If still queued, wait for next attempt
+                        if attempt < self.max_retries:
+                            continue
                         else:
-                            # Other status (like 'failed')
-                            logger.warning(f"VirusTotal analysis status: {status}")
-                            return False, {
-                                "url": url,
-                                "is_unsafe": False,
-                                "message": f"Analysis status: {status}",
-                                "check_time": datetime.now().isoformat()
-                            }
+                            # No verdict yet; the analysis keeps running on VirusTotal's side
+                            logger.warning(f"URL analysis still queued after maximum retries: {url}")
+                            return False, self._pending_result(
+                                url, "Analysis still queued after maximum retries", analysis_id
+                            )
+                    else:
+                        # Other status (like 'failed')
+                        logger.warning(f"VirusTotal analysis status: {status}")
+                        return False, {
+                            "url": url,
+                            "is_unsafe": False,
+                            "message": f"Analysis status: {status}",
+                            "check_time": datetime.now().isoformat()
+                        }
+            
+            # If we've exhausted all retries
+            logger.warning(f"Failed to get analysis results after maximum retries: {url}")
+            return False, {
+                "url": url,
+                "is_unsafe": False,
+                "message": "Failed to get analysis results after maximum retries",
+                "check_time": datetime.now().isoformat()
+            }
                 
-                # If we've exhausted all retries
-                logger.warning(f"Failed to get analysis results after maximum retries: {url}")
-                return False, {
-                    "url": url,
-                    "is_unsafe": False,
-                    "message": "Failed to get analysis results after maximum retries",
-                    "check_time": datetime.now().isoformat()
-                }
-                    
         except Exception as e:
             logger.error(f"Error checking URL with VirusTotal: {str(e)}")
             return False, {"error": f"Error checking URL: {str(e)}"} 
\ No newline at end of file
@@ -3,7 +3,7 @@ URL unshortener service.
 
 This module provides functionality to expand shortened URLs using multiple methods:
 1. Simple HTTP requests with headers
-2. Headless browser simulation using Selenium (if available)
+2. Headless browser simulation using Selenium (if available), on a pool of worker threads
 3. Special handlers for various URL shortening services
 """
 import re
@@ -20,8 +20,29 @@ from app.config import (
     URL_UNSHORTEN_ENABLED,
     URL_UNSHORTEN_TIMEOUT,
     URL_UNSHORTEN_MAX_REDIRECTS,
-    URL_UNSHORTEN_RETRY_COUNT
+    URL_UNSHORTEN_RETRY_COUNT,
+    URL_UNSHORTEN_CACHE_ENABLED,
+    URL_UNSHORTEN_CACHE_FILE,
+    URL_UNSHORTEN_CACHE_TTL,
+    URL_UNSHORTEN_CACHE_NEGATIVE_TTL,
+    URL_UNSHORTEN_CACHE_MAX_ENTRIES,
+    URL_UNSHORTEN_TARGETED,
+    URL_UNSHORTEN_BODY_MAX_KB,
+    URL_UNSHORTEN_BROWSER_WORKERS,
+    URL_UNSHORTEN_BROWSER_QUEUE_SIZE,
+    URL_UNSHORTEN_BROWSER_JOB_TIMEOUT,
+    URL_UNSHORTEN_MAX_CONCURRENCY,
+    URL_UNSHORTEN_PER_HOST_LIMIT,
+    URL_UNSHORTEN_CIRCUIT_FAILURES,
+    URL_UNSHORTEN_CIRCUIT_RESET
 )
+from app.ai.service.url_canonicalizer import canonicalize_url
+from app.ai.service.unshorten_cache import UnshortenCache
+from app.ai.service.ttl_cache import TTLCache
+from app.ai.service.browser_pool import BrowserPool, BrowserPoolFull, SELENIUM_AVAILABLE
+from app.ai.service.host_guard import HostGuard, HostUnavailable
+from app.ai.service.url_extractor import extract_urls
+from app.services.http_client import get_http_session
 
 logger = logging.getLogger(__name__)
 
@@ -84,22 +105,20 @@ SPECIAL_HANDLERS = {
     }
 }
 
-# URL pattern for detection
-URL_PATTERN = r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+[/\w\.-]*(?:\?[-\w%&=.]*)?(?:#[-\w]*)?'
+SHORT_URL_DOMAIN_SET = frozenset(SHORT_URL_DOMAINS)
+SHORT_PATH_PATTERN = re.compile(r'^[a-zA-Z0-9_-]+$')
+
+# Common JavaScript and meta refresh redirects, combined so a page is scanned once
+JS_REDIRECT_PATTERN = re.compile(
+    r'window\.location(?:(?:\.href)?\s*=\s*[\'"]([^\'"]+)[\'"]|\.(?:replace|assign)\([\'"]([^\'"]+)[\'"]\))'
+    r'|<meta\s+(?:http-equiv=[\'"]refresh[\'"]\s+content=[\'"]0;\s*url=([^\'"]+)[\'"]'
+    r'|content=[\'"]0;\s*url=([^\'"]+)[\'"]\s+http-equiv=[\'"]refresh[\'"])',
+    re.IGNORECASE
+)
+
+# Content types whose body may carry a JavaScript or meta refresh redirect
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml', 'text/plain', '')
 
-# Check if Selenium is available
-try:
-    from selenium import webdriver
-    from selenium.webdriver.chrome.service import Service
-    from selenium.webdriver.chrome.options import Options
-    from selenium.webdriver.common.by import By
-    from selenium.webdriver.support.ui import WebDriverWait
-    from selenium.webdriver.support import expected_conditions as EC
-    from selenium.common.exceptions import TimeoutException, WebDriverException
-    SELENIUM_AVAILABLE = True
-except ImportError:
-    SELENIUM_AVAILABLE = False
-    logger.warning("Selenium not available. Headless browser URL unshortening will be disabled.")
 
 class URLUnshortener:
     """Service to unshorten URLs using various methods."""
@@ -111,8 +130,41 @@ class URLUnshortener:
         self.max_redirects = URL_UNSHORTEN_MAX_REDIRECTS
         self.retry_count = URL_UNSHORTEN_RETRY_COUNT
         self.use_selenium = SELENIUM_AVAILABLE
-        self.selenium_initialized = False
-        self.driver = None
+        
+        # Per-host concurrency limits and circuit breakers, and a bound on concurrent expansions
+        self.host_guard = HostGuard(
+            per_host_limit=URL_UNSHORTEN_PER_HOST_LIMIT,
+            failure_threshold=URL_UNSHORTEN_CIRCUIT_FAILURES,
+            reset_timeout=URL_UNSHORTEN_CIRCUIT_RESET
+        )
+        self.concurrency = asyncio.Semaphore(max(1, URL_UNSHORTEN_MAX_CONCURRENCY))
+        
+        # Reusable headless browsers on worker threads, started on first use
+        self.browser_pool = BrowserPool(
+            workers=URL_UNSHORTEN_BROWSER_WORKERS,
+            queue_size=URL_UNSHORTEN_BROWSER_QUEUE_SIZE,
+            page_timeout=self.timeout,
+            job_timeout=URL_UNSHORTEN_BROWSER_JOB_TIMEOUT
+        )
+        
+        # Only the first part of a page is searched for JavaScript redirects
+        self.body_max_bytes = int(URL_UNSHORTEN_BODY_MAX_KB * 1024)
+        
+        # Hosts that were probed and did not redirect; their URLs are not chased
+        # again unless they look like short links
+        self.direct_hosts = TTLCache(URL_UNSHORTEN_CACHE_MAX_ENTRIES, URL_UNSHORTEN_CACHE_NEGATIVE_TTL) if URL_UNSHORTEN_TARGETED else None
+        self.skipped = 0
+        
+        # Remember expansions (and URLs that don't redirect) across messages and restarts
+        if self.enabled and URL_UNSHORTEN_CACHE_ENABLED:
+            self.cache = UnshortenCache(
+                URL_UNSHORTEN_CACHE_FILE,
+                max_entries=URL_UNSHORTEN_CACHE_MAX_ENTRIES,
+                ttl=URL_UNSHORTEN_CACHE_TTL,
+                negative_ttl=URL_UNSHORTEN_CACHE_NEGATIVE_TTL
+            )
+        else:
+            self.cache = None
         
         # Standard browser-like headers
         self.default_headers = {
@@ -127,37 +179,6 @@ class URLUnshortener:
         
         logger.info(f"URL unshortener initialized. Enabled: {self.enabled}, Selenium available: {SELENIUM_AVAILABLE}")
     
-    def _setup_selenium(self):
-        """Set up Selenium WebDriver for headless browser simulation."""
-        if not SELENIUM_AVAILABLE or self.selenium_initialized:
-            return
-            
-        try:
-            # Configure Chrome options
-            chrome_options = Options()
-            chrome_options.add_argument("--headless")
-            chrome_options.add_argument("--disable-gpu")
-            chrome_options.add_argument("--window-size=1920,1080")
-            chrome_options.add_argument("--disable-extensions")
-            chrome_options.add_argument("--no-sandbox")
-            chrome_options.add_argument("--disable-dev-shm-usage")
-            chrome_options.add_argument("--disable-notifications")
-            chrome_options.add_argument("--disable-popup-blocking")
-            chrome_options.add_argument("--log-level=3")
-            
-            # Set user agent
-            chrome_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
-            
-            # Create WebDriver instance
-            self.driver = webdriver.Chrome(options=chrome_options)
-            self.driver.set_page_load_timeout(self.timeout)
-            self.selenium_initialized = True
-            logger.info("Selenium WebDriver initialized successfully")
-            
-        except Exception as e:
-            logger.error(f"Failed to initialize Selenium WebDriver: {str(e)}")
-            self.use_selenium = False
-    
     def _get_domain_from_url(self, url: str) -> str:
         """Extract domain from URL."""
         parsed_url = urlparse(url)
@@ -186,7 +207,7 @@ class URLUnshortener:
             
         # Check against known URL shortener domains
         domain = self._get_domain_from_url(url)
-        if domain in SHORT_URL_DOMAINS:
+        if domain in SHORT_URL_DOMAIN_SET:
             return True
             
         # Check URL structure for shortener patterns
@@ -194,7 +215,7 @@ class URLUnshortener:
         path = parsed_url.path.strip('/')
         
         # Short path with random-looking characters
-        if path and len(path) < 10 and re.match(r'^[a-zA-Z0-9_-]+$', path):
+        if path and len(path) < 10 and SHORT_PATH_PATTERN.match(path):
             return True
             
         # Overall short URL length
@@ -205,18 +226,23 @@ class URLUnshortener:
     
     async def extract_urls(self, text: str) -> List[str]:
         """Extract all URLs from text content."""
-        if not text:
-            return []
-            
-        # Find all URLs in the text
-        urls = re.findall(URL_PATTERN, text)
-        
-        # Remove duplicates while preserving order
-        seen = set()
-        unique_urls = [url for url in urls if not (url in seen or seen.add(url))]
-        
-        logger.info(f"Extracted {len(unique_urls)} unique URLs from text")
-        return unique_urls
+        return extract_urls(text)
+    
+    def _host_unavailable_result(self, url: str, host: str, error: Exception,
+                                 redirect_history: List[str], start_time: float) -> Dict:
+        """Build the result of an attempt stopped by a timeout or an open host circuit."""
+        reason = "Host circuit open" if isinstance(error, HostUnavailable) else "Request timeout"
+        logger.warning(f"Not unshortening URL, {reason.lower()} for {host}: {url}")
+        return {
+            "original_url": url,
+            "final_url": url,
+            "success": False,
+            "method": "requests",
+            "error": reason,
+            "host_unavailable": True,
+            "redirect_history": redirect_history,
+            "elapsed_time": round(time.time() - start_time, 3)
+        }
     
     async def unshorten_with_requests(self, url: str) -> Dict:
         """Unshorten URL using HTTP requests with appropriate headers."""
@@ -230,16 +256,18 @@ class URLUnshortener:
         redirect_history = [url]
         
         try:
-            # Create a session to manage cookies and headers
-            async with aiohttp.ClientSession() as session:
-                # Send HEAD request first to check for immediate redirects
-                try:
+            # Pooled session shared by all services, so connections to shorteners stay alive
+            session = await get_http_session()
+            # Send HEAD request first to check for immediate redirects
+            try:
+                async with self.host_guard.request(domain):
                     async with session.head(
                         url,
                         headers=headers,
                         allow_redirects=False,
                         timeout=self.timeout
                     ) as response:
+                        self.host_guard.record_success(domain)
                         # If we get a redirect status code
                         if response.status in (301, 302, 303, 307, 308):
                             location = response.headers.get('Location')
@@ -250,25 +278,31 @@ class URLUnshortener:
                                         location = f"{url.split('://', 1)[0]}://{domain}{location}"
                                     else:
                                         location = f"{url.split('://', 1)[0]}://{domain}/{location}"
-                                
+                            
                                 redirect_history.append(location)
                                 # Continue with the new location for GET request
                                 url = location
-                except aiohttp.ClientError as e:
-                    logger.warning(f"HEAD request failed for {url}: {str(e)}")
-                
-                # Now try with GET and allow redirects
-                redirects = 0
-                current_url = url
-                
-                while redirects < self.max_redirects:
-                    try:
+            except aiohttp.ClientError as e:
+                logger.warning(f"HEAD request failed for {url}: {str(e)}")
+            except (HostUnavailable, asyncio.TimeoutError) as e:
+                # A GET to the same host would wait just as long
+                return self._host_unavailable_result(url, domain, e, redirect_history, start_time)
+            
+            # Now try with GET and allow redirects
+            redirects = 0
+            current_url = url
+            
+            while redirects < self.max_redirects:
+                current_host = self._get_domain_from_url(current_url)
+                try:
+                    async with self.host_guard.request(current_host):
                         async with session.get(
                             current_url,
                             headers=headers,
                             allow_redirects=False,
                             timeout=self.timeout
                         ) as response:
+                            self.host_guard.record_success(current_host)
                             # Check for redirect
                             if response.status in (301, 302, 303, 307, 308):
                                 location = response.headers.get('Location')
@@ -280,11 +314,11 @@ class URLUnshortener:
                                             location = f"{current_url.split('://', 1)[0]}://{current_domain}{location}"
                                         else:
                                             location = f"{current_url.split('://', 1)[0]}://{current_domain}/{location}"
-                                    
+                                
                                     # Avoid redirect loops
                                     if location in redirect_history:
                                         break
-                                        
+                                    
                                     redirect_history.append(location)
                                     current_url = location
                                     redirects += 1
@@ -293,11 +327,11 @@ class URLUnshortener:
                                     break
                             else:
                                 # Try to detect JavaScript redirects from response body
-                                if response.status == 200:
-                                    # Read a portion of the response to look for JavaScript redirects
-                                    html = await response.text(encoding='utf-8', errors='ignore')
+                                if response.status == 200 and response.content_type in HTML_CONTENT_TYPES:
+                                    # Read only the start of the page to look for JavaScript redirects
+                                    html = await self._read_body_start(response)
                                     js_redirect = self._extract_js_redirect(html)
-                                    
+                                
                                     if js_redirect:
                                         # Handle relative URLs for JavaScript redirects
                                         if not js_redirect.startswith(('http://', 'https://')):
@@ -306,18 +340,24 @@ class URLUnshortener:
                                                 js_redirect = f"{current_url.split('://', 1)[0]}://{current_domain}{js_redirect}"
                                             else:
                                                 js_redirect = f"{current_url.split('://', 1)[0]}://{current_domain}/{js_redirect}"
-                                        
+                                    
                                         if js_redirect not in redirect_history:
                                             redirect_history.append(js_redirect)
                                             current_url = js_redirect
                                             redirects += 1
                                             continue
-                                
+                            
                                 # No more redirects
                                 break
-                    except aiohttp.ClientError as e:
-                        logger.warning(f"GET request failed for {current_url}: {str(e)}")
-                        break
+                except aiohttp.ClientError as e:
+                    logger.warning(f"GET request failed for {current_url}: {str(e)}")
+                    break
+                except (HostUnavailable, asyncio.TimeoutError) as e:
+                    if len(redirect_history) == 1:
+                        return self._host_unavailable_result(url, current_host, e, redirect_history, start_time)
+                    # The redirect target is slow or down, but we already know where the link leads
+                    logger.warning(f"Stopped following redirects at unavailable host {current_host}: {current_url}")
+                    break
         
         except Exception as e:
             elapsed_time = time.time() - start_time
@@ -346,8 +386,8 @@ class URLUnshortener:
         }
     
     async def unshorten_with_selenium(self, url: str) -> Dict:
-        """Unshorten URL using Selenium headless browser."""
-        if not self.use_selenium:
+        """Unshorten URL using a headless browser from the pool, without blocking the event loop."""
+        if not self.use_selenium or not self.browser_pool.available:
             return {
                 "original_url": url,
                 "final_url": url,
@@ -355,44 +395,12 @@ class URLUnshortener:
                 "method": "selenium",
                 "error": "Selenium not available"
             }
-            
-        # Make sure Selenium is set up
-        if not self.selenium_initialized:
-            self._setup_selenium()
-            if not self.selenium_initialized:
-                return {
-                    "original_url": url,
-                    "final_url": url,
-                    "success": False,
-                    "method": "selenium",
-                    "error": "Failed to initialize Selenium"
-                }
         
         start_time = time.time()
-        redirect_history = [url]
         
         try:
-            # Navigate to the URL
-            self.driver.get(url)
-            
-            # Wait for the page to load
-            WebDriverWait(self.driver, self.timeout).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
-            
-            # Get current URL after potential redirects
-            current_url = self.driver.current_url
-            if current_url != url:
-                redirect_history.append(current_url)
-            
-            # Wait a bit more for any JavaScript redirects
-            time.sleep(1)
-            
-            # Check if URL changed again due to JS redirects
-            final_url = self.driver.current_url
-            if final_url != current_url and final_url not in redirect_history:
-                redirect_history.append(final_url)
-            
+            redirect_history = await self.browser_pool.navigate(url)
+            final_url = redirect_history[-1]
             elapsed_time = time.time() - start_time
             
             return {
@@ -405,7 +413,7 @@ class URLUnshortener:
                 "elapsed_time": round(elapsed_time, 3)
             }
             
-        except TimeoutException:
+        except (TimeoutError, asyncio.TimeoutError):
             elapsed_time = time.time() - start_time
             logger.warning(f"Timeout when unshortening URL with Selenium: {url}")
             return {
@@ -417,6 +425,16 @@ class URLUnshortener:
                 "elapsed_time": round(elapsed_time, 3)
             }
             
+        except BrowserPoolFull:
+            logger.warning(f"Headless browser queue full, not unshortening with Selenium: {url}")
+            return {
+                "original_url": url,
+                "final_url": url,
+                "success": False,
+                "method": "selenium",
+                "error": "Headless browser queue full"
+            }
+            
         except Exception as e:
             elapsed_time = time.time() - start_time
             logger.error(f"Error unshortening URL with Selenium: {str(e)}")
@@ -429,28 +447,39 @@ class URLUnshortener:
                 "elapsed_time": round(elapsed_time, 3)
             }
     
+    async def _read_body_start(self, response: aiohttp.ClientResponse) -> str:
+        """Read at most ``body_max_bytes`` of a response body, streamed, and decode it."""
+        chunks = []
+        size = 0
+        async for chunk in response.content.iter_chunked(16384):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= self.body_max_bytes:
+                break
+        body = b''.join(chunks)[:self.body_max_bytes]
+        try:
+            return body.decode(response.charset or 'utf-8', errors='ignore')
+        except LookupError:
+            return body.decode('utf-8', errors='ignore')
+    
     def _extract_js_redirect(self, html: str) -> Optional[str]:
         """Extract JavaScript redirect URL from HTML content."""
         if not html:
             return None
             
-        # Common JavaScript redirect patterns
-        patterns = [
-            r'window\.location\.href\s*=\s*[\'"]([^\'"]+)[\'"]',
-            r'window\.location\s*=\s*[\'"]([^\'"]+)[\'"]',
-            r'window\.location\.replace\([\'"]([^\'"]+)[\'"]\)',
-            r'window\.location\.assign\([\'"]([^\'"]+)[\'"]\)',
-            r'<meta\s+http-equiv=[\'"]refresh[\'"]\s+content=[\'"]0;\s*url=([^\'"]+)[\'"]',
-            r'<meta\s+content=[\'"]0;\s*url=([^\'"]+)[\'"]\s+http-equiv=[\'"]refresh[\'"]'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, html, re.IGNORECASE)
-            if match:
-                return match.group(1)
+        match = JS_REDIRECT_PATTERN.search(html)
+        if match:
+            return next(group for group in match.groups() if group)
                 
         return None
     
+    @staticmethod
+    def _canonicalize_result(result: Dict) -> Dict:
+        """Canonicalise the final URL of an unshortening result."""
+        if result.get("final_url"):
+            result["final_url"] = canonicalize_url(result["final_url"])
+        return result
+    
     async def unshorten_url(self, url: str) -> Dict:
         """
         Unshorten a URL using the best available method.
@@ -479,14 +508,70 @@ class URLUnshortener:
                 "error": "Empty URL provided"
             }
             
-        # Ensure URL has a scheme
-        if not url.startswith(('http://', 'https://')):
-            url = 'https://' + url
+        # Canonicalise so that variants of the same URL are treated identically
+        url = canonicalize_url(url)
+        
+        if self.cache is not None:
+            cached = self.cache.get(url)
+            if cached is not None:
+                return cached
+                
+        return await self._unshorten_canonical(url)
+        
+    async def _unshorten_canonical(self, url: str) -> Dict:
+        """Unshorten a canonical URL over the network and cache the outcome."""
+        # Bound the expansions running at once across all messages
+        async with self.concurrency:
+            result = await self._unshorten_uncached(url)
+        # A skipped URL was never probed; direct_hosts decides again once the host entry expires
+        if self.cache is not None and result.get("method") != "skipped":
+            self.cache.set(url, result)
+        return result
+        
+    def _should_chase(self, url: str) -> bool:
+        """
+        Decide whether a URL is worth following.
+        
+        Likely short links are always followed; other URLs only when their host
+        has not been seen serving a non-redirecting page recently.
+        """
+        if self.direct_hosts is None or self.is_shortened_url(url):
+            return True
+        return self.direct_hosts.get(self._get_domain_from_url(url)) is None
+        
+    def _record_host(self, url: str, result: Dict) -> None:
+        """Remember whether the host of a followed URL redirected."""
+        if self.direct_hosts is None or not result.get("success"):
+            return
+        host = self._get_domain_from_url(url)
+        if result.get("final_url") == url:
+            self.direct_hosts.set(host, True)
+        else:
+            self.direct_hosts.delete(host)
+        
+    async def _unshorten_uncached(self, url: str) -> Dict:
+        """Unshorten a canonical URL with requests, falling back to Selenium."""
+        if not self._should_chase(url):
+            self.skipped += 1
+            logger.debug(f"Not unshortening URL on a host known not to redirect: {url}")
+            return {
+                "original_url": url,
+                "final_url": url,
+                "success": True,
+                "method": "skipped",
+                "message": "Host does not redirect"
+            }
             
+        result = await self._unshorten_followed(url)
+        self._record_host(url, result)
+        return result
+        
+    async def _unshorten_followed(self, url: str) -> Dict:
+        """Follow the redirects of a canonical URL with requests, falling back to Selenium."""
         logger.info(f"Unshortening URL: {url}")
         
         # First try with requests (faster)
-        requests_result = await self.unshorten_with_requests(url)
+        requests_result = self._canonicalize_result(await self.unshorten_with_requests(url))
         
         # If requests method worked and found a different URL, we're done
         if (requests_result["success"] and 
@@ -495,10 +580,12 @@ class URLUnshortener:
             logger.info(f"Successfully unshortened URL with requests: {url} -> {requests_result['final_url']}")
             return requests_result
             
-        # If requests didn't work or didn't find a redirect, try Selenium if available
-        if self.use_selenium:
+        # If requests didn't work or didn't find a redirect, try Selenium if available;
+        # a browser would wait on a host that is timing out just the same
+        try_selenium = self.use_selenium and not requests_result.get("host_unavailable")
+        if try_selenium:
             logger.info(f"Trying to unshorten URL with Selenium: {url}")
-            selenium_result = await self.unshorten_with_selenium(url)
+            selenium_result = self._canonicalize_result(await self.unshorten_with_selenium(url))
             
             # If Selenium found a redirect, use its result
             if (selenium_result["success"] and 
@@ -510,14 +597,14 @@ class URLUnshortener:
         # If both methods failed or didn't find redirects, return the best result
         if requests_result["success"]:
             return requests_result
-        elif self.use_selenium and selenium_result.get("success", False):
+        elif try_selenium and selenium_result.get("success", False):
             return selenium_result
         else:
             # Both methods failed, combine error messages
             error_msg = []
             if "error" in requests_result:
                 error_msg.append(f"Requests error: {requests_result['error']}")
-            if self.use_selenium and "error" in selenium_result:
+            if try_selenium and "error" in selenium_result:
                 error_msg.append(f"Selenium error: {selenium_result['error']}")
                 
             logger.warning(f"Failed to unshorten URL: {url} - {' | '.join(error_msg)}")
@@ -545,19 +632,54 @@ class URLUnshortener:
             
         logger.info(f"Unshortening {len(urls)} URLs")
         
-        # Process URLs in parallel using asyncio.gather
-        tasks = [self.unshorten_url(url) for url in urls]
-        results = await asyncio.gather(*tasks)
-        
-        # Create a dictionary mapping original URLs to results
-        return {result["original_url"]: result for result in results}
+        if not self.enabled or self.cache is None:
+            # Process URLs in parallel using asyncio.gather
+            tasks = [self.unshorten_url(url) for url in urls]
+            results = await asyncio.gather(*tasks)
+            
+            # Create a dictionary mapping the URLs as passed in to their results
+            return dict(zip(urls, results))
+            
+        # Answer from the cache first; only the misses need network I/O
+        results = {}
+        misses: Dict[str, List[str]] = {}
+        for url in urls:
+            if not url:
+                results[url] = await self.unshorten_url(url)
+                continue
+            key = canonicalize_url(url)
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[url] = cached
+            else:
+                misses.setdefault(key, []).append(url)
+                
+        if misses:
+            logger.info(f"Unshortening cache: {len(urls) - sum(map(len, misses.values()))} hits, {len(misses)} to resolve")
+            keys = list(misses)
+            resolved = await asyncio.gather(*(self._unshorten_canonical(key) for key in keys))
+            for key, result in zip(keys, resolved):
+                for url in misses[key]:
+                    results[url] = result
+                    
+        # Keep the order of the URLs as passed in
+        return {url: results[url] for url in urls}
+    
+    def flush(self):
+        """Persist cached unshortening results immediately."""
+        if self.cache is not None:
+            self.cache.flush()
     
     def close(self):
         """Clean up resources."""
-        if self.selenium_initialized and self.driver:
-            try:
-                self.driver.quit()
-                self.selenium_initialized = False
-                logger.info("Selenium WebDriver closed")
-            except Exception as e:
-                logger.error(f"Error closing Selenium WebDriver: {str(e)}") 
\ No newline at end of file
+        logger.info(f"Unshortening host circuits: {self.host_guard.stats()}")
+        if self.direct_hosts is not None:
+            logger.info(f"URLs not unshortened on hosts known not to redirect: {self.skipped}")
+        if self.cache is not None:
+            logger.info(f"Unshortening cache: {self.cache.stats()}")
+            self.cache.close()
+            self.cache = None
+        try:
+            self.browser_pool.close()
+        except Exception as e:
+            logger.error(f"Error closing headless browser pool: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,221 @@
+"""
+VirusTotal request scheduler.
+
+This module keeps VirusTotal API usage inside the account quota. Every API
+request first takes a token from a per-minute and a per-day token bucket;
+callers that have to wait are queued by priority, so checks for new members
+and shortened links go first, and a caller whose wait budget runs out gets a
+"not now" answer it can turn into a pending verdict instead of an API error.
+"""
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Request priorities (lower value is served first)
+PRIORITY_HIGH = 0    # Messages from new members or with shortened links
+PRIORITY_NORMAL = 1  # Other messages
+PRIORITY_LOW = 2     # Background work such as blacklist re-verification
+
+PRIORITY_NAMES = {PRIORITY_HIGH: 'high', PRIORITY_NORMAL: 'normal', PRIORITY_LOW: 'low'}
+
+
+class TokenBucket:
+    """Token bucket refilled continuously, holding at most ``capacity`` tokens."""
+
+    def __init__(self, capacity: int, period: float):
+        """
+        Initialize a full bucket.
+
+        Args:
+            capacity: Maximum tokens, i.e. requests allowed per period
+            period: Seconds to refill an empty bucket completely
+        """
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        """Add the tokens accrued since the last update."""
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Return the seconds until a token is available (0 if one is available now)."""
+        self._refill(now)
+        blocked = max(0.0, self.blocked_until - now)
+        if self.tokens >= 1:
+            return blocked
+        return max(blocked, (1 - self.tokens) / self.rate)
+
+    def take(self, now: float) -> None:
+        """Consume one token (the caller checked ``wait_time`` first)."""
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, now: float, seconds: float) -> None:
+        """Empty the bucket and hand out no tokens for the given time."""
+        self._refill(now)
+        self.tokens = 0.0
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class VirusTotalScheduler:
+    """
+    Priority queue in front of the VirusTotal API, limited by token buckets.
+
+    Call ``acquire()`` before every API request. Requests are granted
+    immediately while tokens are available and nobody is waiting; otherwise
+    they are queued and granted in priority order (first come, first served
+    within a priority) as the buckets refill.
+    """
+
+    def __init__(self, per_minute: int, per_day: int, max_wait: Dict[int, float]):
+        """
+        Initialize the scheduler.
+
+        Args:
+            per_minute: Requests allowed per minute
+            per_day: Requests allowed per day
+            max_wait: Seconds each priority may wait for a token before giving up
+        """
+        self.minute_bucket = TokenBucket(per_minute, 60)
+        self.day_bucket = TokenBucket(per_day, 86400)
+        self.max_wait = max_wait
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+        # Accounting per priority name, plus API rate-limit responses
+        self.counters = {
+            name: {'granted': 0, 'denied': 0, 'waited': 0, 'wait_seconds': 0.0}
+            for name in PRIORITY_NAMES.values()
+        }
+        self.rate_limited = 0
+
+    def _wait_time(self, now: float) -> float:
+        """Return the seconds until both buckets have a token."""
+        return max(self.minute_bucket.wait_time(now), self.day_bucket.wait_time(now))
+
+    def _take(self, now: float) -> None:
+        """Consume a token from both buckets."""
+        self.minute_bucket.take(now)
+        self.day_bucket.take(now)
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL) -> bool:
+        """
+        Wait for permission to send one API request.
+
+        Args:
+            priority: One of the PRIORITY_* constants
+
+        Returns:
+            True if the request may be sent, False if the priority's wait budget
+            (or the daily quota) ran out first
+        """
+        counters = self.counters[PRIORITY_NAMES[priority]]
+        max_wait = self.max_wait.get(priority, 0)
+        now = time.monotonic()
+
+        if not self._waiters and self._wait_time(now) == 0:
+            self._take(now)
+            counters['granted'] += 1
+            return True
+
+        # Give up at once when the daily quota cannot recover within the budget
+        if max_wait <= 0 or self.day_bucket.wait_time(now) > max_wait:
+            counters['denied'] += 1
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        try:
+            granted = await asyncio.wait_for(future, max_wait)
+        except asyncio.TimeoutError:
+            granted = False
+        if not granted:
+            counters['denied'] += 1
+            return False
+
+        waited = time.monotonic() - now
+        counters['granted'] += 1
+        counters['waited'] += 1
+        counters['wait_seconds'] += waited
+        return True
+
+    async def _dispatch(self) -> None:
+        """Grant tokens to queued callers in priority order as the buckets refill."""
+        while self._waiters:
+            # Drop callers that stopped waiting
+            while self._waiters and self._waiters[0][2].done():
+                heapq.heappop(self._waiters)
+            if not self._waiters:
+                break
+
+            now = time.monotonic()
+            delay = self._wait_time(now)
+            if delay > 0:
+                # Re-evaluated on wake-up, as callers may have joined or left meanwhile
+                await asyncio.sleep(delay)
+                continue
+
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._take(now)
+                future.set_result(True)
+
+    def report_rate_limited(self, retry_after: Optional[float] = None) -> None:
+        """
+        Back off after the API answered 429 Too Many Requests.
+
+        Args:
+            retry_after: Seconds from the Retry-After header, if any
+        """
+        self.rate_limited += 1
+        seconds = retry_after if retry_after and retry_after > 0 else 60
+        self.minute_bucket.block(time.monotonic(), seconds)
+        logger.warning(f"VirusTotal rate limit hit, pausing requests for {seconds:.0f}s")
+
+    def stats(self) -> Dict:
+        """Return quota, queue and per-priority accounting."""
+        now = time.monotonic()
+        self.minute_bucket.wait_time(now)
+        self.day_bucket.wait_time(now)
+        priorities = {}
+        for name, counters in self.counters.items():
+            priorities[name] = {
+                'granted': counters['granted'],
+                'denied': counters['denied'],
+                'avg_wait': round(counters['wait_seconds'] / counters['waited'], 2) if counters['waited'] else 0.0
+            }
+        return {
+            'queued': sum(1 for _, _, future in self._waiters if not future.done()),
+            'minute_tokens': round(self.minute_bucket.tokens, 2),
+            'day_tokens': round(self.day_bucket.tokens, 2),
+            'rate_limited': self.rate_limited,
+            'priorities': priorities
+        }
+
+    async def close(self) -> None:
+        """Stop the dispatcher; queued callers are denied."""
+        for _, _, future in self._waiters:
+            if not future.done():
+                future.set_result(False)
+        self._waiters.clear()
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
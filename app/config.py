@@ -100,6 +100,28 @@ NOTION_FAQ_CHECK_ENABLED = os.getenv('NOTION_FAQ_CHECK_ENABLED', 'True').lower()
 CONTENT_MODERATION_ENABLED = os.getenv('CONTENT_MODERATION_ENABLED', 'True').lower() == 'true'
 CONTENT_MODERATION_NOTIFICATION_TIMEOUT = int(os.getenv('CONTENT_MODERATION_NOTIFICATION_TIMEOUT', '10'))  # seconds
 CONTENT_MODERATION_BYPASS_ROLES = [int(id.strip()) for id in os.getenv('CONTENT_MODERATION_BYPASS_ROLES', '').split(',') if id.strip()]  # Roles that bypass moderation
+CONTENT_MODERATION_IMAGES_PER_REQUEST = int(os.getenv('CONTENT_MODERATION_IMAGES_PER_REQUEST', '1'))  # Images sent with each moderation request; larger sets are split into parallel requests
+CONTENT_MODERATION_BATCH_ENABLED = os.getenv('CONTENT_MODERATION_BATCH_ENABLED', 'True').lower() == 'true'  # Moderate the texts of many messages with one request
+CONTENT_MODERATION_BATCH_MAX_SIZE = int(os.getenv('CONTENT_MODERATION_BATCH_MAX_SIZE', '16'))  # Maximum texts per batched moderation request
+CONTENT_MODERATION_BATCH_MAX_WAIT_MS = float(os.getenv('CONTENT_MODERATION_BATCH_MAX_WAIT_MS', '10'))  # Milliseconds a text waits for others before its batch is sent
+CONTENT_MODERATION_CACHE_ENABLED = os.getenv('CONTENT_MODERATION_CACHE_ENABLED', 'True').lower() == 'true'  # Reuse moderation and review verdicts for repeated text
+CONTENT_MODERATION_CACHE_MAX_ENTRIES = int(os.getenv('CONTENT_MODERATION_CACHE_MAX_ENTRIES', '10000'))  # Maximum cached verdicts of each kind
+CONTENT_MODERATION_CACHE_TTL = int(os.getenv('CONTENT_MODERATION_CACHE_TTL', '3600'))  # Seconds a verdict is reused
+CONTENT_MODERATION_PRECLASSIFIER_ENABLED = os.getenv('CONTENT_MODERATION_PRECLASSIFIER_ENABLED', 'True').lower() == 'true'  # Skip the moderation API for texts scored benign locally
+CONTENT_MODERATION_PRECLASSIFIER_THRESHOLD = float(os.getenv('CONTENT_MODERATION_PRECLASSIFIER_THRESHOLD', '0.8'))  # Minimum local benign score (0-1) to skip the API
+CONTENT_MODERATION_PRECLASSIFIER_MAX_LENGTH = int(os.getenv('CONTENT_MODERATION_PRECLASSIFIER_MAX_LENGTH', '40'))  # Letters after which a text scores 0
+CONTENT_MODERATION_PRECLASSIFIER_SHADOW_RATE = float(os.getenv('CONTENT_MODERATION_PRECLASSIFIER_SHADOW_RATE', '0.02'))  # Share of skipped texts still sent to the API to measure agreement
+CONTENT_MODERATION_PRECLASSIFIER_EXTRA_TERMS = [term.strip() for term in os.getenv('CONTENT_MODERATION_PRECLASSIFIER_EXTRA_TERMS', '').split(',') if term.strip()]  # Extra words that always go to the API
+IMAGE_MODERATION_CACHE_ENABLED = os.getenv('IMAGE_MODERATION_CACHE_ENABLED', 'True').lower() == 'true'  # Reuse image verdicts by perceptual hash and block known-bad images
+IMAGE_MODERATION_CACHE_MAX_ENTRIES = int(os.getenv('IMAGE_MODERATION_CACHE_MAX_ENTRIES', '10000'))  # Maximum cached image verdicts
+IMAGE_MODERATION_CACHE_TTL = int(os.getenv('IMAGE_MODERATION_CACHE_TTL', '86400'))  # Seconds an image verdict is reused
+IMAGE_MODERATION_HASH_DISTANCE = int(os.getenv('IMAGE_MODERATION_HASH_DISTANCE', '4'))  # Differing hash bits (of 64) for two images to count as the same
+IMAGE_MODERATION_HASH_WORKERS = int(os.getenv('IMAGE_MODERATION_HASH_WORKERS', '2'))  # Threads hashing images
+IMAGE_MODERATION_MAX_DOWNLOAD_MB = float(os.getenv('IMAGE_MODERATION_MAX_DOWNLOAD_MB', '8'))  # Larger images are not hashed
+IMAGE_BLOCKLIST_DB = os.getenv('IMAGE_BLOCKLIST_DB', os.path.join(DB_ROOT, 'image_blocklist.db'))  # Hashes of known-bad images
+IMAGE_BLOCKLIST_AUTO_ADD = os.getenv('IMAGE_BLOCKLIST_AUTO_ADD', 'True').lower() == 'true'  # Block images that keep being posted in confirmed violations
+IMAGE_BLOCKLIST_AFTER_VIOLATIONS = int(os.getenv('IMAGE_BLOCKLIST_AFTER_VIOLATIONS', '2'))  # Confirmed violations with an image before it is blocked
+IMAGE_BLOCKLIST_TTL_DAYS = float(os.getenv('IMAGE_BLOCKLIST_TTL_DAYS', '30'))  # Days a blocked image hash stays blocked, 0 = never expire
 MUTE_ROLE_NAME = os.getenv('MUTE_ROLE_NAME', 'Muted')  # Name of the role to use for muting users
 MUTE_ROLE_ID = int(os.getenv('MUTE_ROLE_ID', '0'))  # ID of the role to use for muting users
 
@@ -114,17 +136,77 @@ URL_SAFETY_MAX_URLS = int(os.getenv('URL_SAFETY_MAX_URLS', '5'))  # Maximum URLs
 URL_SAFETY_MAX_RETRIES = int(os.getenv('URL_SAFETY_MAX_RETRIES', '3'))
 URL_SAFETY_RETRY_DELAY = int(os.getenv('URL_SAFETY_RETRY_DELAY', '2'))  # Base delay in seconds (will use exponential backoff)
 URL_SAFETY_REQUEST_TIMEOUT = float(os.getenv('URL_SAFETY_REQUEST_TIMEOUT', '5.0'))  # Timeout in seconds
+URL_SAFETY_CONCURRENT_CHECKS = int(os.getenv('URL_SAFETY_CONCURRENT_CHECKS', '3'))  # URLs of one message checked at the same time
+URL_SAFETY_COALESCE_TTL = float(os.getenv('URL_SAFETY_COALESCE_TTL', '60'))  # Seconds a finished check is shared with later callers for the same URL (0 = only while in flight)
+
+# VirusTotal API quota (the public API allows 4 requests per minute and 500 per day)
+URL_SAFETY_VT_REQUESTS_PER_MINUTE = int(os.getenv('URL_SAFETY_VT_REQUESTS_PER_MINUTE', '4'))
+URL_SAFETY_VT_REQUESTS_PER_DAY = int(os.getenv('URL_SAFETY_VT_REQUESTS_PER_DAY', '500'))
+URL_SAFETY_VT_MAX_WAIT = float(os.getenv('URL_SAFETY_VT_MAX_WAIT', '20'))  # Seconds a normal check waits for quota before it is reported as pending
+URL_SAFETY_VT_HIGH_PRIORITY_MAX_WAIT = float(os.getenv('URL_SAFETY_VT_HIGH_PRIORITY_MAX_WAIT', '90'))  # Same for new members and shortened links
+URL_SAFETY_NEW_MEMBER_DAYS = float(os.getenv('URL_SAFETY_NEW_MEMBER_DAYS', '7'))  # Members who joined within this many days get high-priority checks
+
+# Background completion of VirusTotal analyses (newly submitted URLs)
+URL_SAFETY_ASYNC_ANALYSIS = os.getenv('URL_SAFETY_ASYNC_ANALYSIS', 'True').lower() == 'true'  # Release the caller after submission and finish the analysis in the background
+URL_SAFETY_ANALYSIS_DB = os.getenv('URL_SAFETY_ANALYSIS_DB', os.path.join(DB_ROOT, 'url_analyses.db'))  # Pending analyses and the messages waiting on them
+URL_SAFETY_ANALYSIS_POLL_INTERVAL = float(os.getenv('URL_SAFETY_ANALYSIS_POLL_INTERVAL', '15'))  # Seconds between poller rounds (and until an analysis is first polled)
+URL_SAFETY_ANALYSIS_POLL_BATCH = int(os.getenv('URL_SAFETY_ANALYSIS_POLL_BATCH', '4'))  # Analyses polled per round
+URL_SAFETY_ANALYSIS_MAX_AGE = float(os.getenv('URL_SAFETY_ANALYSIS_MAX_AGE', '3600'))  # Seconds after which an unfinished analysis is dropped
+
+# URL Safe Verdict Cache Configuration
+URL_SAFE_CACHE_ENABLED = os.getenv('URL_SAFE_CACHE_ENABLED', 'True').lower() == 'true'
+URL_SAFE_CACHE_TTL = float(os.getenv('URL_SAFE_CACHE_TTL', '21600'))  # Seconds a safe verdict is reused (6 hours)
+URL_SAFE_CACHE_MAX_ENTRIES = int(os.getenv('URL_SAFE_CACHE_MAX_ENTRIES', '50000'))  # Least recently used verdicts evicted beyond this
+# Trusted domains (and their subdomains) whose URLs are treated as safe without unshortening or API checks
+URL_SAFE_DOMAINS = [
+    domain.strip() for domain in os.getenv('URL_SAFE_DOMAINS', '').split(',') if domain.strip()
+]
+
+# URL canonicalisation: query parameters removed before URLs are used as blacklist/cache keys ('*' suffix = prefix match)
+URL_CANONICAL_STRIP_PARAMS = [
+    param.strip() for param in os.getenv(
+        'URL_CANONICAL_STRIP_PARAMS',
+        'utm_*,fbclid,gclid,dclid,msclkid,igshid,mc_cid,mc_eid,yclid,_hsenc,_hsmi,ref_src,si'
+    ).split(',') if param.strip()
+]
 
 # URL Unshortening Configuration
 URL_UNSHORTEN_ENABLED = os.getenv('URL_UNSHORTEN_ENABLED', 'True').lower() == 'true'
 URL_UNSHORTEN_TIMEOUT = float(os.getenv('URL_UNSHORTEN_TIMEOUT', '5.0'))  # Timeout in seconds
 URL_UNSHORTEN_MAX_REDIRECTS = int(os.getenv('URL_UNSHORTEN_MAX_REDIRECTS', '10'))
 URL_UNSHORTEN_RETRY_COUNT = int(os.getenv('URL_UNSHORTEN_RETRY_COUNT', '2'))
+URL_UNSHORTEN_MAX_CONCURRENCY = int(os.getenv('URL_UNSHORTEN_MAX_CONCURRENCY', '20'))  # URL expansions running at the same time
+URL_UNSHORTEN_PER_HOST_LIMIT = int(os.getenv('URL_UNSHORTEN_PER_HOST_LIMIT', '4'))  # Concurrent requests to one host
+URL_UNSHORTEN_CIRCUIT_FAILURES = int(os.getenv('URL_UNSHORTEN_CIRCUIT_FAILURES', '3'))  # Consecutive timeouts before a host is skipped
+URL_UNSHORTEN_CIRCUIT_RESET = float(os.getenv('URL_UNSHORTEN_CIRCUIT_RESET', '60'))  # Seconds before a skipped host is probed again
+URL_UNSHORTEN_BROWSER_WORKERS = int(os.getenv('URL_UNSHORTEN_BROWSER_WORKERS', '2'))  # Headless browsers loading pages at the same time (Selenium only)
+URL_UNSHORTEN_BROWSER_QUEUE_SIZE = int(os.getenv('URL_UNSHORTEN_BROWSER_QUEUE_SIZE', '20'))  # Jobs waiting for a browser before new ones are rejected
+URL_UNSHORTEN_BROWSER_JOB_TIMEOUT = float(os.getenv('URL_UNSHORTEN_BROWSER_JOB_TIMEOUT', '20'))  # Seconds a browser expansion may take, including queueing
+URL_UNSHORTEN_TARGETED = os.getenv('URL_UNSHORTEN_TARGETED', 'True').lower() == 'true'  # Skip URLs on hosts recently seen not to redirect, unless they look like short links
+URL_UNSHORTEN_BODY_MAX_KB = float(os.getenv('URL_UNSHORTEN_BODY_MAX_KB', '64'))  # Kilobytes of a page searched for JavaScript redirects
+URL_UNSHORTEN_CACHE_ENABLED = os.getenv('URL_UNSHORTEN_CACHE_ENABLED', 'True').lower() == 'true'
+URL_UNSHORTEN_CACHE_FILE = os.getenv('URL_UNSHORTEN_CACHE_FILE', os.path.join(DB_ROOT, 'url_unshorten_cache.db'))  # Persisted unshortening results
+URL_UNSHORTEN_CACHE_TTL = float(os.getenv('URL_UNSHORTEN_CACHE_TTL', '86400'))  # Seconds an expanded URL is reused (1 day)
+URL_UNSHORTEN_CACHE_NEGATIVE_TTL = float(os.getenv('URL_UNSHORTEN_CACHE_NEGATIVE_TTL', '21600'))  # Seconds a URL that did not redirect is not probed again (6 hours)
+URL_UNSHORTEN_CACHE_MAX_ENTRIES = int(os.getenv('URL_UNSHORTEN_CACHE_MAX_ENTRIES', '50000'))
 
 # URL Blacklist Configuration
 URL_BLACKLIST_ENABLED = os.getenv('URL_BLACKLIST_ENABLED', 'True').lower() == 'true'
-URL_BLACKLIST_FILE = os.getenv('URL_BLACKLIST_FILE', os.path.join(DB_ROOT, 'url_blacklist.json'))
+URL_BLACKLIST_FILE = os.getenv('URL_BLACKLIST_FILE', os.path.join(DB_ROOT, 'url_blacklist.json'))  # Legacy JSON file (import/export and 'json' backend)
+URL_BLACKLIST_STORAGE = os.getenv('URL_BLACKLIST_STORAGE', 'sqlite').lower()  # sqlite or json
+URL_BLACKLIST_DB_FILE = os.getenv('URL_BLACKLIST_DB_FILE', os.path.join(DB_ROOT, 'url_blacklist.db'))  # SQLite database for the 'sqlite' backend
 URL_BLACKLIST_AUTO_DOMAIN = os.getenv('URL_BLACKLIST_AUTO_DOMAIN', 'False').lower() == 'true'  # Auto-blacklist domains for severe threats
+URL_BLACKLIST_BLOOM_ENABLED = os.getenv('URL_BLACKLIST_BLOOM_ENABLED', 'True').lower() == 'true'  # Bloom filter in front of URL lookups
+URL_BLACKLIST_BLOOM_CAPACITY = int(os.getenv('URL_BLACKLIST_BLOOM_CAPACITY', '1000000'))  # Minimum number of URLs the filter is sized for
+URL_BLACKLIST_BLOOM_ERROR_RATE = float(os.getenv('URL_BLACKLIST_BLOOM_ERROR_RATE', '0.001'))  # Target false-positive rate
+URL_BLACKLIST_BLOOM_MAX_MB = float(os.getenv('URL_BLACKLIST_BLOOM_MAX_MB', '64'))  # Memory budget for the filter in MB
+URL_BLACKLIST_URL_TTL_DAYS = float(os.getenv('URL_BLACKLIST_URL_TTL_DAYS', '180'))  # Expiry of detected URLs, 0 = never
+URL_BLACKLIST_DOMAIN_TTL_DAYS = float(os.getenv('URL_BLACKLIST_DOMAIN_TTL_DAYS', '365'))  # Expiry of detected domains, 0 = never
+URL_BLACKLIST_REVERIFY_DAYS = float(os.getenv('URL_BLACKLIST_REVERIFY_DAYS', '30'))  # Re-check detected URLs after this many days, 0 = never
+URL_BLACKLIST_REVERIFY_BATCH = int(os.getenv('URL_BLACKLIST_REVERIFY_BATCH', '4'))  # URLs re-checked per round
+URL_BLACKLIST_REVERIFY_INTERVAL = float(os.getenv('URL_BLACKLIST_REVERIFY_INTERVAL', '3600'))  # Seconds between re-verification rounds
+URL_BLACKLIST_SHORTENED_TTL_DAYS = float(os.getenv('URL_BLACKLIST_SHORTENED_TTL_DAYS', '30'))  # Drop shortened URL mappings unused this long, 0 = never
+URL_BLACKLIST_SHORTENED_MAX_ENTRIES = int(os.getenv('URL_BLACKLIST_SHORTENED_MAX_ENTRIES', '100000'))  # LRU cap for shortened URL mappings, 0 = unbounded
 
 # Known impersonation and phishing domains to explicitly block
 URL_SAFETY_IMPERSONATION_DOMAINS = [
@@ -135,6 +217,34 @@ URL_SAFETY_IMPERSONATION_DOMAINS = [
     ).split(',') if domain.strip()
 ]
 
+# Local impersonation (typosquat/homoglyph) detection, no network access needed
+URL_IMPERSONATION_CHECK_ENABLED = os.getenv('URL_IMPERSONATION_CHECK_ENABLED', 'True').lower() == 'true'
+URL_IMPERSONATION_THRESHOLD = float(os.getenv('URL_IMPERSONATION_THRESHOLD', '0.8'))  # Score (0-1) at which a host is treated as impersonation
+# Official domains of protected brands; their subdomains are never flagged
+URL_SAFETY_PROTECTED_DOMAINS = [
+    domain.strip() for domain in os.getenv(
+        'URL_SAFETY_PROTECTED_DOMAINS',
+        'discord.com,discord.gg,discord.gift,discord.media,discordapp.com,discordapp.net,discordstatus.com,'
+        'steamcommunity.com,steampowered.com,steamstatic.com,roblox.com,minecraft.net,nintendo.com,'
+        'playstation.com,epicgames.com,paypal.com,github.com,github.io'
+    ).split(',') if domain.strip()
+]
+# Legitimate domains that look like a protected brand; they and their subdomains are never flagged
+URL_IMPERSONATION_ALLOWED_DOMAINS = [
+    domain.strip() for domain in os.getenv(
+        'URL_IMPERSONATION_ALLOWED_DOMAINS',
+        'paypay.ne.jp,paypay.com,discords.com,mindcraft.com,epicgame.com,github.community,githubusercontent.com,'
+        'githubassets.com,nintendo.co.jp,nintendo.net,nintendo.co.uk,nintendo.de,playstation.net,sonyentertainmentnetwork.com'
+    ).split(',') if domain.strip()
+]
+# Words that make a brand name inside another domain more suspicious
+URL_IMPERSONATION_LURE_WORDS = [
+    word.strip() for word in os.getenv(
+        'URL_IMPERSONATION_LURE_WORDS',
+        'gift,nitro,free,login,verify,claim,airdrop,promo,reward,giveaway,auth,account,security,support,trade'
+    ).split(',') if word.strip()
+]
+
 # Map of threat types to severity levels (0-10)
 URL_SAFETY_SEVERITY_LEVELS = {
     'PHISHING': 9,
@@ -158,6 +268,14 @@ MODERATION_QUEUE_CHECK_INTERVAL = float(os.getenv('MODERATION_QUEUE_CHECK_INTERV
 MODERATION_QUEUE_RETRY_INTERVAL = float(os.getenv('MODERATION_QUEUE_RETRY_INTERVAL', '5.0'))  # 重試間隔（秒）
 MODERATION_QUEUE_MAX_RETRIES = int(os.getenv('MODERATION_QUEUE_MAX_RETRIES', '5'))  # 最大重試次數
 
+# Shared HTTP Client Configuration (VirusTotal, URL unshortening, image downloads)
+HTTP_POOL_LIMIT = int(os.getenv('HTTP_POOL_LIMIT', '100'))  # Maximum open connections in total
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', '10'))  # Maximum open connections per host
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', '30'))  # Seconds an idle connection is kept for reuse
+HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', '300'))  # Seconds DNS results are cached
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5.0'))  # Seconds to establish a connection
+HTTP_TOTAL_TIMEOUT = float(os.getenv('HTTP_TOTAL_TIMEOUT', '30.0'))  # Default seconds for a whole request
+
 # Message Types (for classifier)
 MESSAGE_TYPES = {
     'SEARCH': 'search',      # Requires information search
@@ -0,0 +1,100 @@
+"""
+Shared HTTP client.
+
+This module provides one process-wide ``aiohttp.ClientSession`` for all outbound
+HTTP (VirusTotal, URL unshortening and image downloads). Sharing the session's
+connection pool keeps connections alive between requests, caches DNS results and
+bounds the number of connections opened to any single host, instead of paying
+DNS, TCP and TLS setup for every call.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+import aiohttp
+
+from app.config import (
+    HTTP_POOL_LIMIT,
+    HTTP_POOL_LIMIT_PER_HOST,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_TOTAL_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPClient:
+    """
+    Lazily created, pooled HTTP session shared by every service.
+
+    The session is opened on first use so it binds to the running event loop,
+    and is reopened transparently if it was closed. Callers must not close the
+    session they get; ``close()`` is called once at shutdown.
+    """
+
+    def __init__(self,
+                 limit: int = HTTP_POOL_LIMIT,
+                 limit_per_host: int = HTTP_POOL_LIMIT_PER_HOST,
+                 keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT,
+                 dns_cache_ttl: int = HTTP_DNS_CACHE_TTL,
+                 connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+                 total_timeout: float = HTTP_TOTAL_TIMEOUT):
+        """
+        Initialize the client configuration.
+
+        Args:
+            limit: Maximum open connections in total
+            limit_per_host: Maximum open connections per host (0 = unlimited)
+            keepalive_timeout: Seconds an idle connection is kept for reuse
+            dns_cache_ttl: Seconds DNS results are cached
+            connect_timeout: Seconds to acquire a connection and connect
+            total_timeout: Default seconds for a whole request (overridable per request)
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, opening it on first use."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_cache_ttl,
+                use_dns_cache=True
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            logger.info(
+                f"Opened shared HTTP session (limit {self.limit}, {self.limit_per_host} per host, "
+                f"keep-alive {self.keepalive_timeout}s, DNS cache {self.dns_cache_ttl}s)"
+            )
+        return self._session
+
+    async def close(self) -> None:
+        """Close the shared session and its pooled connections."""
+        session, self._session = self._session, None
+        if session is not None and not session.closed:
+            await session.close()
+            # Give SSL transports a moment to shut down cleanly
+            await asyncio.sleep(0.25)
+            logger.info("Closed shared HTTP session")
+
+
+# Create a global instance of the shared HTTP client
+http_client = HTTPClient()
+
+
+async def get_http_session() -> aiohttp.ClientSession:
+    """Return the process-wide shared HTTP session."""
+    return await http_client.get_session()
+
+
+async def close_http_client() -> None:
+    """Close the process-wide shared HTTP session at shutdown."""
+    await http_client.close()
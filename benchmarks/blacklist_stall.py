@@ -0,0 +1,166 @@
+"""
+Measure how long URL blacklist lookups stall the event loop during a large save.
+
+Fills a temporary blacklist, then runs lookups on the event loop every
+millisecond (known shortened URLs, blacklisted URLs and unknown URLs) while a
+background thread writes --batch URLs per transaction, purges and flushes, as
+the save thread and the threat feed importer do. Exits with status 1 if a
+lookup blocked the loop for longer than --max-stall-ms, so it can be run as a
+regression test; a lookup that waited for the writer's lock or transaction
+would block it for the whole batch.
+
+The gaps between loop ticks are reported as well. They also include pauses
+the blacklist does not cause: the writer thread holding the GIL (Python
+switches threads every 5 ms) and full garbage collections while the writer
+holds hundreds of thousands of rows, which are reported separately.
+
+Usage (from the repository root):
+    python benchmarks/blacklist_stall.py [--backend sqlite] [--batch 200000] [--seconds 5]
+
+The repository has no test suite; the same check with a smaller batch on both
+backends can be collected by pytest:
+    python -m pytest benchmarks/blacklist_stall.py
+"""
+import os
+import sys
+import time
+import gc
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ai.service.url_blacklist import URLBlacklist
+
+SHORTENED = 200
+MAX_STALL_MS = 50
+
+
+def writer(blacklist: URLBlacklist, batch: int, stop: threading.Event, rounds: list) -> None:
+    """Write, purge and flush in a loop, like a large import running next to the save thread."""
+    round_number = 0
+    while not stop.is_set():
+        entries = [
+            (f"https://bulk{round_number}.example/{i}", {'reason': 'benchmark', 'threat_types': ['MALWARE']})
+            for i in range(batch)
+        ]
+        started = time.perf_counter()
+        blacklist.add_urls(entries)
+        blacklist.purge_expired()
+        blacklist.flush()
+        rounds.append(time.perf_counter() - started)
+        round_number += 1
+
+
+async def probe(blacklist: URLBlacklist, stop: threading.Event) -> tuple:
+    """Look URLs up every millisecond; return the tick gaps and lookup times in seconds."""
+    gaps, lookups = [], []
+    urls = [f"https://sho.rt/{i}" for i in range(SHORTENED)]
+    urls += ["https://phish.example/0", "https://unknown.example/page"]
+    last = time.perf_counter()
+    i = 0
+    while not stop.is_set():
+        await asyncio.sleep(0.001)
+        # The gap includes the previous lookup, which ran on the loop
+        now = time.perf_counter()
+        gaps.append(now - last - 0.001)
+        last = now
+        blacklist.is_blacklisted(urls[i % len(urls)])
+        lookups.append(time.perf_counter() - now)
+        i += 1
+    return gaps, lookups
+
+
+def collect_pauses(pauses: list):
+    """Return a gc callback appending the duration of each collection to ``pauses``."""
+    started = [0.0]
+
+    def callback(phase, info):
+        if phase == 'start':
+            started[0] = time.perf_counter()
+        else:
+            pauses.append(time.perf_counter() - started[0])
+    return callback
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def measure(backend: str, batch: int, seconds: float) -> tuple:
+    """Run the writer next to the probe; return the save durations, tick gaps, lookup times and GC pauses."""
+    with tempfile.TemporaryDirectory() as directory:
+        blacklist = URLBlacklist(
+            blacklist_file=os.path.join(directory, 'url_blacklist.json'),
+            storage_backend=backend,
+            db_file=os.path.join(directory, 'url_blacklist.db'),
+            shortened_ttl=86400,
+            shortened_max_entries=SHORTENED * 2
+        )
+        blacklist.add_url("https://phish.example/0", {'reason': 'benchmark'})
+        for i in range(SHORTENED):
+            blacklist.add_shortened_url(f"https://sho.rt/{i}", "https://phish.example/0")
+        blacklist.flush()
+
+        stop = threading.Event()
+        rounds, pauses = [], []
+        callback = collect_pauses(pauses)
+        gc.callbacks.append(callback)
+        try:
+            thread = threading.Thread(target=writer, args=(blacklist, batch, stop, rounds), daemon=True)
+            thread.start()
+            loop = asyncio.get_running_loop()
+            loop.call_later(seconds, stop.set)
+            gaps, lookups = await probe(blacklist, stop)
+            thread.join()
+        finally:
+            gc.callbacks.remove(callback)
+            blacklist.close()
+    return rounds, gaps, lookups, pauses
+
+
+async def main(args: argparse.Namespace) -> int:
+    rounds, gaps, lookups, pauses = await measure(args.backend, args.batch, args.seconds)
+
+    max_lookup = max(lookups) * 1000
+    print(
+        f"{args.backend}: {len(rounds)} saves of {args.batch} URLs "
+        f"(mean {sum(rounds) / max(len(rounds), 1):.2f}s), {len(lookups)} lookups"
+    )
+    print(
+        f"lookups: p50 {percentile(lookups, 0.5) * 1000:.2f} ms, p99 {percentile(lookups, 0.99) * 1000:.2f} ms, "
+        f"max {max_lookup:.2f} ms"
+    )
+    print(
+        f"loop tick gaps: p50 {percentile(gaps, 0.5) * 1000:.2f} ms, p99 {percentile(gaps, 0.99) * 1000:.2f} ms, "
+        f"max {max(gaps) * 1000:.2f} ms; longest garbage collection {max(pauses, default=0) * 1000:.2f} ms"
+    )
+    if max_lookup > args.max_stall_ms:
+        print(f"FAIL: a lookup blocked the event loop for {max_lookup:.0f} ms (limit {args.max_stall_ms:.0f} ms)")
+        return 1
+    return 0
+
+
+def test_lookups_do_not_block_event_loop():
+    """Lookups stay under the stall limit while a writer saves, purges and flushes."""
+    for backend in ('sqlite', 'json'):
+        _, _, lookups, _ = asyncio.run(measure(backend, batch=20000, seconds=1))
+        assert lookups, f"{backend}: no lookups ran"
+        max_lookup = max(lookups) * 1000
+        assert max_lookup <= MAX_STALL_MS, (
+            f"{backend}: a lookup blocked the event loop for {max_lookup:.0f} ms (limit {MAX_STALL_MS} ms)"
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=('sqlite', 'json'), default='sqlite', help="Storage backend")
+    parser.add_argument('--batch', type=int, default=200000, help="URLs written per transaction")
+    parser.add_argument('--seconds', type=float, default=5, help="How long to measure")
+    parser.add_argument('--max-stall-ms', type=float, default=MAX_STALL_MS, help="Fail if a lookup blocks the loop longer than this")
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(asyncio.run(main(parser.parse_args())))
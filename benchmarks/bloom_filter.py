@@ -0,0 +1,109 @@
+"""
+Benchmark the Bloom filter in front of the URL blacklist.
+
+First measures the filter alone: memory, membership test time and the
+false-positive rate for N keys. Then opens a SQLite URL blacklist of
+--blacklist-keys URLs in a temporary directory, with and without the filter,
+and times ``is_blacklisted`` for URLs that are not blacklisted and for URLs
+that are.
+
+Usage (from the repository root):
+    python benchmarks/bloom_filter.py [--keys 1000000] [--blacklist-keys 200000]
+"""
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ai.service.bloom_filter import BloomFilter
+from app.ai.service.url_blacklist import URLBlacklist
+from app.ai.service.url_blacklist_storage import SQLiteBlacklistStorage
+
+PROBES = 200000
+
+
+def phish_url(i: int) -> str:
+    return f"https://phish{i}.example/login/{i}"
+
+
+def benchmark_filter(keys: int, error_rate: float) -> None:
+    """Measure the filter on its own."""
+    started = time.perf_counter()
+    bloom = BloomFilter(keys, error_rate)
+    bloom.update(phish_url(i) for i in range(keys))
+    build = time.perf_counter() - started
+
+    probes = [f"https://benign{i}.example/page" for i in range(PROBES)]
+    started = time.perf_counter()
+    false_positives = sum(1 for url in probes if url in bloom)
+    miss = (time.perf_counter() - started) / len(probes) * 1e6
+
+    hits = [phish_url(i) for i in random.sample(range(keys), min(keys, PROBES))]
+    started = time.perf_counter()
+    assert all(url in bloom for url in hits)
+    hit = (time.perf_counter() - started) / len(hits) * 1e6
+
+    print(
+        f"filter, {keys} keys: {bloom.size_bytes / 1024 / 1024:.1f} MB, {bloom.num_hashes} hashes, "
+        f"built in {build:.1f}s, miss {miss:.2f}us, hit {hit:.2f}us, "
+        f"false positives {false_positives / len(probes):.4%} (target {error_rate:.4%})"
+    )
+
+
+def benchmark_blacklist(keys: int, error_rate: float) -> None:
+    """Measure ``is_blacklisted`` on a SQLite blacklist with and without the filter."""
+    with tempfile.TemporaryDirectory() as directory:
+        db_file = os.path.join(directory, 'url_blacklist.db')
+        storage = SQLiteBlacklistStorage(db_file)
+        metadata = {'reason': 'Phishing', 'threat_types': ['PHISHING'], 'severity': 9}
+        for start in range(0, keys, 50000):
+            storage.put_many('urls', ((phish_url(i), metadata) for i in range(start, min(start + 50000, keys))))
+        storage.close()
+
+        probes = [f"https://benign{i}.example/page" for i in range(PROBES // 10)]
+        hits = [phish_url(i) for i in random.sample(range(keys), min(keys, PROBES // 10))]
+        for bloom_enabled in (False, True):
+            blacklist = URLBlacklist(
+                os.path.join(directory, 'url_blacklist.json'), storage_backend='sqlite', db_file=db_file,
+                bloom_enabled=bloom_enabled, bloom_capacity=keys, bloom_error_rate=error_rate
+            )
+            # The filter is built in the background; lookups bypass it until it is ready
+            while bloom_enabled and blacklist.bloom is None:
+                time.sleep(0.05)
+
+            started = time.perf_counter()
+            for url in probes:
+                blacklist.is_blacklisted(url)
+            miss = (time.perf_counter() - started) / len(probes) * 1e6
+            started = time.perf_counter()
+            for url in hits:
+                assert blacklist.is_blacklisted(url)
+            hit = (time.perf_counter() - started) / len(hits) * 1e6
+            print(
+                f"blacklist, {keys} URLs, bloom {'on ' if bloom_enabled else 'off'}: "
+                f"not blacklisted {miss:.1f}us, blacklisted {hit:.1f}us"
+            )
+            blacklist.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--keys', type=int, default=1000000, help="Keys in the standalone filter")
+    parser.add_argument('--blacklist-keys', type=int, default=200000, help="URLs in the SQLite blacklist (0 = skip)")
+    parser.add_argument('--error-rate', type=float, default=0.001, help="Target false-positive rate")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    random.seed(0)
+    benchmark_filter(args.keys, args.error_rate)
+    if args.blacklist_keys:
+        benchmark_blacklist(args.blacklist_keys, args.error_rate)
+
+
+if __name__ == '__main__':
+    main()
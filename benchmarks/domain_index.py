@@ -0,0 +1,53 @@
+"""
+Benchmark the domain suffix index used by URL blacklist lookups.
+
+Builds a DomainSuffixIndex over N synthetic blacklisted domains and measures
+the lookup time of subdomain hits and of unrelated hosts, next to an index of
+a single domain, to show that lookups do not grow with the index size.
+
+Usage (from the repository root):
+    python benchmarks/domain_index.py [--domains 1000000] [--lookups 200000]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ai.service.domain_index import DomainSuffixIndex
+
+
+def time_lookups(index: DomainSuffixIndex, hosts) -> float:
+    """Return the mean lookup time in microseconds."""
+    started = time.perf_counter()
+    for host in hosts:
+        index.find(host)
+    return (time.perf_counter() - started) / len(hosts) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--domains', type=int, default=1000000, help="Blacklisted domains in the large index")
+    parser.add_argument('--lookups', type=int, default=200000, help="Lookups per measurement")
+    args = parser.parse_args()
+
+    hits = [f"login.www.phish{i % args.domains}.example" for i in range(args.lookups)]
+    misses = [f"cdn{i}.benign-site{i}.org" for i in range(args.lookups)]
+
+    for size in (1, args.domains):
+        started = time.perf_counter()
+        index = DomainSuffixIndex(f"phish{i}.example" for i in range(size))
+        build = time.perf_counter() - started
+        # Every hit host must resolve to its blacklisted parent domain
+        assert index.find(hits[0]) == 'phish0.example'
+        hit_hosts = hits if size == args.domains else [hits[0]] * args.lookups
+        print(
+            f"{size:>9} domains: built in {build:.2f}s, "
+            f"subdomain hit {time_lookups(index, hit_hosts):.2f}us, "
+            f"unrelated host {time_lookups(index, misses):.2f}us"
+        )
+
+
+if __name__ == '__main__':
+    main()
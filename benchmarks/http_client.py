@@ -0,0 +1,124 @@
+"""
+Benchmark the shared, pooled HTTP session against a session per request.
+
+Starts a local aiohttp server (HTTP, and HTTPS with a throwaway self-signed
+certificate when ``openssl`` is available) and sends the same requests once
+with a new ClientSession per request, as the services did before, and once
+through the shared HTTPClient, sequentially and with 20 in flight. The local
+server has no network latency, so real gains against remote hosts are larger.
+
+Usage (from the repository root):
+    python benchmarks/http_client.py [--requests 300]
+"""
+import os
+import ssl
+import sys
+import time
+import shutil
+import socket
+import asyncio
+import logging
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+from aiohttp import web
+
+from app.services.http_client import HTTPClient
+
+CONCURRENCY = 20
+
+
+async def handler(request: web.Request) -> web.Response:
+    return web.json_response({'data': {'attributes': {'last_analysis_stats': {'harmless': 70}}}})
+
+
+def free_port() -> int:
+    """Return a TCP port that is free on localhost."""
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def make_certificate(directory: str):
+    """Create a self-signed certificate for localhost, or return None without openssl."""
+    if not shutil.which('openssl'):
+        return None
+    cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+         '-subj', '/CN=localhost', '-keyout', key, '-out', cert],
+        check=True, capture_output=True
+    )
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+async def per_request(url: str) -> None:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url, ssl=False) as response:
+            await response.read()
+
+
+async def run(fetch, url: str, requests: int, concurrent: bool) -> float:
+    """Return the mean time per request in milliseconds."""
+    started = time.perf_counter()
+    if concurrent:
+        semaphore = asyncio.Semaphore(CONCURRENCY)
+
+        async def one():
+            async with semaphore:
+                await fetch(url)
+        await asyncio.gather(*(one() for _ in range(requests)))
+    else:
+        for _ in range(requests):
+            await fetch(url)
+    return (time.perf_counter() - started) / requests * 1000
+
+
+async def main(requests: int) -> None:
+    app = web.Application()
+    app.router.add_get('/', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+
+    with tempfile.TemporaryDirectory() as directory:
+        targets = []
+        context = make_certificate(directory)
+        if context is not None:
+            port = free_port()
+            await web.TCPSite(runner, 'localhost', port, ssl_context=context).start()
+            targets.append(('https', f"https://localhost:{port}/"))
+        else:
+            print("openssl not found, skipping HTTPS")
+        port = free_port()
+        await web.TCPSite(runner, 'localhost', port).start()
+        targets.append(('http', f"http://localhost:{port}/"))
+
+        for scheme, url in targets:
+            client = HTTPClient()
+
+            async def shared(url: str) -> None:
+                session = await client.get_session()
+                async with session.get(url, ssl=False) as response:
+                    await response.read()
+
+            for concurrent in (False, True):
+                mode = f"{CONCURRENCY} in flight" if concurrent else "sequential"
+                before = await run(per_request, url, requests, concurrent)
+                after = await run(shared, url, requests, concurrent)
+                print(f"{scheme:5} {mode:12}: session per request {before:.2f} ms/req, shared session {after:.2f} ms/req")
+            await client.close()
+    await runner.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=300, help="Requests per measurement")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main(args.requests))
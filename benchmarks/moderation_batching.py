@@ -0,0 +1,119 @@
+"""
+Benchmark cross-message batching of text moderation.
+
+Starts a local stand-in for the moderation endpoint that takes --latency-ms
+per request and serves at most --server-concurrency requests at a time, then
+moderates --messages texts through ContentModerator.moderate_content with
+batching off and on, at the moderation queue's default concurrency of 3 and
+at 32 messages in flight. Every 50th text is flagged by the stand-in, so the
+script also checks that each caller got its own verdict.
+
+The real OpenAI client is used with its base URL pointed at the stand-in, so
+no API key or network access is needed.
+
+Usage (from the repository root):
+    python benchmarks/moderation_batching.py [--messages 400] [--latency-ms 40]
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+from openai import AsyncOpenAI
+
+from app.ai.service.moderation import ContentModerator
+
+FLAGGED_WORD = 'idiot'
+
+
+class StandInServer:
+    """Moderation endpoint answering one result per input with a fixed latency."""
+
+    def __init__(self, latency: float, concurrency: int):
+        self.latency = latency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.requests = 0
+
+    async def moderations(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        inputs = body['input'] if isinstance(body['input'], list) else [body['input']]
+        async with self.semaphore:
+            self.requests += 1
+            await asyncio.sleep(self.latency)
+
+        results = []
+        for item in inputs:
+            text = item if isinstance(item, str) else item.get('text', '')
+            flagged = FLAGGED_WORD in text
+            results.append({
+                'flagged': flagged,
+                'categories': {'harassment': flagged},
+                'category_scores': {'harassment': 0.9 if flagged else 0.01},
+                'category_applied_input_types': {'harassment': ['text'] if flagged else []}
+            })
+        return web.json_response({'id': 'modr-benchmark', 'model': body['model'], 'results': results})
+
+
+def free_port() -> int:
+    """Return a TCP port that is free on localhost."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def run(server: StandInServer, client: AsyncOpenAI, batch: bool, messages: int, in_flight: int) -> None:
+    moderator = ContentModerator(client, batch_texts=batch)
+    texts = [f"message {i} " + (f"you {FLAGGED_WORD}" if i % 50 == 0 else "hello") for i in range(messages)]
+    queue = asyncio.Queue()
+    for text in texts:
+        queue.put_nowait(text)
+    wrong = 0
+
+    async def worker():
+        nonlocal wrong
+        while not queue.empty():
+            text = queue.get_nowait()
+            flagged, _ = await moderator.moderate_content(text, [])
+            if flagged != (FLAGGED_WORD in text):
+                wrong += 1
+
+    server.requests = 0
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(in_flight)))
+    elapsed = time.perf_counter() - started
+    print(
+        f"{in_flight:>2} in flight, batching {'on ' if batch else 'off'}: {messages / elapsed:.0f} msg/s, "
+        f"{server.requests} requests, {wrong} wrong verdicts"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    server = StandInServer(args.latency_ms / 1000, args.server_concurrency)
+    app = web.Application()
+    app.router.add_post('/v1/moderations', server.moderations)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    port = free_port()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+
+    client = AsyncOpenAI(api_key='benchmark', base_url=f"http://127.0.0.1:{port}/v1", max_retries=0)
+    for in_flight in (3, 32):
+        for batch in (False, True):
+            await run(server, client, batch, args.messages, in_flight)
+    await client.close()
+    await runner.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=400, help="Messages per measurement")
+    parser.add_argument('--latency-ms', type=float, default=40, help="Stand-in server latency per request")
+    parser.add_argument('--server-concurrency', type=int, default=4, help="Requests the stand-in serves at once")
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main(parser.parse_args()))
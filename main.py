@@ -37,7 +37,7 @@ from app.config import (
     MODERATION_QUEUE_ENABLED, MODERATION_QUEUE_MAX_CONCURRENT,
     DB_ROOT, WELCOMED_MEMBERS_DB_PATH, INVITE_DB_PATH, QUESTION_DB_PATH,
     HISTORY_PROMPT_TEMPLATE, RANDOM_PROMPT_TEMPLATE, NO_HISTORY_PROMPT_TEMPLATE,
-    URL_SAFETY_CHECK_ENABLED
+    URL_SAFETY_CHECK_ENABLED, URL_SAFETY_NEW_MEMBER_DAYS
 )
 from app.ai_handler import AIHandler
 from pydantic import ValidationError
@@ -45,6 +45,7 @@ from app.welcomed_members_db import WelcomedMembersDB
 from app.invite_manager import InviteManager
 from app.question_manager import QuestionManager, QuestionView, FAQResponseView
 from app.mute_manager import MuteManager
+from app.ai.service.url_extractor import MessageURLAnalysis
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -79,6 +80,7 @@ invite_manager = None
 notion_faq = None
 mute_manager = None  # Added for mute management
 question_manager = None  # Add this line to fix the error
+url_safety_checker = None  # Process-wide URL safety engine, created in on_ready
 
 # Dictionary to track users who have been recently punished
 # Keys are user IDs, values are expiration timestamps
@@ -248,6 +250,14 @@ Servers connected: {len(bot.guilds)}
     # Check for expired mutes
     bot.loop.create_task(check_expired_mutes())
 
+    # Initialize the shared URL safety engine once (on_ready can fire again after reconnects)
+    global url_safety_checker
+    if URL_SAFETY_CHECK_ENABLED and url_safety_checker is None:
+        from app.ai.service.url_safety import URLSafetyChecker
+        url_safety_checker = URLSafetyChecker()
+        url_safety_checker.on_retroactive_unsafe = enforce_retroactive_url_verdict
+        await url_safety_checker.start()
+
     # Start the moderation queue if enabled
     if MODERATION_QUEUE_ENABLED:
         from app.services.moderation_queue import start_moderation_queue
@@ -458,9 +468,14 @@ async def on_message(message):
     if message.author == bot.user:
         return
     
+    # 訊息中的URL只提取一次，之後的即時檢查與審核共用同一結果
+    url_analysis = None
+    if URL_SAFETY_CHECK_ENABLED and not message.author.bot:
+        url_analysis = MessageURLAnalysis(message.content)
+    
     # 即時檢查URLs（在所有其他處理之前）
-    if URL_SAFETY_CHECK_ENABLED and not message.author.bot and message.content.strip():
-        detected = await check_urls_immediately(message)
+    if url_analysis and url_analysis.has_urls:
+        detected = await check_urls_immediately(message, url_analysis)
         if detected:
             # 如果檢測到黑名單URL並已處理，則跳過後續處理
             return
@@ -473,9 +488,9 @@ async def on_message(message):
         # 使用審核隊列處理消息
         if MODERATION_QUEUE_ENABLED:
             from app.services.moderation_queue import moderation_queue
-            await moderate_message_queue(message)
+            await moderate_message_queue(message, url_analysis=url_analysis)
         else:
-            await moderate_message(message)
+            await moderate_message(message, url_analysis=url_analysis)
 
     # Ignore messages with command prefixes, regardless of case
     if message.content and message.content.lower().startswith(IGNORED_PREFIXES):
@@ -576,9 +591,14 @@ async def on_message_edit(before, after):
     if after.author == bot.user:
         return
     
+    # 訊息中的URL只提取一次，之後的即時檢查與審核共用同一結果
+    url_analysis = None
+    if URL_SAFETY_CHECK_ENABLED and not after.author.bot:
+        url_analysis = MessageURLAnalysis(after.content)
+    
     # 即時檢查URLs（在所有其他處理之前）
-    if URL_SAFETY_CHECK_ENABLED and not after.author.bot and after.content.strip():
-        detected = await check_urls_immediately(after)
+    if url_analysis and url_analysis.has_urls:
+        detected = await check_urls_immediately(after, url_analysis)
         if detected:
             # 如果檢測到黑名單URL並已處理，則跳過後續處理
             return
@@ -588,9 +608,9 @@ async def on_message_edit(before, after):
         # 使用審核隊列處理編輯後的消息
         if MODERATION_QUEUE_ENABLED:
             from app.services.moderation_queue import moderation_queue
-            await moderate_message_queue(after, is_edit=True)
+            await moderate_message_queue(after, is_edit=True, url_analysis=url_analysis)
         else:
-            await moderate_message(after, is_edit=True)
+            await moderate_message(after, is_edit=True, url_analysis=url_analysis)
     
     # If the edited message mentions the bot, update response
     if bot.user.mentioned_in(after) and before.content != after.content:
@@ -965,6 +985,53 @@ async def delete_invite(interaction: discord.Interaction, invite_code: str):
         print(f"刪除邀請連結時發生錯誤: {str(e)}")
         await interaction.response.send_message("❌ 刪除邀請連結時發生錯誤", ephemeral=True)
 
+@bot.tree.command(name="moderation_cache", description="查看審核結果快取與本地預分類的統計，或在社群規範變更後清除快取")
+async def moderation_cache(interaction: discord.Interaction, clear: bool = False):
+    """查看或清除審核結果快取
+    
+    參數:
+        clear: 是否清除所有快取的審核與複查結果（社群規範或複查提示變更後使用）
+    """
+    if not interaction.user.guild_permissions.manage_guild:
+        await interaction.response.send_message("❌ 你沒有權限管理審核快取，需要 `manage_guild` 權限", ephemeral=True)
+        return
+
+    from app.ai.service.moderation import get_content_moderator
+    moderator = get_content_moderator()
+    verdict_cache = moderator.verdict_cache
+    message = "📊 內容審核統計\n\n"
+    if verdict_cache:
+        dropped = verdict_cache.invalidate() if clear else None
+        stats = verdict_cache.stats()
+        for name, label in (('moderations', '審核結果'), ('reviews', '複查結果')):
+            cache_stats = stats[name]
+            message += (
+                f"**{label}**：{cache_stats['size']}/{cache_stats['max_entries']} 筆，"
+                f"命中 {cache_stats['hits']} 次、未命中 {cache_stats['misses']} 次"
+                f"（命中率 {cache_stats['hit_rate']:.1%}）\n"
+            )
+        if dropped is not None:
+            message += f"✅ 已清除 {dropped} 筆快取結果\n"
+    else:
+        message += "審核結果快取未啟用\n"
+    
+    if moderator.preclassifier:
+        stats = moderator.preclassifier.stats()
+        agreement = f"{stats['agreement_rate']:.1%}" if stats['agreement_rate'] is not None else "尚無資料"
+        message += (
+            f"\n**本地預分類**：檢查 {stats['checked']} 則，略過 API {stats['skipped']} 則"
+            f"（略過率 {stats['skip_rate']:.1%}），抽查 {stats['shadow_checks']} 則與 API 一致率 {agreement}\n"
+        )
+    
+    if moderator.image_cache:
+        stats = moderator.image_cache.stats()
+        message += (
+            f"\n**圖片審核快取**：{stats['size']} 筆，命中 {stats['hits']} 次（其中近似圖片 {stats['near_duplicate_hits']} 次）、"
+            f"封鎖 {stats['blocked_hits']} 次、未命中 {stats['misses']} 次（命中率 {stats['hit_rate']:.1%}），"
+            f"封鎖清單 {stats['blocked']} 筆\n"
+        )
+    await interaction.response.send_message(message, ephemeral=True)
+
 async def check_auto_resolve_faqs():
     """Periodically check and auto-resolve FAQ questions"""
     await bot.wait_until_ready()
@@ -1011,7 +1078,7 @@ async def check_expired_mutes():
         # Check every minute
         await asyncio.sleep(60)
 
-async def moderate_message_queue(message, is_edit=False):
+async def moderate_message_queue(message, is_edit=False, url_analysis=None):
     """Add message to moderation queue for processing"""
     if message.author.bot:
         return  # Skip bot messages
@@ -1022,7 +1089,8 @@ async def moderate_message_queue(message, is_edit=False):
     # Prepare task data
     task_data = {
         "message": message,
-        "is_edit": is_edit
+        "is_edit": is_edit,
+        "url_analysis": url_analysis
     }
     
     # Add task to the queue
@@ -1032,7 +1100,7 @@ async def moderate_message_queue(message, is_edit=False):
         task_id=f"mod_{message.id}_{int(time.time())}"
     )
 
-async def moderate_message(message, is_edit=False):
+async def moderate_message(message, is_edit=False, url_analysis=None):
     """
     Moderate message content using OpenAI's moderation API.
     If content is flagged, delete the message, notify the user, and apply appropriate muting.
@@ -1040,6 +1108,7 @@ async def moderate_message(message, is_edit=False):
     Args:
         message: The Discord message to moderate
         is_edit: Whether this is an edited message
+        url_analysis: URLs already extracted from the message (MessageURLAnalysis), if any
     """
     # Ignore messages from the bot itself
     if message.author == bot.user:
@@ -1061,15 +1130,20 @@ async def moderate_message(message, is_edit=False):
     
     # Check for URLs if enabled
     url_check_result = None
-    if URL_SAFETY_CHECK_ENABLED and text:
-        from app.ai.service.url_safety import URLSafetyChecker
+    if URL_SAFETY_CHECK_ENABLED and text and url_safety_checker:
         try:
-            url_checker = URLSafetyChecker()
-            urls = await url_checker.extract_urls(text)
+            url_checker = url_safety_checker
+            urls = url_analysis.urls if url_analysis else await url_checker.extract_urls(text)
             
             if urls:
                 logger.info(f"Checking {len(urls)} URLs in message from {author.name}")
-                is_unsafe, url_results = await url_checker.check_urls(urls)
+                # 新成員的連結優先使用 VirusTotal 配額
+                from app.ai.service.virustotal_scheduler import PRIORITY_HIGH, PRIORITY_NORMAL
+                joined_at = getattr(author, 'joined_at', None)
+                is_new_member = joined_at and datetime.now(timezone.utc) - joined_at < timedelta(days=URL_SAFETY_NEW_MEMBER_DAYS)
+                is_unsafe, url_results = await url_checker.check_urls(
+                    urls, priority=PRIORITY_HIGH if is_new_member else PRIORITY_NORMAL
+                )
                 
                 # Log the detailed results for each URL
                 for url, result in url_results.items():
@@ -1101,6 +1175,9 @@ async def moderate_message(message, is_edit=False):
                                     f"威脅類型: {threat_types_text} | 嚴重度: {severity}" + 
                                     (f" | 原因: {reason}" if reason else "")
                                 )
+                        elif result.get('pending'):
+                            # VirusTotal 配額不足或分析尚未完成，尚無判定
+                            logger.info(f"URL安全檢查結果: {url} | 待定 | {result.get('message', '')}")
                         else:
                             # 對於安全URL，記錄更簡潔的信息
                             message_text = result.get('message', '安全')
@@ -1113,6 +1190,15 @@ async def moderate_message(message, is_edit=False):
                         except:
                             logger.info("URL安全檢查結果記錄失敗")
                 
+                # 仍在 VirusTotal 分析中的URL：記錄此消息，分析完成後若為不安全再追溯處理
+                url_checker.watch_pending(
+                    url_results,
+                    message.guild.id if message.guild else None,
+                    message.channel.id,
+                    message.id,
+                    author.id
+                )
+                
                 if is_unsafe:
                     # One or more URLs are unsafe
                     unsafe_urls = [url for url, result in url_results.items() if result.get('is_unsafe')]
@@ -1182,9 +1268,9 @@ async def moderate_message(message, is_edit=False):
         except Exception as e:
             logger.error(f"URL安全檢查錯誤: {str(e)}")
 
-    # Initialize the content moderator for text and images
-    from app.ai.service.moderation import ContentModerator
-    moderator = ContentModerator()
+    # Shared content moderator for text and images, so concurrent messages share batched requests
+    from app.ai.service.moderation import get_content_moderator
+    moderator = get_content_moderator()
     
     # Collect all content for moderation
     image_urls = []
@@ -1241,7 +1327,16 @@ async def moderate_message(message, is_edit=False):
             
             # If review is enabled and this is not a URL safety issue, check if the flagged content is a false positive
             review_result = None
-            if MODERATION_REVIEW_ENABLED and text and not (url_check_result and url_check_result.get('is_unsafe')):
+            verdict_cache = moderator.verdict_cache
+            if MODERATION_REVIEW_ENABLED and text and not (url_check_result and url_check_result.get('is_unsafe')) and verdict_cache:
+                # 重複的內容（洗版、複製文）直接沿用之前的複查結果
+                review_result = verdict_cache.get_review(text, violation_categories)
+                if review_result:
+                    print(f"[審核系統] 用戶 {author.name} 的訊息與先前內容相同，沿用複查結果: {'非違規(誤判)' if not review_result['is_violation'] else '確認違規'}")
+                    if not review_result["is_violation"]:
+                        return
+            
+            if MODERATION_REVIEW_ENABLED and text and not (url_check_result and url_check_result.get('is_unsafe')) and not review_result:
                 from app.ai.agents.moderation_review import review_flagged_content
                 from app.ai.ai_select import create_moderation_review_agent
                 
@@ -1280,6 +1375,8 @@ async def moderate_message(message, is_edit=False):
                         context=context,
                         backup_agent=backup_review_agent
                     )
+                    if verdict_cache:
+                        verdict_cache.set_review(text, violation_categories, review_result)
                     
                     print(f"[審核系統] 用戶 {author.name} 的訊息審核結果: {'非違規(誤判)' if not review_result['is_violation'] else '確認違規'}")
                     
@@ -1333,6 +1430,15 @@ async def moderate_message(message, is_edit=False):
                 print(f"[審核系統] 刪除消息失敗: {str(e)}")
                 return
             
+            # 確認違規後才計入圖片的違規次數，重複違規的圖片才加入封鎖清單
+            if moderator.image_cache:
+                for image_result in results.get("image_results", []):
+                    image_details = image_result.get("result") or {}
+                    if image_result.get("image_key") and image_details.get("flagged") and not image_details.get("blocked"):
+                        image_categories = [category for category, is_violated in image_details.get("categories", {}).items() if is_violated]
+                        if moderator.image_cache.record_violation(image_result["image_key"], image_categories):
+                            print(f"[審核系統] 圖片多次確認違規，已加入封鎖清單，用戶: {author.name}")
+            
             # Check if user was recently punished - if so, just delete the message without additional notification
             current_time = time.time()
             user_id = author.id
@@ -1621,13 +1727,15 @@ async def safe_delete_message(message, reason=None):
     logger.error(f"在 {DELETE_MESSAGE_MAX_RETRIES} 次嘗試後仍無法刪除消息")
     return False
 
-async def check_urls_immediately(message):
+async def check_urls_immediately(message, url_analysis=None, known_unsafe=None):
     """
-    即時檢查消息中的URLs是否在黑名單中，如果是則立即刪除消息並進行處罰。
+    即時檢查消息中的URLs是否在黑名單中或為仿冒網域，如果是則立即刪除消息並進行處罰。
     此檢查在任何其他處理之前執行，以確保危險URLs立即被刪除。
     
     Args:
         message: Discord消息對象
+        url_analysis: 已提取的URLs（MessageURLAnalysis），未提供時重新提取
+        known_unsafe: 已判定為不安全的URL與其檢查結果（追溯處理時傳入），未啟用黑名單時也會處理
     
     Returns:
         bool: 如果檢測到黑名單URL並已處理，則返回True
@@ -1637,31 +1745,46 @@ async def check_urls_immediately(message):
         return False
         
     try:
-        # 初始化URL安全檢查器
-        from app.ai.service.url_safety import URLSafetyChecker
-        url_checker = URLSafetyChecker()
+        # 使用共享的URL安全檢查器（在 on_ready 中初始化）
+        url_checker = url_safety_checker
         
-        # 無需創建URL檢查器，如果黑名單功能未啟用
-        if not url_checker.blacklist_enabled or not url_checker.blacklist:
+        # 如果檢查器尚未初始化，或黑名單與仿冒網域偵測都未啟用且沒有已知的不安全URL，則跳過
+        if not url_checker or not (url_checker.blacklist or url_checker.impersonation_detector or known_unsafe):
             return False
             
-        # 提取URLs
-        urls = await url_checker.extract_urls(message.content.strip())
-        if not urls:
+        # 提取URLs（優先使用 on_message 已提取的結果）
+        urls = url_analysis.urls if url_analysis else await url_checker.extract_urls(message.content.strip())
+        if not urls and not known_unsafe:
             return False
             
         # 只檢查URLs是否在黑名單中（即時檢查）
         blacklisted_urls = []
         blacklist_results = {}
         
-        # 優化：批量檢查URL（減少鎖競爭）
-        with url_checker.blacklist.lock:
+        # 背景分析已判定不安全的URL直接處理，不依賴黑名單
+        for url, result in (known_unsafe or {}).items():
+            blacklisted_urls.append(url)
+            blacklist_results[url] = result
+        
+        # 黑名單的讀取路徑不需要鎖，查詢不會等待背景儲存或匯入
+        if url_checker.blacklist:
             for url in urls:
+                if url in blacklist_results:
+                    continue
                 blacklist_result = url_checker.blacklist.is_blacklisted(url)
                 if blacklist_result:
                     blacklisted_urls.append(url)
                     blacklist_results[url] = blacklist_result
         
+        # 本地仿冒網域偵測（不需要任何網路請求）：只有設定的仿冒關鍵字會立即攔截，
+        # 相似網域（同形字、拼寫變體、嵌入品牌名稱）也可能是合法網站，交由完整檢查優先送 VirusTotal 判定
+        for url in urls:
+            if url not in blacklist_results:
+                impersonation_result = url_checker.check_impersonation(url)
+                if impersonation_result and impersonation_result['explicit']:
+                    blacklisted_urls.append(url)
+                    blacklist_results[url] = impersonation_result
+        
         # 如果找到黑名單URLs，立即刪除消息
         if blacklisted_urls:
             # 優先刪除消息，再處理其他任務
@@ -1954,6 +2077,67 @@ async def check_urls_immediately(message):
         logger.error(f"URL黑名單即時檢查錯誤: {str(e)}")
         return False
 
+async def enforce_retroactive_url_verdict(url, result, watchers):
+    """
+    VirusTotal 背景分析判定URL不安全後，追溯處理當時包含此URL的消息。
+    重新取得消息後，連同此次的檢查結果交給 check_urls_immediately 刪除並處罰，
+    因此未啟用URL黑名單時同樣會處理。
+    
+    Args:
+        url: 被判定為不安全的URL
+        result: 檢查結果
+        watchers: 包含此URL的消息（guild_id、channel_id、message_id、author_id）
+    """
+    async def enforce(watcher):
+        channel = bot.get_channel(watcher['channel_id'])
+        if channel is None:
+            return
+        try:
+            message = await channel.fetch_message(watcher['message_id'])
+        except discord.NotFound:
+            # 消息已被刪除，無需處理
+            return
+        except Exception as e:
+            logger.error(f"追溯處理時無法取得消息 {watcher['message_id']}: {str(e)}")
+            return
+        if await check_urls_immediately(message, known_unsafe={url: result}):
+            logger.warning(f"已追溯處理用戶 {message.author.name} 包含不安全URL的消息: {url}")
+        else:
+            logger.info(f"未追溯處理用戶 {message.author.name} 的消息（具審核豁免權限或處理失敗）: {url}")
+            
+    await asyncio.gather(*(enforce(watcher) for watcher in watchers))
+
+async def shutdown_services():
+    """Flush and close long-lived services before the event loop stops."""
+    global url_safety_checker
+    if url_safety_checker:
+        try:
+            await url_safety_checker.close()
+        except Exception as e:
+            logger.error(f"Error closing URL safety checker: {str(e)}")
+        url_safety_checker = None
+    
+    from app.ai.service.moderation import close_content_moderator
+    try:
+        close_content_moderator()
+    except Exception as e:
+        logger.error(f"Error closing content moderator: {str(e)}")
+        
+    # Close the pooled HTTP session last, after every service that uses it
+    from app.services.http_client import close_http_client
+    try:
+        await close_http_client()
+    except Exception as e:
+        logger.error(f"Error closing shared HTTP session: {str(e)}")
+
+async def run_bot():
+    """Run the bot and make sure shared services are closed on exit."""
+    try:
+        async with bot:
+            await bot.start(DISCORD_TOKEN)
+    finally:
+        await shutdown_services()
+
 def main():
     """Main entry point for the Discord bot"""
     try:
@@ -1964,7 +2148,9 @@ def main():
         os.makedirs(os.path.join(DB_ROOT, 'invites'), exist_ok=True)
         
         # Start the bot
-        bot.run(DISCORD_TOKEN, log_handler=None)
+        asyncio.run(run_bot())
+    except KeyboardInterrupt:
+        logger.info("Bot stopped by user")
     except Exception as e:
         logger.critical(f"Failed to start the bot: {str(e)}")
         traceback.print_exc()